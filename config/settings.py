@@ -4,6 +4,7 @@ Django settings for config project.
 """
 
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 from dotenv import load_dotenv
@@ -49,19 +50,24 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Cuenta consultas y tiempos por petición (header Server-Timing)
+    'tracker.middleware.QueryTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Perfila con cProfile una muestra de las peticiones (ver PROFILING)
+    'tracker.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de renderizado para Server-Timing
+        'BACKEND': 'tracker.templating.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -89,6 +95,63 @@ DATABASES = {
 }
 
 
+# Presupuesto de consultas SQL por vista (nombre de URL). Las peticiones que lo superan
+# se registran en el logger 'tracker.performance' con las consultas más repetidas.
+QUERY_BUDGETS = {
+    'index': 15,
+    'transaction_list': 10,
+    'transaction_list_more': 10,
+    'reports': 5,
+    'dashboard_totals': 5,
+    'dashboard_categories': 5,
+    'dashboard_budgets': 5,
+    'dashboard_cards': 5,
+    'reports_series': 5,
+    'reports_balances': 5,
+    'forecast': 5,
+    # Sesión, usuario, cuentas, fijos, tarjetas y reglas (o su versión, si ya están compiladas)
+    'forecast_data': 6,
+}
+QUERY_BUDGET_DEFAULT = 50
+
+# Perfilado de peticiones con cProfile. Los archivos .pstats se resumen con:
+#   python manage.py profile_summary
+# El staff puede perfilar una petición puntual con `?_profile=1` o el header `X-Spendly-Profile: 1`.
+PROFILING = {
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', '0')),
+    'DIR': Path(os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles')),
+    'MAX_BYTES': int(os.environ.get('PROFILING_MAX_MB', '50')) * 1024 * 1024,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'tracker.performance': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# La caché tiene que ser compartida por todos los procesos: los workers y también los
+# comandos (process_recurring, import_transactions, reconcile_balances, ...) invalidan
+# los cálculos del usuario incrementando su versión en la caché. Con la memoria de cada
+# proceso (LocMemCache) esas invalidaciones no llegarían a la web. Por defecto se usan
+# archivos (un solo servidor); con varios servidores, un backend compartido, por ejemplo:
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://localhost:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'spendly-cache')),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
 
 
 class TrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracker'
+
+    def ready(self):
+        from . import categorization, search
+        from .models import Category, CategoryRule, MonthlySummary
+        post_migrate.connect(search.ensure_installed, sender=self)
+        pre_delete.connect(MonthlySummary.category_deleted, sender=Category)
+        post_save.connect(categorization.rules_changed, sender=CategoryRule)
+        post_delete.connect(categorization.rules_changed, sender=CategoryRule)
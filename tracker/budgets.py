@@ -0,0 +1,201 @@
+"""
+Seguimiento incremental de presupuestos.
+
+Cada presupuesto tiene períodos (BudgetPeriod) con un contador de lo gastado. Cada
+escritura de transacciones llama a apply() con los cambios (alta = +1, baja = -1, una
+edición es la baja de la versión anterior más el alta de la nueva) y solo se tocan los
+períodos afectados. Al cruzar el 80% o el 100% del límite se registra un BudgetAlert
+en ese mismo momento. Leer el progreso cuesta una consulta por tabla, sin importar
+cuántas transacciones tenga el usuario.
+
+Un período se abre con la primera escritura que lo afecta (o al crear el presupuesto):
+en ese momento se calcula lo ya gastado con una consulta indexada y, con `rollover`,
+se suma al límite lo que no se gastó en el período anterior.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Sum
+
+from .models import Budget, BudgetAlert, BudgetPeriod, Transaction
+
+# Umbrales (% del límite) que generan un aviso
+ALERT_THRESHOLDS = (80, 100)
+
+
+def _reached(spent, limit):
+    """Mayor umbral alcanzado por `spent` (0 si ninguno)."""
+    if limit <= 0:
+        return ALERT_THRESHOLDS[-1] if spent > 0 else 0
+    return max((threshold for threshold in ALERT_THRESHOLDS if spent * 100 >= limit * threshold), default=0)
+
+
+def _previous_start(budget, start):
+    return budget.period_bounds(start - datetime.timedelta(days=1))[0]
+
+
+def _carry(budget, previous):
+    # Lo no gastado del período anterior (nunca negativo)
+    if not budget.rollover or previous is None:
+        return Decimal('0.00')
+    return max(previous.limit - previous.spent, Decimal('0.00'))
+
+
+def _record_alerts(period, previous_level, level):
+    """Registra los avisos de los umbrales cruzados entre `previous_level` y `level`."""
+    BudgetAlert.objects.bulk_create(
+        [
+            BudgetAlert(user_id=period.budget.user_id, period=period, threshold=threshold, spent=period.spent)
+            for threshold in ALERT_THRESHOLDS
+            if previous_level < threshold <= level
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def open_period(budget, date):
+    """
+    Devuelve (período de `budget` que contiene a `date`, creado). Si no existía se
+    crea con lo ya gastado en la base, así que no hace falta sumarle la escritura actual.
+    """
+    start, end = budget.period_bounds(date)
+    period = BudgetPeriod.objects.filter(budget=budget, start=start).first()
+    if period is not None:
+        return period, False
+
+    spent = _period_spent(BudgetPeriod(budget=budget, start=start, end=end))
+    previous = BudgetPeriod.objects.filter(budget=budget, start=_previous_start(budget, start)).first()
+    limit = budget.amount + _carry(budget, previous)
+    try:
+        with db_transaction.atomic():
+            period = BudgetPeriod.objects.create(
+                budget=budget, start=start, end=end, limit=limit, spent=spent,
+                alert_level=_reached(spent, limit),
+            )
+    except IntegrityError:
+        # Otra petición lo abrió al mismo tiempo, también desde la base
+        return BudgetPeriod.objects.get(budget=budget, start=start), True
+    _record_alerts(period, 0, period.alert_level)
+    return period, True
+
+
+def apply(changes):
+    """
+    Actualiza los períodos afectados por `changes`: pares (transacción, signo) ya
+    guardados en la base. Solo cuentan los gastos con categoría presupuestada.
+    """
+    deltas = defaultdict(Decimal)
+    for transaction, sign in changes:
+        if transaction.type == 'gasto' and transaction.category_id:
+            deltas[(transaction.user_id, transaction.category_id, transaction.date)] += transaction.amount * sign
+    if not deltas:
+        return
+
+    user_ids = {user_id for user_id, _, _ in deltas}
+    category_ids = {category_id for _, category_id, _ in deltas}
+    budgets = {
+        (budget.user_id, budget.category_id): budget
+        for budget in Budget.objects.filter(user_id__in=user_ids, category_id__in=category_ids)
+    }
+
+    # Neto por (presupuesto, inicio del período)
+    per_period = defaultdict(Decimal)
+    for (user_id, category_id, date), amount in deltas.items():
+        budget = budgets.get((user_id, category_id))
+        if budget is not None:
+            per_period[(budget.pk, budget.period_bounds(date)[0])] += amount
+
+    by_pk = {budget.pk: budget for budget in budgets.values()}
+    for (budget_pk, start), amount in per_period.items():
+        if amount:
+            _add_spent(by_pk[budget_pk], start, amount)
+
+
+def apply_many(transactions, sign=1):
+    """Atajo de apply() para un lote del mismo signo."""
+    apply((transaction, sign) for transaction in transactions)
+
+
+def _add_spent(budget, start, amount):
+    with db_transaction.atomic():
+        # Se bloquea la fila del período: dos escrituras simultáneas no pierden avisos
+        period = BudgetPeriod.objects.select_for_update().filter(budget=budget, start=start).first()
+        if period is None:
+            open_period(budget, start)
+            return
+        period.budget = budget
+        previous_level = period.alert_level
+        period.spent += amount
+        period.alert_level = max(previous_level, _reached(period.spent, period.limit))
+        period.save(update_fields=['spent', 'alert_level'])
+        _record_alerts(period, previous_level, period.alert_level)
+
+
+def _period_spent(period):
+    return Transaction.objects.filter(
+        user_id=period.budget.user_id, category_id=period.budget.category_id, type='gasto',
+        date__gte=period.start, date__lte=period.end,
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+
+
+def rebuild(users=None, today=None):
+    """
+    Recalcula desde las transacciones lo gastado de los períodos existentes y abre el
+    período actual de los presupuestos que no lo tienen. Es para mantenimiento (una
+    consulta indexada por período); los avisos ya registrados no se tocan.
+    """
+    today = today or datetime.date.today()
+    periods = BudgetPeriod.objects.select_related('budget')
+    budget_list = Budget.objects.all()
+    if users is not None:
+        periods = periods.filter(budget__user__in=users)
+        budget_list = budget_list.filter(user__in=users)
+
+    changed = []
+    for period in periods.iterator():
+        spent = _period_spent(period)
+        if spent != period.spent:
+            period.spent = spent
+            changed.append(period)
+    BudgetPeriod.objects.bulk_update(changed, ['spent'], batch_size=1000)
+
+    for budget in budget_list:
+        open_period(budget, today)
+    return len(changed)
+
+
+def progress(budgets, periods, today):
+    """
+    Progreso de cada presupuesto en su período actual, a partir de los presupuestos
+    (con su categoría) y sus períodos del último año ya cargados.
+    """
+    by_budget = defaultdict(dict)
+    for period in periods:
+        by_budget[period.budget_id][period.start] = period
+
+    rows = []
+    for budget in budgets:
+        start, end = budget.period_bounds(today)
+        own = by_budget[budget.pk]
+        current = own.get(start)
+        if current is not None:
+            limit, spent = current.limit, current.spent
+        else:
+            # Sin escrituras desde que empezó el período: no hay gastos todavía
+            limit = budget.amount + _carry(budget, own.get(_previous_start(budget, start)))
+            spent = Decimal('0.00')
+        percentage = (spent / limit * 100) if limit > 0 else 0
+        rows.append({
+            'category_id': budget.category_id,
+            'category_name': budget.category.name,
+            'period': budget.get_period_display(),
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'limit': float(limit),
+            'spent': float(spent),
+            'percentage': float(min(percentage, 100)),
+            'over_limit': spent > limit,
+        })
+    return rows
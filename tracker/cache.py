@@ -0,0 +1,113 @@
+"""
+Caché de cálculos por usuario (dashboard, reportes, etc.).
+
+Cada usuario tiene un número de versión de sus datos guardado en la caché. Las claves
+de los cálculos incluyen esa versión, así que cualquier escritura solo tiene que
+incrementarla con bump_data_version() para que todo lo anterior deje de usarse
+(las entradas viejas expiran solas). Las versiones tienen que estar en una caché que
+vean todos los procesos (archivos en un solo servidor, Redis o Memcached en varios):
+los comandos también las incrementan y con LocMemCache la web no se enteraría.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+
+# Tiempo máximo (en segundos) que se guarda un cálculo, aunque la versión no cambie
+DEFAULT_TIMEOUT = 60 * 60
+
+
+def _version_key(user_id, scope='data'):
+    # `scope` separa versiones independientes (por ejemplo, 'rules' para las reglas de categorización)
+    if scope == 'data':
+        return f'spendly:user:{user_id}:version'
+    return f'spendly:user:{user_id}:{scope}:version'
+
+
+def _compute_key(user_id, version, name):
+    return f'spendly:user:{user_id}:v{version}:{name}'
+
+
+def _new_version():
+    # Si la versión se pierde (expulsada de la caché o reinicio) la nueva no puede
+    # coincidir con una anterior: se arranca desde el reloj en milisegundos
+    return int(time.time() * 1000)
+
+
+def data_version(user_id, scope='data'):
+    """Versión actual de los datos del usuario."""
+    key = _version_key(user_id, scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def adata_version(user_id, scope='data'):
+    """Versión async de data_version."""
+    key = _version_key(user_id, scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _new_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_data_version(*user_ids, scope='data'):
+    """Invalida todos los cálculos cacheados de los usuarios indicados."""
+    for user_id in set(user_ids):
+        try:
+            cache.incr(_version_key(user_id, scope))
+        except ValueError:
+            # La clave no existía: cualquier versión nueva sirve
+            cache.set(_version_key(user_id, scope), _new_version(), timeout=None)
+
+
+def content_version(*parts):
+    """Versión derivada del contenido: cambia solo si cambia alguna de las partes."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def get_or_compute(user_id, name, compute, timeout=DEFAULT_TIMEOUT, version=None):
+    """
+    Devuelve el cálculo `name` del usuario desde la caché, o lo calcula con
+    `compute()` y lo guarda para la versión actual de sus datos. Con `version`
+    (por ejemplo de content_version) la entrada depende solo de esa versión y no
+    se invalida con cada escritura del usuario.
+    """
+    if version is None:
+        version = data_version(user_id)
+    key = _compute_key(user_id, version, name)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout=timeout)
+    return value
+
+
+async def aget_or_compute(user_id, name, compute, timeout=DEFAULT_TIMEOUT, version=None):
+    """Versión async de get_or_compute: `compute` es una función async."""
+    if version is None:
+        version = await adata_version(user_id)
+    key = _compute_key(user_id, version, name)
+    value = await cache.aget(key)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value, timeout=timeout)
+    return value
+
+
+def invalidates_user_data(view):
+    """
+    Decorador para vistas que modifican datos: después de un POST incrementa la
+    versión de datos del usuario.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method == 'POST' and request.user.is_authenticated:
+            bump_data_version(request.user.pk)
+        return response
+    return wrapper
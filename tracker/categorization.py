@@ -0,0 +1,254 @@
+"""
+Categorización automática de transacciones con las reglas del usuario (CategoryRule).
+
+Las reglas de un usuario se compilan una sola vez en un RuleMatcher:
+
+- Las reglas de palabra clave se unen en una sola expresión regular por rango de montos,
+  con una alternativa por regla en orden de prioridad. Una pasada sobre la descripción
+  (normalizada: minúsculas y sin acentos) encuentra en cada posición la regla de mayor
+  prioridad, sin probar las reglas una por una.
+- Las expresiones regulares se compilan por separado (pueden tener sus propios grupos)
+  y solo se prueban las de mayor prioridad que la mejor palabra clave encontrada.
+
+Los matchers compilados se guardan en memoria de cada proceso junto con la versión de
+las reglas del usuario, que sale de la base: cantidad de reglas y última modificación
+(CategoryRule.updated_at). Antes de usarlos se compara con la versión actual (una
+consulta agrupada para todos los usuarios pedidos), así un cambio hecho desde otro
+proceso o servidor se ve aunque la caché no sea compartida.
+Para aplicar las reglas al historial: python manage.py recategorize
+"""
+import copy
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+from django.db import transaction as db_transaction
+from django.db.models import Count, Max, Q
+
+from . import budgets, ledger
+from .cache import bump_data_version
+from .models import Account, CategoryRule, MonthlySummary, Transaction
+
+# Versión de caché de las reglas, para los resultados cacheados que dependen de ellas
+# (la proyección); las reglas compiladas se validan contra la base
+RULES_SCOPE = 'rules'
+
+# Cantidad de usuarios con reglas compiladas en memoria por proceso
+MAX_COMPILED_USERS = 256
+
+# Transacciones por lote al recategorizar el historial
+DEFAULT_CHUNK_SIZE = 5000
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def normalize(text):
+    """Minúsculas y sin acentos, para comparar palabras clave."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def _in_range(amount, amount_min, amount_max):
+    return (amount_min is None or amount >= amount_min) and (amount_max is None or amount <= amount_max)
+
+
+class RuleMatcher:
+    """Reglas de un usuario compiladas para evaluarlas rápido sobre muchas transacciones."""
+
+    def __init__(self, rules):
+        # Las reglas llegan ordenadas por prioridad: el índice en la lista es el orden
+        self.rules = list(rules)
+        keywords = defaultdict(list)
+        catch_all = {}
+        self.regexes = []
+        for index, rule in enumerate(self.rules):
+            amount_range = (rule.amount_min, rule.amount_max)
+            if not rule.pattern:
+                # Sin texto: cualquier descripción, solo cuenta el rango de montos
+                catch_all.setdefault(amount_range, index)
+            elif rule.match_type == 'regex':
+                self.regexes.append((index, re.compile(rule.pattern, re.IGNORECASE), amount_range))
+            else:
+                keywords[amount_range].append(index)
+
+        # Por rango de montos: (rango, expresión combinada o None, regla sin texto o None)
+        self.buckets = []
+        for amount_range in keywords.keys() | catch_all.keys():
+            indexes = keywords.get(amount_range)
+            combined = None
+            if indexes:
+                # Lookahead: se prueba cada posición sin consumir texto, así una palabra
+                # clave dentro de otra también se encuentra
+                combined = re.compile('(?=(?:{}))'.format('|'.join(
+                    f'(?P<r{index}>{re.escape(normalize(self.rules[index].pattern))})'
+                    for index in indexes
+                )))
+            self.buckets.append((amount_range, combined, catch_all.get(amount_range)))
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, description, amount):
+        """Regla de mayor prioridad que coincide, o None."""
+        best = len(self.rules)
+        text = None
+        for amount_range, combined, catch_all in self.buckets:
+            if not _in_range(amount, *amount_range):
+                continue
+            if catch_all is not None:
+                best = min(best, catch_all)
+            if combined is not None:
+                text = normalize(description) if text is None else text
+                for found in combined.finditer(text):
+                    best = min(best, int(found.lastgroup[1:]))
+
+        for index, pattern, amount_range in self.regexes:
+            if index >= best:
+                break
+            if _in_range(amount, *amount_range) and pattern.search(description or ''):
+                best = index
+                break
+
+        return self.rules[best] if best < len(self.rules) else None
+
+    def apply(self, transaction):
+        """
+        Completa la categoría y la cuenta vacías de `transaction` con la regla que
+        coincida. Devuelve True si cambió algo.
+        """
+        if transaction.category_id and transaction.cuenta_id:
+            return False
+        rule = self.match(transaction.description, transaction.amount)
+        if rule is None:
+            return False
+        changed = False
+        if not transaction.category_id and rule.category_id:
+            transaction.category_id = rule.category_id
+            changed = True
+        if not transaction.cuenta_id and rule.cuenta_id:
+            transaction.cuenta_id = rule.cuenta_id
+            changed = True
+        return changed
+
+
+def _rules_version(rules):
+    """Versión de una lista de reglas: (cantidad, última modificación)."""
+    return len(rules), max((rule.updated_at for rule in rules), default=None)
+
+
+def _current_versions(user_ids):
+    # Una consulta agrupada con la versión de cada usuario (sin reglas: (0, None))
+    versions = dict.fromkeys(user_ids, (0, None))
+    rows = CategoryRule.objects.filter(user_id__in=user_ids).order_by() \
+        .values('user_id').annotate(count=Count('id'), updated=Max('updated_at'))
+    versions.update((row['user_id'], (row['count'], row['updated'])) for row in rows)
+    return versions
+
+
+def matchers_for(user_ids):
+    """
+    Reglas compiladas de varios usuarios: las que no cambiaron en la base salen de la
+    memoria del proceso y las demás se leen juntas en una sola consulta.
+    """
+    user_ids = set(user_ids)
+    with _compiled_lock:
+        compiled = {user_id: _compiled[user_id] for user_id in user_ids if user_id in _compiled}
+
+    matchers = {}
+    if compiled:
+        versions = _current_versions(list(compiled))
+        with _compiled_lock:
+            for user_id, (version, matcher) in compiled.items():
+                if versions[user_id] == version:
+                    if user_id in _compiled:
+                        _compiled.move_to_end(user_id)
+                    matchers[user_id] = matcher
+
+    missing = [user_id for user_id in user_ids if user_id not in matchers]
+    if missing:
+        rules = defaultdict(list)
+        for rule in CategoryRule.objects.filter(user_id__in=missing).order_by('priority', 'id'):
+            rules[rule.user_id].append(rule)
+        with _compiled_lock:
+            for user_id in missing:
+                matchers[user_id] = RuleMatcher(rules[user_id])
+                # La versión sale de las mismas filas que se compilaron
+                _compiled[user_id] = (_rules_version(rules[user_id]), matchers[user_id])
+                _compiled.move_to_end(user_id)
+            while len(_compiled) > MAX_COMPILED_USERS:
+                _compiled.popitem(last=False)
+    return matchers
+
+
+def matcher_for(user_id):
+    """Reglas compiladas del usuario (desde la memoria del proceso si no cambiaron)."""
+    return matchers_for([user_id])[user_id]
+
+
+def categorize(transactions):
+    """Aplica las reglas de cada usuario a un lote de transacciones sin guardar. Devuelve las que cambiaron."""
+    matchers = matchers_for(t.user_id for t in transactions)
+    return [t for t in transactions if matchers[t.user_id].apply(t)]
+
+
+def recategorize(user_id, chunk_size=DEFAULT_CHUNK_SIZE, overwrite=False, dry_run=False):
+    """
+    Aplica las reglas actuales al historial del usuario, de a `chunk_size` transacciones
+    (paginando por id, sin cargar todo el historial). Sin `overwrite` solo se revisan
+    las que no tienen categoría o cuenta; con `overwrite` también se reemplaza la
+    categoría de las que coinciden con una regla. Devuelve (revisadas, modificadas).
+    """
+    matcher = matcher_for(user_id)
+    if not matcher:
+        return 0, 0
+
+    transactions = Transaction.objects.filter(user_id=user_id) \
+        .only('id', 'user_id', 'type', 'amount', 'description', 'date', 'category_id', 'cuenta_id') \
+        .order_by('id')
+    if not overwrite:
+        transactions = transactions.filter(Q(category__isnull=True) | Q(cuenta__isnull=True))
+
+    scanned = modified = 0
+    last_id = 0
+    while True:
+        chunk = list(transactions.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].pk
+        scanned += len(chunk)
+
+        changed, originals = [], []
+        for transaction in chunk:
+            original = copy.copy(transaction)
+            if overwrite:
+                transaction.category_id = None
+            matcher.apply(transaction)
+            if transaction.category_id is None:
+                # Sin regla con categoría: se conserva la que tenía
+                transaction.category_id = original.category_id
+            if (transaction.category_id, transaction.cuenta_id) != (original.category_id, original.cuenta_id):
+                changed.append(transaction)
+                originals.append(original)
+
+        if changed and not dry_run:
+            with db_transaction.atomic():
+                Transaction.objects.bulk_update(changed, ['category', 'cuenta'])
+                # Los acumulados se mueven de categoría; el saldo solo cambia en las que ganaron cuenta
+                MonthlySummary.apply_many(originals, sign=-1)
+                MonthlySummary.apply_many(changed)
+                budgets.apply([(o, -1) for o in originals] + [(t, 1) for t in changed])
+                moved = [(t, o) for t, o in zip(changed, originals) if t.cuenta_id != o.cuenta_id]
+                Account.apply_many([t for t, _ in moved])
+                ledger.apply([(o, -1) for _, o in moved] + [(t, 1) for t, _ in moved])
+        modified += len(changed)
+
+    if modified and not dry_run:
+        bump_data_version(user_id)
+    return scanned, modified
+
+
+def rules_changed(sender, instance, **kwargs):
+    """post_save / post_delete de CategoryRule: vence lo cacheado que depende de las reglas."""
+    bump_data_version(instance.user_id, scope=RULES_SCOPE)
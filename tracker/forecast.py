@@ -0,0 +1,175 @@
+"""
+Proyección del flujo de caja a partir de los ingresos/gastos fijos y las tarjetas.
+
+Para los próximos N meses se expanden todos los fijos del usuario (desde su próximo
+vencimiento, así no se cuenta lo que ya generó process_recurring) y los pagos de las
+tarjetas en su día de vencimiento. Cada movimiento va a la cuenta que le asignarían
+las reglas de categorización (como a las transacciones que se generan de verdad);
+los que no tienen cuenta, como los pagos de tarjeta, quedan en "Sin cuenta asignada"
+y solo cuentan para el total.
+
+Las ocurrencias se calculan como días desde hoy con aritmética entera (una tabla de
+meses para los fijos mensuales), se suman en un vector de netos diarios por cuenta (un
+lugar por día) y los saldos salen de una suma acumulada: el costo crece con la
+cantidad de ocurrencias y de días, sin fechas ni recorridos por fijo y día. El
+resultado se cachea por versión de datos del usuario.
+"""
+import calendar
+import datetime
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+from itertools import accumulate
+
+from dateutil.relativedelta import relativedelta
+
+from .models import closing_date_in_month, statement_closings
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 36
+
+# Próximos movimientos que se listan en la página
+MAX_EVENTS = 50
+
+UNASSIGNED_LABEL = 'Sin cuenta asignada'
+
+
+def month_table(today, first, last):
+    """
+    (días desde `today` hasta el primer día del mes, días del mes) de cada mes entre
+    `first` y `last`. Los meses anteriores a hoy dan desplazamientos negativos.
+    """
+    months = []
+    month = first.replace(day=1)
+    while month <= last:
+        months.append(((month - today).days, calendar.monthrange(month.year, month.month)[1]))
+        month += relativedelta(months=1)
+    return months
+
+
+def rule_offsets(rule, today, last, months):
+    """
+    Ocurrencias pendientes del fijo hasta `last`, como días desde `today` (las atrasadas
+    cuentan hoy). Se calculan con aritmética de días sobre la tabla de meses, sin armar
+    una fecha por ocurrencia.
+    """
+    end = min(last, rule.end_date) if rule.end_date else last
+    due = rule.next_due_date or rule.next_occurrence(today - datetime.timedelta(days=1))
+    if due > end:
+        return []
+    first, stop = (due - today).days, (end - today).days
+    if rule.frequency == 'semanal':
+        offsets = range(first, stop + 1, 7)
+    else:
+        # Mismo día que start_date; en los meses más cortos, el último día (como RecurringTransaction.occurrence)
+        day = rule.start_date.day
+        offsets = [
+            offset for offset in (month_start + min(day, length) - 1 for month_start, length in months)
+            if first <= offset <= stop
+        ]
+    if first < 0:
+        return [max(offset, 0) for offset in offsets]
+    return offsets
+
+
+def _due_after(due_day, date):
+    """Primer vencimiento (día `due_day` de cada mes) posterior a `date`."""
+    due = closing_date_in_month(due_day, date.year, date.month)
+    if due <= date:
+        following = date + relativedelta(day=1, months=1)
+        due = closing_date_in_month(due_day, following.year, following.month)
+    return due
+
+
+def card_payments(card, today):
+    """
+    Pagos pendientes de la tarjeta: el último resumen cerrado y el ciclo abierto, cada
+    uno en el vencimiento que sigue a su cierre. `card` viene de with_statements()
+    con `without_account`: las compras con cuenta ya movieron su saldo.
+    """
+    _, _, last_closing, next_closing = statement_closings(card.closing_date, today)
+    payments = []
+    for amount, closing in ((card.balance_due, last_closing), (card.next_statement, next_closing)):
+        due = _due_after(card.due_date, closing)
+        if amount and due >= today:
+            payments.append((due, amount))
+    return payments
+
+
+def _summary(dates, balances):
+    # Mínimo y días en que el saldo pasa a ser negativo
+    negative_dates = [
+        dates[i].isoformat() for i, balance in enumerate(balances)
+        if balance < 0 and (i == 0 or balances[i - 1] >= 0)
+    ]
+    low = min(range(len(balances)), key=balances.__getitem__)
+    return {
+        'balances': [float(balance) for balance in balances],
+        'final_balance': float(balances[-1]),
+        'min_balance': float(balances[low]),
+        'min_date': dates[low].isoformat(),
+        'negative_dates': negative_dates,
+    }
+
+
+def project(accounts, rules, cards, matcher, today, months=DEFAULT_MONTHS):
+    """
+    Saldo diario proyectado de cada cuenta (y del total) desde `today` hasta dentro de
+    `months` meses. `matcher` es el RuleMatcher del usuario.
+    """
+    last = today + relativedelta(months=months)
+    dates = [today + datetime.timedelta(days=offset) for offset in range((last - today).days + 1)]
+    # Desde el vencimiento más atrasado, por si process_recurring no corrió en días
+    table = month_table(today, min([today, *(rule.next_due_date for rule in rules if rule.next_due_date)]), last)
+    names = {account.pk: account.name for account in accounts}
+
+    # Neto de cada día por cuenta (None = sin cuenta)
+    flows = defaultdict(lambda: [Decimal('0.00')] * len(dates))
+    events = []
+    for rule in rules:
+        matched = matcher.match(rule.description, rule.amount)
+        cuenta_id = matched.cuenta_id if matched and matched.cuenta_id in names else None
+        amount = rule.amount if rule.type == 'ingreso' else -rule.amount
+        daily = flows[cuenta_id]
+        offsets = rule_offsets(rule, today, last, table)
+        for offset in offsets:
+            daily[offset] += amount
+        # Para la lista alcanza con las primeras ocurrencias de cada fijo
+        events.extend((offset, rule.description, amount, cuenta_id) for offset in offsets[:MAX_EVENTS])
+    for card in cards:
+        for date, amount in card_payments(card, today):
+            offset = (date - today).days
+            if offset < len(dates):
+                flows[None][offset] -= amount
+                events.append((offset, f'Pago de {card.name}', -amount, None))
+
+    rows = []
+    for account in accounts:
+        daily = flows.get(account.pk) or [Decimal('0.00')] * len(dates)
+        balances = list(accumulate(daily, initial=account.balance))[1:]
+        rows.append({'id': account.pk, 'name': account.name, **_summary(dates, balances)})
+    unassigned = list(accumulate(flows[None])) if None in flows else None
+
+    total_start = sum((account.balance for account in accounts), Decimal('0.00'))
+    total_flows = [sum(day) for day in zip(*flows.values())] if flows else [Decimal('0.00')] * len(dates)
+    total = list(accumulate(total_flows, initial=total_start))[1:]
+
+    events = heapq.nsmallest(MAX_EVENTS, events, key=lambda event: event[0])
+    return {
+        'today': today.isoformat(),
+        'until': last.isoformat(),
+        'months': months,
+        'labels': [date.isoformat() for date in dates],
+        'accounts': rows,
+        'unassigned': {'name': UNASSIGNED_LABEL, **_summary(dates, unassigned)} if unassigned else None,
+        'total': _summary(dates, total),
+        'events': [
+            {
+                'date': dates[offset].isoformat(),
+                'description': description,
+                'amount': float(amount),
+                'account': names.get(cuenta_id, UNASSIGNED_LABEL),
+            }
+            for offset, description, amount, cuenta_id in events
+        ],
+    }
@@ -1,7 +1,26 @@
 from django import forms
-from .models import Transaction, Category, RecurringTransaction, CreditCard, Account, Budget
+from .models import Transaction, Category, RecurringTransaction, CreditCard, Account, Budget, CategoryRule
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Row, Column, Field
+from .reference import UserReferenceData
+from . import search
+from .forecast import DEFAULT_MONTHS, MAX_MONTHS
+from .reports import GRANULARITY_CHOICES, MAX_BUCKETS, bucket_count, snap_range
+import datetime
+import re
+
+
+def _pop_reference(kwargs):
+    """
+    Saca del kwargs los datos de referencia del usuario: `reference` (compartidos por
+    la petición, ver reference.for_request) o `user` (se cargan solo para este formulario).
+    """
+    reference = kwargs.pop('reference', None)
+    user = kwargs.pop('user', None)
+    if reference is None and user:
+        reference = UserReferenceData(user)
+    return reference
+
 
 # Formulario para crear nuevas Categorías
 class CategoryForm(forms.ModelForm):
@@ -20,6 +39,7 @@ class CategoryForm(forms.ModelForm):
             Field('name', css_class='form-control')
         )
 
+
 # Formulario para crear nuevas Transacciones
 class TransactionForm(forms.ModelForm):
     class Meta:
@@ -39,13 +59,13 @@ class TransactionForm(forms.ModelForm):
         }
 
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user', None) 
+        reference = _pop_reference(kwargs)
         super().__init__(*args, **kwargs)
         
-        if user:
-            self.fields['category'].queryset = Category.objects.filter(user=user)
-            self.fields['tarjeta_usada'].queryset = CreditCard.objects.filter(user=user)
-            self.fields['cuenta'].queryset = Account.objects.filter(user=user)
+        if reference:
+            reference.limit_choices(self.fields['category'], 'categories')
+            reference.limit_choices(self.fields['tarjeta_usada'], 'cards')
+            reference.limit_choices(self.fields['cuenta'], 'accounts')
 
         self.helper = FormHelper()
         self.helper.form_tag = False # Para que funcione en el Modal
@@ -67,21 +87,22 @@ class TransactionForm(forms.ModelForm):
             ),
         )
 
+
 # Formulario para Gastos/Ingresos Fijos
 class RecurringTransactionForm(forms.ModelForm):
     class Meta:
         model = RecurringTransaction
-        exclude = ['user']
+        exclude = ['user', 'next_due_date']
         widgets = {
             'start_date': forms.DateInput(attrs={'type': 'date'}),
             'end_date': forms.DateInput(attrs={'type': 'date'}),
         }
 
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user', None)
+        reference = _pop_reference(kwargs)
         super().__init__(*args, **kwargs)
-        if user:
-            self.fields['category'].queryset = Category.objects.filter(user=user)
+        if reference:
+            reference.limit_choices(self.fields['category'], 'categories')
         
         self.helper = FormHelper()
         self.helper.layout = Layout(
@@ -98,6 +119,7 @@ class RecurringTransactionForm(forms.ModelForm):
             Field('end_date', css_class='form-control')
         )
 
+
 # Formulario para Tarjetas de Crédito
 class CreditCardForm(forms.ModelForm):
     class Meta:
@@ -124,7 +146,8 @@ class CreditCardForm(forms.ModelForm):
                 Column(Field('due_date', css_class='form-control'), css_class='col-md-6')
             )
         )
-        
+
+
 # --- FORMULARIO DE CUENTAS ---
 class AccountForm(forms.ModelForm):
     class Meta:
@@ -146,15 +169,18 @@ class AccountForm(forms.ModelForm):
             Field('name', css_class='form-control'),
             Field('balance', css_class='form-control')
         )
-        
+
+
 # --- FORMULARIO DE PRESUPUESTOS ---
 class BudgetForm(forms.ModelForm):
     class Meta:
         model = Budget
-        fields = ['category', 'amount']
+        fields = ['category', 'amount', 'period', 'rollover']
         labels = {
             'category': 'Categoría',
-            'amount': 'Monto Límite Mensual',
+            'amount': 'Monto Límite del Período',
+            'period': 'Período',
+            'rollover': 'Pasar lo no gastado al período siguiente',
         }
         widgets = {
             'category': forms.Select(),
@@ -162,13 +188,269 @@ class BudgetForm(forms.ModelForm):
         }
 
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user', None)
+        reference = _pop_reference(kwargs)
         super().__init__(*args, **kwargs)
-        if user:
-            self.fields['category'].queryset = Category.objects.filter(user=user)
+        if reference:
+            reference.limit_choices(self.fields['category'], 'categories')
         
         self.helper = FormHelper()
         self.helper.layout = Layout(
             Field('category', css_class='form-select'),
-            Field('amount', css_class='form-control')
-        )
\ No newline at end of file
+            Row(
+                Column(Field('amount', css_class='form-control'), css_class='col-md-6'),
+                Column(Field('period', css_class='form-select'), css_class='col-md-6'),
+            ),
+            Field('rollover'),
+        )
+
+
+# --- FORMULARIO DE REGLAS DE CATEGORIZACIÓN ---
+class CategoryRuleForm(forms.ModelForm):
+    class Meta:
+        model = CategoryRule
+        fields = ['match_type', 'pattern', 'amount_min', 'amount_max', 'category', 'cuenta', 'priority']
+        labels = {
+            'match_type': 'Tipo de coincidencia',
+            'pattern': 'Texto en la descripción',
+            'amount_min': 'Monto mínimo (Opcional)',
+            'amount_max': 'Monto máximo (Opcional)',
+            'category': 'Asignar categoría',
+            'cuenta': 'Asignar cuenta',
+            'priority': 'Prioridad (menor = primero)',
+        }
+
+    def __init__(self, *args, **kwargs):
+        reference = _pop_reference(kwargs)
+        super().__init__(*args, **kwargs)
+        if reference:
+            reference.limit_choices(self.fields['category'], 'categories')
+            reference.limit_choices(self.fields['cuenta'], 'accounts')
+
+        self.helper = FormHelper()
+        self.helper.layout = Layout(
+            Row(
+                Column(Field('match_type', css_class='form-select'), css_class='col-md-5'),
+                Column(Field('pattern', css_class='form-control'), css_class='col-md-7'),
+            ),
+            Row(
+                Column(Field('amount_min', css_class='form-control'), css_class='col-md-6'),
+                Column(Field('amount_max', css_class='form-control'), css_class='col-md-6'),
+            ),
+            Row(
+                Column(Field('category', css_class='form-select'), css_class='col-md-6'),
+                Column(Field('cuenta', css_class='form-select'), css_class='col-md-6'),
+            ),
+            Field('priority', css_class='form-control'),
+        )
+
+    def clean(self):
+        data = super().clean()
+        if data.get('match_type') == 'regex' and data.get('pattern'):
+            try:
+                re.compile(data['pattern'])
+            except re.error as error:
+                self.add_error('pattern', f'Expresión regular inválida: {error}')
+        amount_min, amount_max = data.get('amount_min'), data.get('amount_max')
+        if amount_min is not None and amount_max is not None and amount_min > amount_max:
+            self.add_error('amount_max', 'El monto máximo no puede ser menor que el mínimo.')
+        if not data.get('category') and not data.get('cuenta'):
+            raise forms.ValidationError('La regla tiene que asignar una categoría o una cuenta.')
+        return data
+
+
+# --- FORMULARIO DE FILTROS DE TRANSACCIONES ---
+# No guarda nada: solo valida los parámetros GET de la lista de transacciones
+class TransactionFilterForm(forms.Form):
+    q = forms.CharField(
+        label='Buscar', required=False, max_length=100,
+        widget=forms.TextInput(attrs={'type': 'search', 'placeholder': 'Descripción...'}),
+    )
+    date_from = forms.DateField(
+        label='Desde', required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    date_to = forms.DateField(
+        label='Hasta', required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    type = forms.ChoiceField(
+        label='Tipo', required=False,
+        choices=(('', 'Todos'),) + Transaction.TYPE_CHOICES,
+    )
+    category = forms.ModelChoiceField(
+        label='Categoría', required=False,
+        queryset=Category.objects.none(), empty_label='Todas',
+    )
+    cuenta = forms.ModelChoiceField(
+        label='Cuenta', required=False,
+        queryset=Account.objects.none(), empty_label='Todas',
+    )
+
+    def __init__(self, *args, **kwargs):
+        reference = _pop_reference(kwargs)
+        super().__init__(*args, **kwargs)
+        if reference:
+            reference.limit_choices(self.fields['category'], 'categories')
+            reference.limit_choices(self.fields['cuenta'], 'accounts')
+
+        self.helper = FormHelper()
+        self.helper.form_tag = False
+        self.helper.form_method = 'get'
+        self.helper.layout = Layout(
+            Field('q', css_class='form-control'),
+            Row(
+                Column(Field('date_from', css_class='form-control'), css_class='col-md'),
+                Column(Field('date_to', css_class='form-control'), css_class='col-md'),
+                Column(Field('type', css_class='form-select'), css_class='col-md'),
+                Column(Field('category', css_class='form-select'), css_class='col-md'),
+                Column(Field('cuenta', css_class='form-select'), css_class='col-md'),
+            )
+        )
+
+    def filter_queryset(self, transactions, user):
+        """Aplica al queryset (transacciones de `user`) los filtros válidos, como condiciones SQL."""
+        if not self.is_bound or not self.is_valid():
+            return transactions
+        data = self.cleaned_data
+        if data['date_from']:
+            transactions = transactions.filter(date__gte=data['date_from'])
+        if data['date_to']:
+            transactions = transactions.filter(date__lte=data['date_to'])
+        if data['type']:
+            transactions = transactions.filter(type=data['type'])
+        if data['category']:
+            transactions = transactions.filter(category=data['category'])
+        if data['cuenta']:
+            transactions = transactions.filter(cuenta=data['cuenta'])
+        if self.search_text():
+            transactions = search.search_transactions(transactions, data['q'], user)
+        return transactions
+
+    def search_text(self):
+        """Texto buscado, si el formulario es válido y tiene palabras para buscar."""
+        if not self.is_bound or not self.is_valid():
+            return ''
+        return self.cleaned_data['q'] if search.search_words(self.cleaned_data['q']) else ''
+
+
+# --- FORMULARIO DE FILTROS DE INFORMES ---
+# Rango y granularidad del informe (parámetros GET). Sin parámetros: el año actual por mes
+class ReportFilterForm(forms.Form):
+    date_from = forms.DateField(
+        label='Desde', required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    date_to = forms.DateField(
+        label='Hasta', required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    granularity = forms.ChoiceField(label='Agrupar por', required=False, choices=GRANULARITY_CHOICES)
+    compare = forms.BooleanField(label='Comparar con el año anterior', required=False)
+
+    def __init__(self, data=None, *args, today=None, **kwargs):
+        today = today or datetime.date.today()
+        kwargs['initial'] = {
+            'date_from': today.replace(month=1, day=1),
+            'date_to': today,
+            'granularity': 'month',
+            'compare': True,
+        }
+        super().__init__(data or None, *args, **kwargs)
+
+        self.helper = FormHelper()
+        self.helper.form_tag = False
+        self.helper.form_method = 'get'
+        self.helper.layout = Layout(
+            Row(
+                Column(Field('date_from', css_class='form-control'), css_class='col-md'),
+                Column(Field('date_to', css_class='form-control'), css_class='col-md'),
+                Column(Field('granularity', css_class='form-select'), css_class='col-md'),
+                Column(Field('compare'), css_class='col-md d-flex align-items-end'),
+            )
+        )
+
+    def clean(self):
+        data = super().clean()
+        # Lo que no se envía toma el valor por defecto
+        for name in ('date_from', 'date_to', 'granularity'):
+            if not data.get(name) and name not in self.errors:
+                data[name] = self.initial[name]
+        if self.errors:
+            return data
+        if data['date_from'] > data['date_to']:
+            raise forms.ValidationError('La fecha "Desde" no puede ser posterior a "Hasta".')
+        if bucket_count(data['date_from'], data['date_to'], data['granularity']) > MAX_BUCKETS:
+            raise forms.ValidationError(
+                f'El rango es demasiado largo para esa agrupación (máximo {MAX_BUCKETS} períodos).'
+            )
+        return data
+
+    def report_params(self):
+        """
+        Parámetros del informe (date_from, date_to, granularity, compare), o None si no
+        son válidos. Las fechas se extienden a períodos completos (reports.snap_range).
+        """
+        if not self.is_bound:
+            data = self.initial
+        elif self.is_valid():
+            data = self.cleaned_data
+        else:
+            return None
+        params = {name: data[name] for name in ('date_from', 'date_to', 'granularity', 'compare')}
+        params['date_from'], params['date_to'] = snap_range(data['date_from'], data['date_to'], data['granularity'])
+        return params
+
+
+# --- FORMULARIO DE LA PROYECCIÓN ---
+class ForecastForm(forms.Form):
+    months = forms.IntegerField(label='Meses a proyectar', required=False, min_value=1, max_value=MAX_MONTHS)
+
+    def __init__(self, data=None, *args, **kwargs):
+        kwargs['initial'] = {'months': DEFAULT_MONTHS}
+        super().__init__(data or None, *args, **kwargs)
+
+        self.helper = FormHelper()
+        self.helper.form_tag = False
+        self.helper.form_method = 'get'
+        self.helper.layout = Layout(Field('months', css_class='form-control'))
+
+    def forecast_months(self):
+        """Meses pedidos (el valor por defecto si no se envió), o None si no es válido."""
+        if not self.is_bound:
+            return DEFAULT_MONTHS
+        if not self.is_valid():
+            return None
+        return self.cleaned_data['months'] or DEFAULT_MONTHS
+
+
+# --- FORMULARIO DE IMPORTACIÓN DE EXTRACTOS ---
+class TransactionImportForm(forms.Form):
+    FORMAT_CHOICES = (
+        ('', 'Detectar por extensión'),
+        ('csv', 'CSV'),
+        ('ofx', 'OFX / QFX'),
+    )
+
+    file = forms.FileField(label='Archivo del extracto')
+    file_format = forms.ChoiceField(label='Formato', choices=FORMAT_CHOICES, required=False)
+    cuenta = forms.ModelChoiceField(
+        label='Cuenta del extracto', required=False,
+        queryset=Account.objects.none(),
+        help_text='Se usa para las filas que no indican una cuenta.',
+    )
+
+    def __init__(self, *args, **kwargs):
+        reference = _pop_reference(kwargs)
+        super().__init__(*args, **kwargs)
+        if reference:
+            reference.limit_choices(self.fields['cuenta'], 'accounts')
+
+        self.helper = FormHelper()
+        self.helper.form_tag = False
+        self.helper.layout = Layout(
+            Field('file', css_class='form-control'),
+            Row(
+                Column(Field('file_format', css_class='form-select'), css_class='col-md-6'),
+                Column(Field('cuenta', css_class='form-select'), css_class='col-md-6'),
+            ),
+        )
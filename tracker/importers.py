@@ -0,0 +1,272 @@
+"""
+Importación masiva de extractos bancarios (CSV u OFX).
+
+Los archivos se leen de a una línea (nunca se cargan completos en memoria), cada fila
+se valida con los campos de TransactionForm, las filas sin categoría o sin cuenta se
+completan con las reglas del usuario y las transacciones se guardan en lotes: un
+bulk_create por lote y un solo UPDATE por cuenta para aplicar el saldo neto.
+"""
+import csv
+import datetime
+import re
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+
+from . import services
+from .cache import bump_data_version
+from .forms import TransactionForm
+from .models import Account, Category, CreditCard, Transaction
+
+# Cantidad de filas que se insertan por lote
+DEFAULT_BATCH_SIZE = 1000
+
+# Cantidad máxima de errores que se guardan para mostrar al usuario
+MAX_REPORTED_ERRORS = 50
+
+# Encabezados aceptados en el CSV para cada campo de TransactionForm
+CSV_COLUMN_ALIASES = {
+    'type': ('type', 'tipo'),
+    'amount': ('amount', 'monto', 'importe'),
+    'category': ('category', 'categoria', 'categoría'),
+    'description': ('description', 'descripcion', 'descripción', 'concepto'),
+    'date': ('date', 'fecha'),
+    'cuenta': ('cuenta', 'account'),
+    'tarjeta_usada': ('tarjeta_usada', 'tarjeta', 'card'),
+}
+
+# Parte entera de un monto: sin separadores o con grupos de miles de a tres dígitos
+AMOUNT_GROUPS_RE = re.compile(r'[+-]?(\d+|\d{1,3}(,\d{3})+)')
+
+# Etiquetas de OFX que nos interesan dentro de cada <STMTTRN>
+OFX_TAG_RE = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Línea {line}: {message}")
+
+
+# --- Lectura de archivos ---
+def parse_csv(lines):
+    """
+    Recorre un CSV con encabezado y devuelve (número de línea, fila) con las
+    columnas ya mapeadas a los nombres de campo de TransactionForm.
+    """
+    reader = csv.reader(lines, delimiter=_sniff_delimiter(lines))
+    header = next(reader, None)
+    if header is None:
+        return
+
+    columns = {}
+    for index, name in enumerate(header):
+        name = name.strip().lower()
+        for field_name, aliases in CSV_COLUMN_ALIASES.items():
+            if name in aliases:
+                columns[field_name] = index
+
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue  # Línea vacía
+        row = {
+            field_name: values[index].strip() if index < len(values) else ''
+            for field_name, index in columns.items()
+        }
+        yield reader.line_num, row
+
+
+def _sniff_delimiter(lines):
+    # Solo se mira la primera línea; si el archivo no permite volver atrás asumimos ','
+    try:
+        position = lines.tell()
+        first_line = lines.readline()
+        lines.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return ','
+    return ';' if first_line.count(';') > first_line.count(',') else ','
+
+
+def parse_ofx(lines):
+    """
+    Recorre un archivo OFX (SGML o XML) y devuelve (número de línea, fila)
+    por cada <STMTTRN>, con los datos convertidos a campos de TransactionForm.
+    """
+    current = None
+    for line_number, line in enumerate(lines, start=1):
+        for closing, tag, value in OFX_TAG_RE.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    current = {}
+                elif current is not None:
+                    yield line_number, _ofx_to_row(current)
+                    current = None
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+def _ofx_to_row(ofx):
+    amount = ofx.get('TRNAMT', '')
+    negative = amount.startswith('-')
+    posted = ofx.get('DTPOSTED', '')[:8]
+    return {
+        'type': 'gasto' if negative else 'ingreso',
+        'amount': amount.lstrip('+-'),
+        'description': ofx.get('NAME') or ofx.get('MEMO') or ofx.get('TRNTYPE', ''),
+        'date': f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) == 8 else posted,
+    }
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ofx': parse_ofx,
+}
+
+
+def detect_format(filename):
+    """Devuelve 'ofx' para archivos .ofx/.qfx y 'csv' para el resto."""
+    return 'ofx' if filename.lower().endswith(('.ofx', '.qfx')) else 'csv'
+
+
+# --- Validación de filas ---
+def _normalize_amount(value):
+    """
+    Acepta montos como '1234.56', '1.234,56', '1,234.56', '1.234.567' o '-20,5'. Con
+    los dos separadores el último es el decimal; un separador repetido es de miles.
+    Un solo separador seguido de tres dígitos ('1.234') puede ser cualquiera de los
+    dos y se rechaza.
+    """
+    value = value.replace('$', '').replace(' ', '')
+    separators = [char for char in value if char in '.,']
+    if not separators:
+        return value
+
+    decimal = separators[-1] if len(set(separators)) == 2 else None
+    if decimal is None and len(separators) == 1:
+        if len(value) - value.index(separators[0]) - 1 == 3:
+            raise ValidationError(
+                f"El monto '{value}' es ambiguo: puede tener separador de miles o decimal. "
+                "Usá '1234.50' o '1.234,50'."
+            )
+        decimal = separators[0]
+
+    integer, _, fraction = value.rpartition(decimal) if decimal else (value, '', '')
+    if decimal is None:
+        # Solo un separador, repetido: es el de miles
+        thousands = separators[0]
+    else:
+        thousands = ',' if decimal == '.' else '.'
+    if not AMOUNT_GROUPS_RE.fullmatch(integer.replace(thousands, ',')):
+        raise ValidationError(f"El monto '{value}' no es válido.")
+    integer = integer.replace(thousands, '')
+    return f'{integer}.{fraction}' if decimal else integer
+
+
+class RowBuilder:
+    """
+    Convierte filas del archivo en instancias de Transaction sin guardarlas.
+    Usa los campos de TransactionForm para validar y resuelve categorías, cuentas
+    y tarjetas con diccionarios cargados una sola vez por importación.
+    """
+
+    def __init__(self, user, default_cuenta=None):
+        self.user = user
+        self.default_cuenta = default_cuenta
+        self.fields = TransactionForm(user=user).fields
+        self.categories = self._lookup(Category.objects.filter(user=user))
+        self.accounts = self._lookup(Account.objects.filter(user=user))
+        self.cards = self._lookup(CreditCard.objects.filter(user=user))
+
+    @staticmethod
+    def _lookup(queryset):
+        # Se puede referenciar por id o por nombre (sin distinguir mayúsculas)
+        lookup = {}
+        for obj in queryset:
+            lookup[str(obj.pk)] = obj
+            lookup.setdefault(obj.name.strip().lower(), obj)
+        return lookup
+
+    def _resolve(self, lookup, value, label):
+        if not value:
+            return None
+        obj = lookup.get(value.strip().lower())
+        if obj is None:
+            raise ValidationError(f"{label} '{value}' no existe.")
+        return obj
+
+    def build(self, row):
+        amount = _normalize_amount(row.get('amount', ''))
+        transaction_type = row.get('type', '').strip().lower()
+        if not transaction_type:
+            # Extractos sin columna de tipo: el signo del monto define ingreso o gasto
+            transaction_type = 'gasto' if amount.startswith('-') else 'ingreso'
+        amount = amount.lstrip('+-')
+
+        cuenta = self._resolve(self.accounts, row.get('cuenta'), 'La cuenta') or self.default_cuenta
+        category = self._resolve(self.categories, row.get('category'), 'La categoría')
+        card = self._resolve(self.cards, row.get('tarjeta_usada'), 'La tarjeta')
+        # Se asignan los ids (no las instancias) para no pasar por los descriptores de FK
+        transaction = Transaction(
+            user_id=self.user.pk,
+            type=self.fields['type'].clean(transaction_type),
+            amount=self.fields['amount'].clean(amount),
+            description=self.fields['description'].clean(row.get('description', '')),
+            date=self._clean_date(row.get('date', '')),
+            category_id=category.pk if category else None,
+            cuenta_id=cuenta.pk if cuenta else None,
+            tarjeta_usada_id=card.pk if card else None,
+        )
+        return transaction
+
+    def _clean_date(self, value):
+        # Atajo para el formato ISO (el más común); el resto lo resuelve el DateField del formulario
+        try:
+            return datetime.date.fromisoformat(value.strip())
+        except ValueError:
+            return self.fields['date'].clean(value)
+
+
+# --- Guardado por lotes ---
+def _save_batch(batch):
+    """
+    Inserta un lote y aplica sus efectos con pocas consultas: las reglas completan las
+    filas sin categoría o sin cuenta y cada cuenta recibe un solo UPDATE con el neto.
+    """
+    services.create_transactions(batch)
+
+
+def import_transactions(user, lines, file_format='csv', default_cuenta=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Importa las transacciones de `lines` (un archivo de texto abierto) para `user`.
+    Las filas con errores se saltean y se informan en el resultado.
+    """
+    result = ImportResult()
+    builder = RowBuilder(user, default_cuenta=default_cuenta)
+    batch = []
+
+    for line_number, row in PARSERS[file_format](lines):
+        try:
+            batch.append(builder.build(row))
+        except ValidationError as error:
+            result.add_error(line_number, ' '.join(error.messages))
+            continue
+
+        if len(batch) >= batch_size:
+            _save_batch(batch)
+            result.created += len(batch)
+            batch = []
+
+    if batch:
+        _save_batch(batch)
+        result.created += len(batch)
+
+    if result.created:
+        bump_data_version(user.pk)
+    return result
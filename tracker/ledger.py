@@ -0,0 +1,129 @@
+"""
+Libro de saldos de las cuentas (BalanceEntry).
+
+Cada escritura de transacciones (tracker.services) registra el neto por cuenta y día:
+se suma al día de la transacción y al saldo de cierre de ese día y de los días
+posteriores ya registrados (ninguno en el caso común, un movimiento de hoy). Así cada
+fila guarda el saldo al cierre de su día y sirve de punto de control:
+
+- Saldo en una fecha: la última fila hasta esa fecha, o el saldo inicial de la cuenta.
+- Evolución del saldo: las filas del rango más el saldo al empezar, sin sumar el
+  historial anterior.
+
+La última fila de cada cuenta tiene que coincidir con Account.balance; si no, hubo
+escrituras que no pasaron por el libro. Para reconstruirlo: python manage.py rebuild_summaries
+"""
+import bisect
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, When
+
+from .models import Account, BalanceEntry, Transaction
+
+# Efecto de una transacción en el saldo de su cuenta
+SIGNED_AMOUNT = Case(
+    When(type='ingreso', then=F('amount')),
+    default=-F('amount'),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def apply(changes):
+    """Registra en el libro los pares (transacción, signo) de `changes`, con el neto por cuenta y día."""
+    deltas = defaultdict(Decimal)
+    for transaction, sign in changes:
+        if transaction.cuenta_id:
+            amount = transaction.amount if transaction.type == 'ingreso' else -transaction.amount
+            deltas[(transaction.cuenta_id, transaction.date)] += amount * sign
+    for (cuenta_id, date), delta in sorted(deltas.items()):
+        if delta:
+            _record(cuenta_id, date, delta)
+
+
+def _record(cuenta_id, date, delta):
+    entries = BalanceEntry.objects.filter(account_id=cuenta_id)
+    # Saldo de cierre del día y de los días posteriores ya registrados
+    if entries.filter(date__gte=date).update(balance=F('balance') + delta):
+        if entries.filter(date=date).update(delta=F('delta') + delta):
+            return
+
+    # Primer movimiento del día: se parte del saldo del último día anterior
+    previous = entries.filter(date__lt=date).order_by('-date').values_list('balance', flat=True).first()
+    if previous is None:
+        previous = Account.objects.filter(pk=cuenta_id).values_list('opening_balance', flat=True).get()
+    try:
+        with db_transaction.atomic():
+            BalanceEntry.objects.create(account_id=cuenta_id, date=date, delta=delta, balance=previous + delta)
+    except IntegrityError:
+        # Otra petición creó el día al mismo tiempo: se suma a esa fila
+        entries.filter(date=date).update(delta=F('delta') + delta, balance=F('balance') + delta)
+
+
+def balance_at(account, date):
+    """Saldo de `account` al cierre de `date`."""
+    balance = BalanceEntry.objects.filter(account=account, date__lte=date) \
+        .order_by('-date').values_list('balance', flat=True).first()
+    return account.opening_balance if balance is None else balance
+
+
+def with_balance_before(accounts, date):
+    """Anota en cada cuenta `balance_before`: su saldo al cierre del día anterior a `date`."""
+    return accounts.annotate(balance_before=Subquery(
+        BalanceEntry.objects.filter(account=OuterRef('pk'), date__lt=date)
+        .order_by('-date').values('balance')[:1]
+    ))
+
+
+def balance_series(accounts, entries, dates):
+    """
+    Saldo de cada cuenta al cierre de cada fecha de `dates` (ordenadas). `accounts` viene
+    de with_balance_before() con la primera fecha y `entries` son las filas del libro
+    entre esa fecha y la última. Devuelve {id de cuenta: [saldo por fecha]}.
+    """
+    by_account = defaultdict(list)
+    for entry in entries:
+        by_account[entry.account_id].append((entry.date, entry.balance))
+
+    series = {}
+    for account in accounts:
+        start = account.opening_balance if account.balance_before is None else account.balance_before
+        own = sorted(by_account[account.pk])
+        own_dates = [date for date, _ in own]
+        balances = []
+        for date in dates:
+            # Última fila hasta la fecha (o el saldo al empezar si no hay ninguna)
+            index = bisect.bisect_right(own_dates, date)
+            balances.append(own[index - 1][1] if index else start)
+        series[account.pk] = balances
+    return series
+
+
+def rebuild(users=None):
+    """
+    Vuelve a armar el libro desde las transacciones, con una consulta agrupada por cuenta
+    y día. Si se pasa `users` solo se reconstruyen sus cuentas. Devuelve las filas creadas.
+    """
+    accounts = Account.objects.all()
+    if users is not None:
+        accounts = accounts.filter(user__in=users)
+    opening = dict(accounts.values_list('pk', 'opening_balance'))
+
+    rows = Transaction.objects.filter(cuenta__in=accounts) \
+        .values('cuenta_id', 'date') \
+        .annotate(delta=Sum(SIGNED_AMOUNT)) \
+        .order_by('cuenta_id', 'date')
+
+    with db_transaction.atomic():
+        BalanceEntry.objects.filter(account__in=accounts).delete()
+        entries = []
+        balance = current = None
+        for row in rows.iterator():
+            if row['cuenta_id'] != current:
+                current = row['cuenta_id']
+                balance = opening[current]
+            balance += row['delta']
+            entries.append(BalanceEntry(account_id=current, date=row['date'], delta=row['delta'], balance=balance))
+        BalanceEntry.objects.bulk_create(entries, batch_size=1000)
+    return len(entries)
@@ -0,0 +1,160 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from tracker.cache import bump_data_version
+import datetime
+import io
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide las vistas principales (y process_recurring) para un usuario: cantidad de consultas, '
+        'tiempo y pico de memoria. Guarda los resultados en JSON para comparar entre commits. '
+        'Usar sobre una base de desarrollo (por ejemplo con datos de generate_data).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench_0', help='Usuario con el que se hacen las peticiones.')
+        parser.add_argument('--iterations', type=int, default=5, help='Repeticiones por vista.')
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Invalida la caché del usuario antes de cada petición (mide el cálculo completo).',
+        )
+        parser.add_argument('--output', help='Archivo JSON donde guardar los resultados.')
+        parser.add_argument('--compare', help='Archivo JSON de una corrida anterior para comparar.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"El usuario '{options['user']}' no existe. Generalo con: python manage.py generate_data")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations debe ser mayor o igual a 1.')
+
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+
+        # Vistas medidas: nombre -> función que hace la petición
+        cases = {
+            'index': lambda: client.get(reverse('index'), secure=True),
+            'index_este_ano': lambda: client.get(reverse('index'), {'periodo': 'este_ano'}, secure=True),
+            'transaction_list': lambda: client.get(reverse('transaction_list'), secure=True),
+            'reports': lambda: client.get(reverse('reports'), secure=True),
+            # Widgets del dashboard y series de informes (se piden aparte de la página)
+            **{
+                name: (lambda name=name: client.get(reverse(name), secure=True))
+                for name in (
+                    'dashboard_totals', 'dashboard_categories', 'dashboard_budgets',
+                    'dashboard_cards', 'reports_series',
+                )
+            },
+            'process_recurring': lambda: call_command('process_recurring', '--dry-run', stdout=io.StringIO()),
+        }
+
+        results = {}
+        for name, run in cases.items():
+            results[name] = self._measure(name, run, user, options)
+            self.stdout.write(
+                f"  {name:<20} {results[name]['queries']:>4} consultas  "
+                f"{results[name]['wall_ms']['median']:>9.1f} ms (mediana)  "
+                f"{results[name]['peak_kb']:>9.1f} KB"
+            )
+
+        report = {
+            'meta': {
+                'commit': self._git_commit(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'database': connection.vendor,
+                'user': user.username,
+                'iterations': options['iterations'],
+                'cold': options['cold'],
+            },
+            'results': results,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['output']}"))
+
+        if options['compare']:
+            self._compare(options['compare'], report)
+
+    def _measure(self, name, run, user, options):
+        def call():
+            if options['cold']:
+                bump_data_version(user.pk)
+            response = run()
+            status = getattr(response, 'status_code', 200)
+            if status != 200:
+                raise CommandError(f"'{name}' respondió {status}.")
+
+        # Los tiempos se toman sin tracemalloc ni captura de consultas: las dos agregan
+        # un costo por asignación / consulta que inflaría y ensuciaría la medición
+        timings = []
+        for _ in range(options['iterations']):
+            start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        # Una pasada aparte para las consultas y el pico de memoria
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'queries': len(context.captured_queries),
+            'wall_ms': {
+                'min': round(min(timings), 2),
+                'median': round(statistics.median(timings), 2),
+                'max': round(max(timings), 2),
+            },
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def _compare(self, path, report):
+        with open(path, encoding='utf-8') as previous_file:
+            previous = json.load(previous_file)
+
+        self.stdout.write(f"Comparación contra {path} (commit {previous['meta'].get('commit') or '?'}):")
+        for name, current in report['results'].items():
+            before = previous['results'].get(name)
+            if before is None:
+                self.stdout.write(f"  {name:<20} (sin datos previos)")
+                continue
+            time_delta = self._percent(before['wall_ms']['median'], current['wall_ms']['median'])
+            memory_delta = self._percent(before['peak_kb'], current['peak_kb'])
+            line = (
+                f"  {name:<20} consultas {before['queries']} -> {current['queries']}  "
+                f"tiempo {time_delta:+.1f}%  memoria {memory_delta:+.1f}%"
+            )
+            worse = current['queries'] > before['queries'] or time_delta > 10
+            self.stdout.write(self.style.WARNING(line) if worse else line)
+
+    @staticmethod
+    def _percent(before, after):
+        return (after - before) / before * 100 if before else 0.0
+
+    @staticmethod
+    def _git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
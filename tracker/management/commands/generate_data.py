@@ -0,0 +1,177 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
+from tracker.models import (
+    Account, Budget, Category, CreditCard, MonthlySummary,
+    RecurringTransaction, Transaction,
+)
+from tracker import budgets, ledger
+from tracker.cache import bump_data_version
+from collections import defaultdict
+from decimal import Decimal
+import datetime
+import random
+import time
+
+# Nombres base para las categorías generadas (se numeran si se piden más)
+CATEGORY_NAMES = [
+    'Comida', 'Transporte', 'Alquiler', 'Servicios', 'Salud',
+    'Ocio', 'Sueldo', 'Compras', 'Educación', 'Viajes',
+]
+ACCOUNT_NAMES = ['Banco Nación', 'Efectivo', 'Mercado Pago', 'Banco Galicia', 'Brubank']
+CARD_NAMES = ['Visa', 'Mastercard', 'Amex', 'Naranja']
+
+
+class Command(BaseCommand):
+    help = 'Genera usuarios con datos sintéticos (cuentas, categorías, tarjetas, presupuestos, fijos y transacciones) para pruebas de rendimiento.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1, help='Cantidad de usuarios a generar.')
+        parser.add_argument('--prefix', default='bench', help='Prefijo de los nombres de usuario (bench_0, bench_1, ...).')
+        parser.add_argument('--password', default='spendly123', help='Contraseña de los usuarios generados.')
+        parser.add_argument('--accounts', type=int, default=3, help='Cuentas por usuario.')
+        parser.add_argument('--categories', type=int, default=8, help='Categorías por usuario.')
+        parser.add_argument('--cards', type=int, default=2, help='Tarjetas de crédito por usuario.')
+        parser.add_argument('--budgets', type=int, default=4, help='Presupuestos por usuario (como máximo uno por categoría).')
+        parser.add_argument('--recurring', type=int, default=5, help='Ingresos/gastos fijos por usuario.')
+        parser.add_argument('--transactions', type=int, default=1000, help='Transacciones por usuario.')
+        parser.add_argument('--months', type=int, default=24, help='Meses de historial hacia atrás.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por lote de inserción.')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla para obtener siempre los mismos datos.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        today = datetime.date.today()
+        first_day = today - datetime.timedelta(days=30 * options['months'])
+        history_days = (today - first_day).days
+        batch_size = options['batch_size']
+
+        usernames = [f"{options['prefix']}_{i}" for i in range(options['users'])]
+        existing = list(User.objects.filter(username__in=usernames).values_list('username', flat=True)[:5])
+        if existing:
+            raise CommandError(f"Ya existen usuarios con esos nombres (ej: {', '.join(existing)}). Usá otro --prefix.")
+
+        start = time.perf_counter()
+        self.stdout.write(f"Generando {len(usernames)} usuario(s) con {options['transactions']} transacciones cada uno...")
+
+        with db_transaction.atomic():
+            # Una sola vez: el hash de la contraseña es lento a propósito
+            password = make_password(options['password'])
+            User.objects.bulk_create(
+                [User(username=username, password=password) for username in usernames],
+                batch_size=batch_size,
+            )
+            users = list(User.objects.filter(username__in=usernames).order_by('pk'))
+
+            # bulk_create no llama a save(): el saldo inicial se asigna acá
+            accounts = []
+            for user in users:
+                for i in range(options['accounts']):
+                    opening = Decimal(rng.randint(0, 500000))
+                    accounts.append(Account(
+                        user=user, name=self._name(ACCOUNT_NAMES, i), balance=opening, opening_balance=opening,
+                    ))
+            accounts = self._bulk(Account, batch_size, accounts)
+            categories = self._bulk(Category, batch_size, [
+                Category(user=user, name=self._name(CATEGORY_NAMES, i))
+                for user in users for i in range(options['categories'])
+            ])
+            cards = self._bulk(CreditCard, batch_size, [
+                CreditCard(
+                    user=user, name=self._name(CARD_NAMES, i),
+                    closing_date=rng.randint(1, 31), due_date=rng.randint(1, 28),
+                )
+                for user in users for i in range(options['cards'])
+            ])
+
+            by_user = defaultdict(lambda: defaultdict(list))
+            for model_name, objects in (('accounts', accounts), ('categories', categories), ('cards', cards)):
+                for obj in objects:
+                    by_user[obj.user_id][model_name].append(obj)
+
+            self._bulk(Budget, batch_size, [
+                Budget(user=user, category=category, amount=Decimal(rng.randint(10000, 200000)))
+                for user in users
+                for category in by_user[user.pk]['categories'][:options['budgets']]
+            ])
+
+            # bulk_create no llama a save(): el próximo vencimiento se calcula acá
+            recurring = []
+            for user in users:
+                for i in range(options['recurring']):
+                    item = RecurringTransaction(
+                        user=user,
+                        type='ingreso' if i == 0 else 'gasto',
+                        amount=Decimal(rng.randint(1000, 300000)),
+                        category=self._choice(rng, by_user[user.pk]['categories']),
+                        description=f"Fijo {i + 1}",
+                        frequency=rng.choice(('mensual', 'semanal')),
+                        start_date=first_day + datetime.timedelta(days=rng.randint(0, history_days)),
+                    )
+                    item.next_due_date = item.next_occurrence(max(item.start_date, today) - datetime.timedelta(days=1))
+                    recurring.append(item)
+            self._bulk(RecurringTransaction, batch_size, recurring)
+
+            # Transacciones: se insertan por lotes y se acumula el efecto en cada cuenta
+            balance_deltas = defaultdict(Decimal)
+            batch = []
+            created = 0
+            for user in users:
+                data = by_user[user.pk]
+                for i in range(options['transactions']):
+                    transaction_type = 'ingreso' if rng.random() < 0.2 else 'gasto'
+                    amount = Decimal(rng.randint(100, 100000)) / 100
+                    cuenta = self._choice(rng, data['accounts'])
+                    card = self._choice(rng, data['cards']) if transaction_type == 'gasto' and rng.random() < 0.3 else None
+                    batch.append(Transaction(
+                        user_id=user.pk,
+                        type=transaction_type,
+                        amount=amount,
+                        category_id=getattr(self._choice(rng, data['categories']), 'pk', None),
+                        description=f"Movimiento {i + 1}",
+                        date=first_day + datetime.timedelta(days=rng.randint(0, history_days)),
+                        cuenta_id=getattr(cuenta, 'pk', None),
+                        tarjeta_usada_id=getattr(card, 'pk', None),
+                    ))
+                    if cuenta:
+                        balance_deltas[cuenta.pk] += amount if transaction_type == 'ingreso' else -amount
+
+                    if len(batch) >= batch_size:
+                        Transaction.objects.bulk_create(batch)
+                        created += len(batch)
+                        batch = []
+            if batch:
+                Transaction.objects.bulk_create(batch)
+                created += len(batch)
+
+            for account in accounts:
+                account.balance += balance_deltas[account.pk]
+            Account.objects.bulk_update(accounts, ['balance'], batch_size=batch_size)
+
+            MonthlySummary.rebuild(users=users)
+            # Períodos actuales de los presupuestos, con lo gastado en los datos generados
+            budgets.rebuild(users=users)
+            ledger.rebuild(users=users)
+
+        bump_data_version(*(user.pk for user in users))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"¡Proceso completado en {elapsed:.2f}s! Se crearon {len(users)} usuarios, "
+            f"{len(accounts)} cuentas, {len(categories)} categorías, {len(cards)} tarjetas, "
+            f"{len(recurring)} fijos y {created} transacciones."
+        ))
+
+    @staticmethod
+    def _name(names, index):
+        name = names[index % len(names)]
+        return name if index < len(names) else f"{name} {index // len(names) + 1}"
+
+    @staticmethod
+    def _choice(rng, items):
+        return rng.choice(items) if items else None
+
+    @staticmethod
+    def _bulk(model, batch_size, objects):
+        # En SQLite y PostgreSQL bulk_create completa los pk de los objetos creados
+        return model.objects.bulk_create(objects, batch_size=batch_size)
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from tracker.models import Account
+from tracker import importers
+import time
+
+
+class Command(BaseCommand):
+    help = 'Importa transacciones desde un extracto bancario (CSV u OFX) para un usuario.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Usuario dueño de las transacciones.')
+        parser.add_argument('path', help='Ruta del archivo CSV u OFX.')
+        parser.add_argument(
+            '--account',
+            help='Cuenta (id o nombre) para las filas que no indican una cuenta.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(importers.PARSERS),
+            help='Formato del archivo. Por defecto se detecta por la extensión.',
+        )
+        parser.add_argument(
+            '--encoding',
+            default='utf-8-sig',
+            help='Codificación del archivo (por defecto utf-8-sig).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=importers.DEFAULT_BATCH_SIZE,
+            help='Cantidad de filas por lote de inserción.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"El usuario '{options['username']}' no existe.")
+
+        cuenta = None
+        if options['account']:
+            accounts = Account.objects.filter(user=user)
+            lookup = {'pk': options['account']} if options['account'].isdigit() else {'name__iexact': options['account']}
+            cuenta = accounts.filter(**lookup).first()
+            if cuenta is None:
+                raise CommandError(f"La cuenta '{options['account']}' no existe para {user.username}.")
+
+        file_format = options['format'] or importers.detect_format(options['path'])
+        self.stdout.write(f"Importando {options['path']} ({file_format}) para {user.username}...")
+
+        start = time.perf_counter()
+        with open(options['path'], encoding=options['encoding'], errors='replace', newline='') as lines:
+            result = importers.import_transactions(
+                user, lines,
+                file_format=file_format,
+                default_cuenta=cuenta,
+                batch_size=options['batch_size'],
+            )
+        elapsed = time.perf_counter() - start
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(f"  -> {error}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"¡Proceso completado! Se crearon {result.created} transacciones "
+            f"y se omitieron {result.skipped} filas en {elapsed:.2f}s."
+        ))
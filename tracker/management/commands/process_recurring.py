@@ -1,67 +1,69 @@
-from django.core.management.base import BaseCommand
-from django.db.models import Q
-from tracker.models import RecurringTransaction, Transaction
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from tracker import recurring
 import datetime
+import time
 
 class Command(BaseCommand):
     help = 'Procesa las transacciones recurrentes y crea las transacciones correspondientes.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Cantidad de procesos; el trabajo se divide por rangos de id de usuario. '
+                 'Pensado para PostgreSQL (SQLite no admite escrituras concurrentes).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra lo que se crearía sin guardar nada.',
+        )
+
+    def handle(self, *args, **options):
         today = datetime.date.today()
+        workers = options['workers']
+        dry_run = options['dry_run']
+        verbose = options['verbosity'] >= 2
+        if workers < 1:
+            raise CommandError('--workers debe ser mayor o igual a 1.')
+
         self.stdout.write(f"Iniciando proceso de transacciones recurrentes para {today}...")
-        
-        created_count = 0
-        
-        # 1. Buscamos todos los items recurrentes que estén activos
-        # (Que hayan empezado hoy o antes)
-        # (Y que no tengan fecha de fin, o que la fecha de fin sea hoy o en el futuro)
-        active_items = RecurringTransaction.objects.filter(
-            start_date__lte=today
-        ).filter(
-            Q(end_date__isnull=True) | Q(end_date__gte=today)
-        )
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Modo --dry-run: no se guardará ninguna transacción."))
 
-        for item in active_items:
-            is_due_today = False
-            
-            # 2. Verificamos si vence hoy según la frecuencia
-            if item.frequency == 'mensual':
-                # Si el día del mes de la fecha de inicio es igual al día de hoy
-                if item.start_date.day == today.day:
-                    is_due_today = True
-            
-            elif item.frequency == 'semanal':
-                # Si el día de la semana de inicio es igual al de hoy
-                # (0=Lunes, 1=Martes, ..., 6=Domingo)
-                if item.start_date.weekday() == today.weekday():
-                    is_due_today = True
-            
-            # (Aquí podrías agregar 'diario', 'anual', etc. si quisieras)
+        start = time.perf_counter()
+        process = partial(recurring.process_shard, today, dry_run=dry_run, verbose=verbose)
 
-            # 3. Si no vence hoy, pasamos al siguiente
-            if not is_due_today:
-                continue
+        if workers == 1:
+            results = [process()]
+        else:
+            shards = recurring.user_ranges(today, workers)
+            # Las conexiones abiertas no se pueden compartir con los procesos hijos
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=recurring.init_worker) as pool:
+                results = list(pool.map(process, shards))
 
-            # 4. ¡Vence hoy! Verificamos que no la hayamos creado ya
-            already_exists = Transaction.objects.filter(
-                recurring_source=item,
-                date=today
-            ).exists()
+        elapsed = time.perf_counter() - start
 
-            if not already_exists:
-                # 5. No existe, la creamos
-                Transaction.objects.create(
-                    user=item.user,
-                    type=item.type,
-                    amount=item.amount,
-                    category=item.category,
-                    description=item.description, # Usamos la misma descripción
-                    date=today,
-                    recurring_source=item # ¡La vinculamos!
+        for result in results:
+            for message in result.messages:
+                self.stdout.write(f"  -> {message}")
+            if result.user_range:
+                first_user_id, last_user_id = result.user_range
+                self.stdout.write(
+                    f"  Usuarios {first_user_id}-{last_user_id}: {result.due} fijos vencidos, "
+                    f"{result.created} creados, {result.existing} ya existían ({result.elapsed:.2f}s)"
                 )
-                created_count += 1
-                self.stdout.write(self.style.SUCCESS(f"  -> Creada transacción para '{item.description}' del usuario {item.user.username}"))
-            else:
-                self.stdout.write(self.style.WARNING(f"  -> Ya existía transacción para '{item.description}' del usuario {item.user.username}"))
 
-        self.stdout.write(self.style.SUCCESS(f"¡Proceso completado! Se crearon {created_count} nuevas transacciones."))
\ No newline at end of file
+        due = sum(result.due for result in results)
+        created = sum(result.created for result in results)
+        existing = sum(result.existing for result in results)
+        action = 'se crearían' if dry_run else 'se crearon'
+        self.stdout.write(self.style.SUCCESS(
+            f"¡Proceso completado en {elapsed:.2f}s! {due} fijos con vencimientos pendientes: "
+            f"{action} {created} nuevas transacciones y {existing} ya existían."
+        ))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from tracker.middleware import profiling_config
+from collections import Counter
+from pathlib import Path
+import io
+import pstats
+
+
+class Command(BaseCommand):
+    help = 'Resume las funciones más costosas de los perfiles (.pstats) guardados por ProfilingMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Directorio de perfiles (por defecto PROFILING["DIR"]).')
+        parser.add_argument('--view', action='append', help='Solo perfiles de esta vista (nombre de URL). Se puede repetir.')
+        parser.add_argument('--user', action='append', help='Solo perfiles de este id de usuario. Se puede repetir.')
+        parser.add_argument(
+            '--sort',
+            default='cumulative',
+            choices=['cumulative', 'tottime', 'ncalls'],
+            help='Orden de las funciones (tiempo acumulado, propio o cantidad de llamadas).',
+        )
+        parser.add_argument('--limit', type=int, default=25, help='Cantidad de funciones a mostrar.')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'] or profiling_config()['DIR'])
+        if not directory.is_dir():
+            raise CommandError(f"No existe el directorio de perfiles {directory}.")
+
+        files = []
+        per_view = Counter()
+        for path in sorted(directory.glob('*.pstats')):
+            view, user_id = self._parse_name(path)
+            if options['view'] and view not in options['view']:
+                continue
+            if options['user'] and user_id not in options['user']:
+                continue
+            files.append(path)
+            per_view[view] += 1
+
+        if not files:
+            self.stdout.write(self.style.WARNING('No hay perfiles que coincidan con el filtro.'))
+            return
+
+        self.stdout.write(f"{len(files)} perfil(es) en {directory}:")
+        for view, count in per_view.most_common():
+            self.stdout.write(f"  {view:<30} {count:>5}")
+        self.stdout.write('')
+
+        # pstats escribe de a pedazos: se arma el texto completo antes de mostrarlo
+        output = io.StringIO()
+        stats = pstats.Stats(str(files[0]), stream=output)
+        for path in files[1:]:
+            stats.add(str(path))
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(output.getvalue(), ending='')
+
+    @staticmethod
+    def _parse_name(path):
+        # <fecha>_<vista>_u<usuario>.pstats (la vista puede tener guiones bajos)
+        try:
+            _, rest = path.stem.split('_', 1)
+            view, user_id = rest.rsplit('_u', 1)
+        except ValueError:
+            return path.stem, None
+        return view, user_id
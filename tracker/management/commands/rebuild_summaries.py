@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from tracker import budgets, ledger
+from tracker.models import MonthlySummary
+from tracker.cache import bump_data_version
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los acumulados mensuales (MonthlySummary), lo gastado de los presupuestos y el libro de saldos a partir de las transacciones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help='Reconstruye solo el usuario indicado (se puede repetir).',
+        )
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+            self.stdout.write(f"Reconstruyendo acumulados de {users.count()} usuario(s)...")
+        else:
+            self.stdout.write("Reconstruyendo acumulados de todos los usuarios...")
+
+        created_count = MonthlySummary.rebuild(users=users)
+        corrected_periods = budgets.rebuild(users=users)
+        ledger_entries = ledger.rebuild(users=users)
+        # Los cálculos cacheados del dashboard dejan de ser válidos
+        bump_data_version(*(users if users is not None else User.objects.all()).values_list('pk', flat=True))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"¡Proceso completado! Se generaron {created_count} filas de acumulados "
+            f"y {ledger_entries} del libro de saldos, y se corrigieron {corrected_periods} períodos de presupuesto."
+        ))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from tracker import categorization
+from tracker.models import CategoryRule
+import time
+
+
+class Command(BaseCommand):
+    help = 'Aplica las reglas de categorización al historial de transacciones, por lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help='Procesa solo el usuario indicado (se puede repetir). Por defecto, todos los que tienen reglas.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=categorization.DEFAULT_CHUNK_SIZE,
+            help='Transacciones por lote (cada lote se guarda en su propia transacción de base de datos).',
+        )
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='También reemplaza la categoría de las transacciones que ya tienen una.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra cuántas transacciones cambiarían sin guardar nada.',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size debe ser mayor o igual a 1.')
+
+        user_ids = CategoryRule.objects.values_list('user_id', flat=True).distinct().order_by('user_id')
+        if options['usernames']:
+            user_ids = User.objects.filter(username__in=options['usernames']).values_list('pk', flat=True)
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("Modo --dry-run: no se guardará ningún cambio."))
+
+        start = time.perf_counter()
+        total_scanned = total_modified = 0
+        for user_id in user_ids:
+            scanned, modified = categorization.recategorize(
+                user_id,
+                chunk_size=options['chunk_size'],
+                overwrite=options['overwrite'],
+                dry_run=options['dry_run'],
+            )
+            total_scanned += scanned
+            total_modified += modified
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"  Usuario {user_id}: {scanned} revisadas, {modified} modificadas")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"¡Proceso completado! {total_scanned} transacciones revisadas, "
+            f"{total_modified} modificadas ({elapsed:.2f}s)."
+        ))
@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from tracker import reconcile, recurring
+from tracker.models import Account
+import time
+
+class Command(BaseCommand):
+    help = 'Compara el saldo de cada cuenta con sus transacciones y, con --fix, corrige las diferencias.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Cantidad de procesos; el trabajo se divide por rangos de id de usuario. '
+                 'Con --fix, pensado para PostgreSQL (SQLite no admite escrituras concurrentes).',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Corrige los saldos y el libro de saldos de las cuentas con diferencias.',
+        )
+        parser.add_argument(
+            '--opening',
+            nargs=2,
+            action='append',
+            default=[],
+            metavar=('CUENTA', 'SALDO'),
+            help='Confirma el saldo inicial real de una cuenta (id) antes de conciliar: el desvío '
+                 'anterior al libro de saldos aparece como diferencia. Se puede repetir.',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        apply_fix = options['fix']
+        if workers < 1:
+            raise CommandError('--workers debe ser mayor o igual a 1.')
+
+        for account_id, amount in options['opening']:
+            try:
+                reconcile.set_opening_balance(int(account_id), Decimal(amount))
+            except (ValueError, InvalidOperation, Account.DoesNotExist):
+                raise CommandError(f"--opening {account_id} {amount}: cuenta o saldo no válidos.")
+            self.stdout.write(f"Saldo inicial de la cuenta {account_id} confirmado: {amount}")
+
+        self.stdout.write("Conciliando saldos de las cuentas...")
+        start = time.perf_counter()
+        process = partial(reconcile.reconcile_shard, apply_fix=apply_fix)
+
+        if workers == 1:
+            results = [process()]
+        else:
+            shards = reconcile.user_ranges(workers)
+            # Las conexiones abiertas no se pueden compartir con los procesos hijos
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=recurring.init_worker) as pool:
+                results = list(pool.map(process, shards))
+
+        elapsed = time.perf_counter() - start
+
+        for result in results:
+            for mismatch in result.mismatches:
+                self.stdout.write(
+                    f"  -> Cuenta {mismatch.account_id} '{mismatch.name}' del usuario {mismatch.user_id}: "
+                    f"saldo {mismatch.balance}, libro {mismatch.ledger_balance}, "
+                    f"según transacciones {mismatch.expected} (diferencia {mismatch.delta:+})"
+                )
+            for opening in result.unverified:
+                self.stdout.write(
+                    f"  -> Cuenta {opening.account_id} '{opening.name}' del usuario {opening.user_id}: "
+                    f"saldo inicial {opening.opening_balance} deducido al crear el libro de saldos, sin "
+                    f"verificar (puede incluir un desvío anterior; confirmalo con --opening {opening.account_id} SALDO)"
+                )
+            if result.user_range:
+                first_user_id, last_user_id = result.user_range
+                self.stdout.write(
+                    f"  Usuarios {first_user_id}-{last_user_id}: {result.accounts} cuentas, "
+                    f"{len(result.mismatches)} con diferencias ({result.elapsed:.2f}s)"
+                )
+
+        accounts = sum(result.accounts for result in results)
+        found = sum(len(result.mismatches) for result in results)
+        fixed = sum(result.fixed for result in results)
+        unverified = sum(len(result.unverified) for result in results)
+        message = f"¡Proceso completado en {elapsed:.2f}s! {accounts} cuentas revisadas, {found} con diferencias"
+        if apply_fix:
+            message += f", {fixed} corregidas"
+        elif found:
+            message += " (usá --fix para corregirlas)"
+        if unverified:
+            message += f", {unverified} con el saldo inicial sin verificar"
+        self.stdout.write(self.style.SUCCESS(message + '.'))
@@ -0,0 +1,317 @@
+"""
+Instrumentación de rendimiento por petición.
+
+QueryTimingMiddleware cuenta las consultas SQL y el tiempo de base de datos de cada
+petición (con connection.execute_wrapper), agrega el header `Server-Timing` con los
+tiempos de ORM, plantillas y total, y registra en el log las vistas que superan su
+presupuesto de consultas (settings.QUERY_BUDGETS) junto con las consultas repetidas.
+
+ProfilingMiddleware corre cProfile sobre una fracción de las peticiones (o sobre las
+que pide el staff con un header o parámetro) y guarda archivos .pstats para analizar
+con el comando profile_summary.
+"""
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.text import slugify
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('tracker.performance')
+
+# Medición de la petición en curso (la usa también el backend de plantillas)
+_current_timing = ContextVar('spendly_request_timing', default=None)
+
+# Cantidad de consultas distintas (y largo de cada una) que se muestran en el log
+# cuando se supera el presupuesto
+MAX_LOGGED_FINGERPRINTS = 5
+MAX_LOGGED_SQL_LENGTH = 300
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+_SPACES_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normaliza una consulta (sin literales ni listas de IN) para agrupar las repetidas."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACES_RE.sub(' ', sql).strip()
+
+
+def current_timing():
+    return _current_timing.get()
+
+
+class RequestTiming:
+    """Acumula consultas, tiempo de base de datos y tiempo de plantillas de una petición."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+        self.fingerprint_time = defaultdict(float)
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Firma requerida por connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            key = fingerprint(sql)
+            self.query_count += 1
+            self.db_time += elapsed
+            self.fingerprints[key] += 1
+            self.fingerprint_time[key] += elapsed
+
+    @contextmanager
+    def measure_template(self):
+        # Solo se mide la plantilla de más afuera (las anidadas ya están incluidas)
+        # y se descuenta el tiempo de las consultas que se ejecutan mientras se renderiza
+        self._template_depth += 1
+        if self._template_depth > 1:
+            try:
+                yield
+            finally:
+                self._template_depth -= 1
+            return
+
+        start = time.perf_counter()
+        db_time_before = self.db_time
+        try:
+            yield
+        finally:
+            self._template_depth -= 1
+            self.template_time += (time.perf_counter() - start) - (self.db_time - db_time_before)
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="ORM ({self.query_count} consultas)"',
+            f'tpl;dur={self.template_time * 1000:.1f};desc="Plantillas"',
+            f'total;dur={total * 1000:.1f};desc="Total"',
+        ])
+
+    def top_fingerprints(self, limit=MAX_LOGGED_FINGERPRINTS):
+        return [
+            (count, self.fingerprint_time[key], key)
+            for key, count in self.fingerprints.most_common(limit)
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    # execute_wrapper de todas las conexiones: mide la consulta para la petición en curso.
+    # La petición se busca en el ContextVar, que sync_to_async copia a sus hilos
+    timing = _current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing(execute, sql, params, many, context)
+
+
+def install_query_timing(connection, **kwargs):
+    """Agrega la medición de consultas a una conexión (una sola vez)."""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+# Las conexiones nuevas (también las de los hilos del ORM async) se miden desde que se abren
+connection_created.connect(install_query_timing)
+
+
+class QueryTimingMiddleware:
+    """
+    Mide cada petición y agrega el header Server-Timing.
+    Presupuestos por nombre de URL en settings, por ejemplo:
+        QUERY_BUDGETS = {'index': 15, 'transaction_list': 10, 'reports': 5}
+        QUERY_BUDGET_DEFAULT = 50  # Para el resto de las vistas (None = sin límite)
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        for connection in connections.all():
+            install_query_timing(connection)
+        with self._measure() as timing:
+            response = self.get_response(request)
+        return self._finish(request, response, timing)
+
+    async def __acall__(self, request):
+        # Las consultas del ORM async corren en otro hilo (sync_to_async), con sus propias
+        # conexiones: las mide el wrapper que se instala al abrir cada conexión
+        with self._measure() as timing:
+            response = await self.get_response(request)
+        return self._finish(request, response, timing)
+
+    @contextmanager
+    def _measure(self):
+        timing = RequestTiming()
+        token = _current_timing.set(timing)
+        try:
+            yield timing
+        finally:
+            _current_timing.reset(token)
+
+    def _finish(self, request, response, timing):
+        total = time.perf_counter() - timing.start
+        response['Server-Timing'] = timing.server_timing(total)
+        self._check_budget(request, timing, total)
+        return response
+
+    def _check_budget(self, request, timing, total):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        budget = budgets.get(url_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+        if budget is None or timing.query_count <= budget:
+            return
+
+        repeated = '\n'.join(
+            f'    {count}x {elapsed * 1000:.1f}ms  {sql[:MAX_LOGGED_SQL_LENGTH]}'
+            for count, elapsed, sql in timing.top_fingerprints()
+        )
+        logger.warning(
+            'Presupuesto de consultas superado en %s (%s): %d consultas (máximo %d), '
+            'ORM %.1fms, total %.1fms. Consultas más repetidas:\n%s',
+            url_name or request.path, request.path, timing.query_count, budget,
+            timing.db_time * 1000, total * 1000, repeated,
+        )
+
+
+def profiling_config():
+    """settings.PROFILING completado con los valores por defecto."""
+    config = {
+        'SAMPLE_RATE': 0.0,
+        'DIR': Path(settings.BASE_DIR) / 'profiles',
+        'MAX_BYTES': 50 * 1024 ** 2,
+        'HEADER': 'HTTP_X_SPENDLY_PROFILE',
+        'QUERY_PARAM': '_profile',
+    }
+    config.update(getattr(settings, 'PROFILING', {}))
+    config['DIR'] = Path(config['DIR'])
+    return config
+
+
+class ProfilingMiddleware:
+    """
+    Perfila peticiones con cProfile y guarda un .pstats por petición, con el nombre
+    de la vista y el id del usuario en el nombre del archivo. Configuración:
+        PROFILING = {
+            'SAMPLE_RATE': 0.01,        # Fracción de peticiones perfiladas (0 = ninguna)
+            'DIR': BASE_DIR / 'profiles',
+            'MAX_BYTES': 50 * 1024 ** 2,  # Al superarlo se borran los perfiles más viejos
+            'HEADER': 'HTTP_X_SPENDLY_PROFILE',
+            'QUERY_PARAM': '_profile',
+        }
+    Los usuarios staff pueden pedir el perfil de una petición puntual con el header
+    `X-Spendly-Profile: 1` o con `?_profile=1`. Va después de AuthenticationMiddleware.
+    """
+
+    # cProfile no admite dos perfiles activos a la vez en el mismo proceso
+    _lock = threading.Lock()
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = profiling_config()
+        wanted = self._sampled(config) or (self._requested(request, config) and request.user.is_staff)
+        if not wanted or not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            self._save(request, request.user, profiler, config)
+        finally:
+            self._lock.release()
+        return response
+
+    async def __acall__(self, request):
+        # En una petición async solo se perfila el hilo del event loop (incluye a las
+        # otras peticiones que corren mientras tanto); el ORM aparece como espera
+        config = profiling_config()
+        wanted = self._sampled(config) or (
+            self._requested(request, config) and (await request.auser()).is_staff
+        )
+        if not wanted or not self._lock.acquire(blocking=False):
+            return await self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+            self._save(request, await request.auser(), profiler, config)
+        finally:
+            self._lock.release()
+        return response
+
+    @staticmethod
+    def _sampled(config):
+        return config['SAMPLE_RATE'] > 0 and random.random() < config['SAMPLE_RATE']
+
+    @staticmethod
+    def _requested(request, config):
+        # Primero se mira el header o parámetro, así el usuario solo se carga si hace falta
+        return request.META.get(config['HEADER']) == '1' or request.GET.get(config['QUERY_PARAM']) == '1'
+
+    def _save(self, request, user, profiler, config):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        user_id = user.pk if user.is_authenticated else 'anon'
+        # <fecha>_<vista>_u<usuario>.pstats (profile_summary filtra por estas partes)
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10 ** 6:06d}"
+        filename = f"{stamp}_{slugify(url_name or request.path) or 'root'}_u{user_id}.pstats"
+        directory = config['DIR']
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(directory / filename)
+            self._rotate(directory, config['MAX_BYTES'])
+        except OSError:
+            logger.exception('No se pudo guardar el perfil de %s', request.path)
+
+    @staticmethod
+    def _rotate(directory, max_bytes):
+        # Se borran los perfiles más viejos hasta que el directorio entre en MAX_BYTES
+        files = sorted(directory.glob('*.pstats'), key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in files)
+        for path in files:
+            if total <= max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
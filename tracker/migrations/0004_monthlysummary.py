@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_summaries(apps, schema_editor):
+    # Carga inicial de los acumulados con las transacciones existentes
+    Transaction = apps.get_model('tracker', 'Transaction')
+    MonthlySummary = apps.get_model('tracker', 'MonthlySummary')
+    rows = Transaction.objects \
+        .annotate(month=TruncMonth('date')) \
+        .values('user_id', 'month', 'category_id', 'type') \
+        .annotate(total=Sum('amount'), count=Count('id')) \
+        .order_by()
+    MonthlySummary.objects.bulk_create((MonthlySummary(**row) for row in rows), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0003_budget'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('type', models.CharField(choices=[('ingreso', 'Ingreso'), ('gasto', 'Gasto')], max_length=7)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tracker.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'month', 'category', 'type')},
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
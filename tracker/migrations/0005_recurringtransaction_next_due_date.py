@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:21
+
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+
+
+def set_next_due_dates(apps, schema_editor):
+    # Primer vencimiento desde hoy para los fijos existentes (misma regla que RecurringTransaction.save)
+    RecurringTransaction = apps.get_model('tracker', 'RecurringTransaction')
+    today = datetime.date.today()
+    items = list(RecurringTransaction.objects.all())
+    for item in items:
+        index = 0
+        step = datetime.timedelta(weeks=1) if item.frequency == 'semanal' else relativedelta(months=1)
+        next_due_date = item.start_date
+        while next_due_date < today:
+            index += 1
+            next_due_date = item.start_date + step * index
+        item.next_due_date = next_due_date
+    RecurringTransaction.objects.bulk_update(items, ['next_due_date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0004_monthlysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='next_due_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(set_next_due_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from tracker import search
+    search.install(schema_editor.connection, rebuild=True)
+
+
+def drop_search_index(apps, schema_editor):
+    from tracker import search
+    statements = {
+        'sqlite': [
+            f"DROP TRIGGER IF EXISTS {search.FTS_TABLE}_ai",
+            f"DROP TRIGGER IF EXISTS {search.FTS_TABLE}_ad",
+            f"DROP TRIGGER IF EXISTS {search.FTS_TABLE}_au",
+            f"DROP TABLE IF EXISTS {search.FTS_TABLE}",
+        ],
+        'postgresql': [
+            "DROP INDEX IF EXISTS tx_description_fts_idx",
+            "DROP INDEX IF EXISTS tx_description_trgm_idx",
+        ],
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0006_transaction_indexes'),
+    ]
+
+    operations = [
+        # Índice de texto completo de las descripciones (ver tracker/search.py)
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
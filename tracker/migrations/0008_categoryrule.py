@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_transaction_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('match_type', models.CharField(choices=[('keyword', 'Contiene'), ('regex', 'Expresión regular')], default='keyword', max_length=7)),
+                ('pattern', models.CharField(blank=True, max_length=255)),
+                ('amount_min', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('amount_max', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('priority', models.PositiveSmallIntegerField(default=100)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tracker.category')),
+                ('cuenta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tracker.account')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:46
+
+import datetime
+from decimal import Decimal
+
+import django.db.models.deletion
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def open_current_periods(apps, schema_editor):
+    # Abre el período actual de cada presupuesto con lo ya gastado (misma regla que
+    # budgets.open_period): sin esto el progreso mostraría 0 hasta la próxima escritura
+    # de la categoría. Los presupuestos existentes son todos mensuales (el default de
+    # `period`) y todavía no hay período anterior que arrastrar: el límite es el monto.
+    Budget = apps.get_model('tracker', 'Budget')
+    BudgetPeriod = apps.get_model('tracker', 'BudgetPeriod')
+    BudgetAlert = apps.get_model('tracker', 'BudgetAlert')
+    Transaction = apps.get_model('tracker', 'Transaction')
+    start = datetime.date.today().replace(day=1)
+    end = start + relativedelta(months=1, days=-1)
+    for budget in Budget.objects.all():
+        spent = Transaction.objects.filter(
+            user_id=budget.user_id, category_id=budget.category_id, type='gasto',
+            date__gte=start, date__lte=end,
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        # Avisos al 80% y al 100% del límite
+        reached = [threshold for threshold in (80, 100) if spent * 100 >= budget.amount * threshold]
+        if budget.amount <= 0:
+            reached = [80, 100] if spent > 0 else []
+        period = BudgetPeriod.objects.create(
+            budget=budget, start=start, end=end, limit=budget.amount, spent=spent,
+            alert_level=max(reached, default=0),
+        )
+        BudgetAlert.objects.bulk_create([
+            BudgetAlert(user_id=budget.user_id, period=period, threshold=threshold, spent=spent)
+            for threshold in reached
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_categoryrule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='period',
+            field=models.CharField(choices=[('semanal', 'Semanal'), ('mensual', 'Mensual'), ('anual', 'Anual')], default='mensual', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='budget',
+            name='rollover',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BudgetPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('limit', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('alert_level', models.PositiveSmallIntegerField(default=0)),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='periods', to='tracker.budget')),
+            ],
+            options={
+                'unique_together': {('budget', 'start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BudgetAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.PositiveSmallIntegerField()),
+                ('spent', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('read', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='tracker.budgetperiod')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'read', 'created_at'], name='budget_alert_user_idx')],
+                'unique_together': {('period', 'threshold')},
+            },
+        ),
+        migrations.RunPython(open_current_periods, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, When
+
+
+def build_ledger(apps, schema_editor):
+    """
+    Saldo inicial = saldo actual menos los movimientos; después, el libro por cuenta y día.
+
+    Si el saldo ya tenía diferencias con las transacciones (ediciones viejas sin ajustar,
+    cargas a mano), quedan dentro de ese saldo inicial: no hay otra fuente para separarlas.
+    Por eso también se guarda en inferred_opening: reconcile_balances informa esas cuentas
+    como sin verificar hasta que se confirma el saldo inicial real (--opening), y desde
+    ahí el desvío histórico aparece como una diferencia más.
+    """
+    Account = apps.get_model('tracker', 'Account')
+    BalanceEntry = apps.get_model('tracker', 'BalanceEntry')
+    Transaction = apps.get_model('tracker', 'Transaction')
+    signed_amount = Case(
+        When(type='ingreso', then=F('amount')),
+        default=-F('amount'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    rows = list(
+        Transaction.objects.filter(cuenta__isnull=False)
+        .values('cuenta_id', 'date')
+        .annotate(delta=Sum(signed_amount))
+        .order_by('cuenta_id', 'date')
+    )
+    totals = {}
+    for row in rows:
+        totals[row['cuenta_id']] = totals.get(row['cuenta_id'], 0) + row['delta']
+
+    accounts = list(Account.objects.all())
+    for account in accounts:
+        account.opening_balance = account.balance - totals.get(account.pk, 0)
+        account.inferred_opening = account.opening_balance
+    Account.objects.bulk_update(accounts, ['opening_balance', 'inferred_opening'], batch_size=1000)
+
+    balances = {account.pk: account.opening_balance for account in accounts}
+    entries = []
+    for row in rows:
+        balances[row['cuenta_id']] += row['delta']
+        entries.append(BalanceEntry(
+            account_id=row['cuenta_id'], date=row['date'], delta=row['delta'], balance=balances[row['cuenta_id']],
+        ))
+    BalanceEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_budget_periods'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='inferred_opening',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('delta', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_entries', to='tracker.account')),
+            ],
+            options={
+                'unique_together': {('account', 'date')},
+            },
+        ),
+        migrations.RunPython(build_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='monthlysummary',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tracker.category'),
+        ),
+    ]
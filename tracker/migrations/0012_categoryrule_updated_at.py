@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_monthlysummary_category_set_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoryrule',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_uncategorized(apps, schema_editor):
+    # Une las filas de "Sin Categoría" duplicadas por altas simultáneas antes de la restricción
+    MonthlySummary = apps.get_model('tracker', 'MonthlySummary')
+    duplicated = (
+        MonthlySummary.objects.filter(category__isnull=True)
+        .values('user_id', 'month', 'type')
+        .annotate(rows=Count('id'), keep=Min('id'), total_sum=Sum('total'), count_sum=Sum('count'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in duplicated:
+        rows = MonthlySummary.objects.filter(
+            category__isnull=True, user_id=row['user_id'], month=row['month'], type=row['type'],
+        )
+        rows.exclude(pk=row['keep']).delete()
+        rows.filter(pk=row['keep']).update(total=row['total_sum'], count=row['count_sum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_categoryrule_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_uncategorized, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlysummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user', 'month', 'type'), name='monthly_summary_uncategorized_uniq'),
+        ),
+    ]
@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, IntegrityError, transaction as db_transaction
 from django.contrib.auth.models import User
+import calendar
 import datetime
-from django.db.models import Sum
+from decimal import Decimal
+from django.db.models import Sum, F, Q, Count, Value
+from django.db.models.functions import Coalesce, TruncMonth
 from dateutil.relativedelta import relativedelta
 
 # ===============================
@@ -26,10 +29,43 @@ class Account(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)  # Usuario dueño de la cuenta
     name = models.CharField(max_length=100)  # Ejemplo: "Banco Nación", "Efectivo", "Mercado Pago"
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  # Saldo actual
+    # Saldo antes de cualquier transacción: el saldo actual es este más los movimientos
+    opening_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Saldo inicial deducido por la migración del libro (saldo - movimientos) y todavía sin
+    # confirmar: puede incluir un desvío anterior. None = lo cargó o confirmó el usuario
+    inferred_opening = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Al crearla, el saldo cargado es el saldo inicial
+        if self._state.adding:
+            self.opening_balance = self.balance
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """
+        Aplica al saldo de sus cuentas los pares (transacción, signo) de `changes`: un solo
+        UPDATE por cuenta con el neto, y ninguno si se compensa (por ejemplo, una edición
+        que no cambia el monto). Las cuentas se actualizan en orden de id para que dos
+        escrituras simultáneas las bloqueen en el mismo orden.
+        """
+        deltas = {}
+        for t, sign in changes:
+            if t.cuenta_id:
+                amount = t.amount if t.type == 'ingreso' else -t.amount
+                deltas[t.cuenta_id] = deltas.get(t.cuenta_id, 0) + amount * sign
+        for cuenta_id, delta in sorted(deltas.items()):
+            if delta:
+                cls.objects.filter(pk=cuenta_id).update(balance=F('balance') + delta)
+
+    @classmethod
+    def apply_many(cls, transactions, sign=1):
+        """Aplica (sign=1) o revierte (sign=-1) un lote de transacciones en el saldo de sus cuentas."""
+        cls.apply_changes((t, sign) for t in transactions)
+
 
 # ===============================
 # MODELO: Transaction
@@ -77,6 +113,38 @@ class Transaction(models.Model):
     def __str__(self):
         return f"{self.type} de {self.amount} - {self.user.username}"
 
+    class Meta:
+        # Índices compuestos según las consultas más frecuentes
+        indexes = [
+            # Dashboard, lista paginada por (date, id) y reportes por usuario
+            models.Index(fields=['user', 'date', 'id'], name='tx_user_date_idx'),
+            # Totales de ingresos/gastos de un usuario en un período
+            models.Index(fields=['user', 'type', 'date'], name='tx_user_type_date_idx'),
+            # Resúmenes de tarjeta de crédito (gastos entre cierres)
+            models.Index(fields=['tarjeta_usada', 'type', 'date'], name='tx_card_type_date_idx'),
+            # process_recurring: ¿ya existe la transacción de este fijo en esta fecha?
+            models.Index(fields=['recurring_source', 'date'], name='tx_recurring_date_idx'),
+        ]
+
+
+# ===============================
+# MODELO: BalanceEntry
+# ===============================
+# Libro de saldos: una fila por cuenta y día con movimientos, con el neto del día y el
+# saldo al cierre de ese día. El saldo en cualquier fecha es la última fila hasta esa
+# fecha (una búsqueda por índice), sin sumar el historial. Lo mantiene tracker.ledger.
+class BalanceEntry(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_entries')
+    date = models.DateField()
+    delta = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Neto de los movimientos del día
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Saldo al cierre del día
+
+    def __str__(self):
+        return f"{self.account.name} {self.date}: {self.balance}"
+
+    class Meta:
+        unique_together = ('account', 'date')
+
 
 # ===============================
 # MODELO: RecurringTransaction
@@ -103,9 +171,112 @@ class RecurringTransaction(models.Model):
     start_date = models.DateField()  # Fecha de inicio
     end_date = models.DateField(null=True, blank=True)  # Fecha de fin (opcional)
 
+    # Próxima fecha en la que hay que generar la transacción.
+    # Se avanza cada vez que process_recurring la genera; está indexada para que el
+    # comando solo lea los fijos que vencen y no todos los vigentes.
+    next_due_date = models.DateField(null=True, blank=True, db_index=True)
+
     def __str__(self):
         return f"Fijo: {self.description} ({self.amount})"
 
+    def save(self, *args, **kwargs):
+        # Al crearlo, el primer vencimiento es la primera ocurrencia desde hoy
+        # (no se generan transacciones hacia atrás para fijos con inicio en el pasado)
+        if self.next_due_date is None:
+            today = datetime.date.today()
+            self.next_due_date = self.next_occurrence(max(self.start_date, today) - datetime.timedelta(days=1))
+        super().save(*args, **kwargs)
+
+    def occurrence(self, index):
+        """
+        Fecha de la ocurrencia número `index` (0 = start_date).
+        Siempre se calcula desde start_date: un fijo del 31 cae el 28/29 de febrero
+        y vuelve al 31 en marzo.
+        """
+        if self.frequency == 'semanal':
+            return self.start_date + datetime.timedelta(weeks=index)
+        return self.start_date + relativedelta(months=index)
+
+    def next_occurrence(self, after):
+        """Primera ocurrencia estrictamente posterior a la fecha `after`."""
+        if after < self.start_date:
+            return self.start_date
+        if self.frequency == 'semanal':
+            index = (after - self.start_date).days // 7 + 1
+        else:
+            index = (after.year - self.start_date.year) * 12 + after.month - self.start_date.month
+            if self.occurrence(index) <= after:
+                index += 1
+        return self.occurrence(index)
+
+
+# ===============================
+# CICLOS DE RESUMEN DE TARJETAS
+# ===============================
+def closing_date_in_month(closing_day, year, month):
+    """Fecha de cierre en un mes dado. Si el mes es más corto (ej: cierre 31 en abril), cierra el último día."""
+    last_day = calendar.monthrange(year, month)[1]
+    return datetime.date(year, month, min(max(closing_day, 1), last_day))
+
+
+def statement_closings(closing_day, today=None):
+    """
+    Devuelve las fechas de cierre [anteúltimo, penúltimo, último, próximo] respecto de `today`.
+    El día del cierre todavía pertenece al ciclo abierto (el resumen cierra al terminar el día).
+    """
+    today = today or datetime.date.today()
+    offset = -1 if today <= closing_date_in_month(closing_day, today.year, today.month) else 0
+    closings = []
+    for months in (offset - 2, offset - 1, offset, offset + 1):
+        month = today + relativedelta(day=1, months=months)
+        closings.append(closing_date_in_month(closing_day, month.year, month.month))
+    return closings
+
+
+class CreditCardQuerySet(models.QuerySet):
+    # Nombre de cada anotación y posición de sus cierres en statement_closings()
+    STATEMENTS = (
+        ('previous_statement', 0),  # Resumen anterior
+        ('balance_due', 1),  # Último resumen cerrado (el que hay que pagar)
+        ('next_statement', 2),  # Ciclo abierto (se paga el mes que viene)
+    )
+
+    def with_statements(self, today=None, without_account=False):
+        """
+        Anota en cada tarjeta el total de sus resúmenes con una sola consulta agrupada.
+        Como los cierres dependen del día de cierre de cada tarjeta, cada total se filtra
+        con una condición por ventana de fechas (como máximo una por día del mes).
+        Con `without_account` solo se suman las compras sin cuenta (las que todavía no
+        movieron ningún saldo).
+        """
+        today = today or datetime.date.today()
+        windows = {name: {} for name, _ in self.STATEMENTS}
+        for closing_day in range(1, 32):
+            closings = statement_closings(closing_day, today)
+            for name, index in self.STATEMENTS:
+                window = (closings[index], closings[index + 1])
+                windows[name].setdefault(window, []).append(closing_day)
+
+        purchases = Q(transactions__type='gasto')
+        if without_account:
+            purchases &= Q(transactions__cuenta__isnull=True)
+
+        annotations = {}
+        for name, by_window in windows.items():
+            in_window = Q()
+            for (start, end), closing_days in by_window.items():
+                in_window |= Q(
+                    closing_date__in=closing_days,
+                    transactions__date__gt=start,  # Mayor que (excluye el cierre anterior)
+                    transactions__date__lte=end,  # Menor o igual que (incluye el cierre)
+                )
+            annotations[name] = Coalesce(
+                Sum('transactions__amount', filter=purchases & in_window),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        return self.annotate(**annotations)
+
 
 # ===============================
 # MODELO: CreditCard
@@ -119,7 +290,10 @@ class CreditCard(models.Model):
     closing_date = models.IntegerField(default=1)  # Día del mes en que cierra el resumen (ej: 25)
     due_date = models.IntegerField()  # Día del mes en que vence el pago (ej: 10)
     
-    # Ya no se guarda el balance_due: se calcula dinámicamente
+    # Ya no se guarda el balance_due: se calcula dinámicamente.
+    # Para listados usar CreditCard.objects.with_statements(), que lo calcula para todas
+    # las tarjetas en una sola consulta.
+    objects = CreditCardQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -132,19 +306,14 @@ class CreditCard(models.Model):
         Busca el último resumen cerrado y suma los gastos hechos entre ese
         y el cierre anterior.
         """
-        today = datetime.date.today()
+        # Si la tarjeta viene de with_statements() el total ya está calculado
+        if hasattr(self, 'balance_due'):
+            return self.balance_due
 
-        # 1. Determinar la fecha del último cierre
-        # Ejemplo: si hoy es 4/Nov y el cierre es 25 → el último fue 25/Oct.
-        if today.day <= self.closing_date:
-            last_closing_date = today.replace(day=self.closing_date) - relativedelta(months=1)
-        else:
-            last_closing_date = today.replace(day=self.closing_date)
-        
-        # 2. Fecha del cierre anterior
-        previous_closing_date = last_closing_date - relativedelta(months=1)
+        # Ejemplo: si hoy es 4/Nov y el cierre es 25 → el último fue 25/Oct y el anterior 25/Sep.
+        _, previous_closing_date, last_closing_date, _ = statement_closings(self.closing_date)
 
-        # 3. Sumar los gastos hechos entre esos dos cierres
+        # Sumar los gastos hechos entre esos dos cierres
         balance = self.transactions.filter(
             date__gt=previous_closing_date,  # Mayor que (excluye la fecha anterior)
             date__lte=last_closing_date,     # Menor o igual que (incluye el cierre)
@@ -160,9 +329,17 @@ class CreditCard(models.Model):
 # Permite establecer un presupuesto mensual por categoría.
 # Por ejemplo: "Comida - $20.000" o "Entretenimiento - $10.000".
 class Budget(models.Model):
+    PERIOD_CHOICES = (
+        ('semanal', 'Semanal'),
+        ('mensual', 'Mensual'),
+        ('anual', 'Anual'),
+    )
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)  # Usuario al que pertenece
     category = models.ForeignKey(Category, on_delete=models.CASCADE)  # Categoría asignada
-    amount = models.DecimalField(max_digits=10, decimal_places=2)  # Monto límite mensual
+    amount = models.DecimalField(max_digits=10, decimal_places=2)  # Monto límite del período
+    period = models.CharField(max_length=7, choices=PERIOD_CHOICES, default='mensual')  # Duración de cada período
+    rollover = models.BooleanField(default=False)  # Si lo no gastado pasa al período siguiente
 
     def __str__(self):
         return f"Presupuesto de {self.category.name} - {self.user.username}"
@@ -170,3 +347,217 @@ class Budget(models.Model):
     class Meta:
         # Evita presupuestos duplicados en la misma categoría y usuario
         unique_together = ('user', 'category')
+
+    def period_bounds(self, date):
+        """Primer y último día del período del presupuesto que contiene a `date`."""
+        if self.period == 'semanal':
+            start = date - datetime.timedelta(days=date.weekday())
+            return start, start + datetime.timedelta(days=6)
+        if self.period == 'anual':
+            return date.replace(month=1, day=1), date.replace(month=12, day=31)
+        start = date.replace(day=1)
+        return start, start + relativedelta(months=1, days=-1)
+
+
+# ===============================
+# MODELO: BudgetPeriod
+# ===============================
+# Un período concreto de un presupuesto (una semana, un mes o un año) con lo gastado
+# hasta ahora. `spent` es un contador: se actualiza con cada alta, edición o baja de
+# un gasto de la categoría (ver tracker/budgets.py), así que mostrar el progreso de los
+# presupuestos nunca recorre transacciones.
+class BudgetPeriod(models.Model):
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name='periods')  # Presupuesto
+    start = models.DateField()  # Primer día del período
+    end = models.DateField()  # Último día del período
+    limit = models.DecimalField(max_digits=12, decimal_places=2)  # Monto del presupuesto más lo arrastrado
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Gastado en el período
+    alert_level = models.PositiveSmallIntegerField(default=0)  # Mayor umbral (%) alcanzado y avisado
+
+    def __str__(self):
+        return f"{self.budget} ({self.start:%d/%m/%Y} - {self.end:%d/%m/%Y})"
+
+    class Meta:
+        unique_together = ('budget', 'start')
+
+
+# ===============================
+# MODELO: BudgetAlert
+# ===============================
+# Aviso de que un período de presupuesto superó un umbral (80% o 100%). Se registra en
+# el momento de la escritura que lo hizo cruzar, una sola vez por período y umbral.
+class BudgetAlert(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)  # Usuario a avisar
+    period = models.ForeignKey(BudgetPeriod, on_delete=models.CASCADE, related_name='alerts')  # Período alcanzado
+    threshold = models.PositiveSmallIntegerField()  # Umbral cruzado (%)
+    spent = models.DecimalField(max_digits=14, decimal_places=2)  # Gastado al momento del aviso
+    created_at = models.DateTimeField(auto_now_add=True)  # Cuándo se cruzó
+    read = models.BooleanField(default=False)  # Si el usuario ya lo vio
+
+    def __str__(self):
+        return f"{self.period.budget}: {self.threshold}%"
+
+    class Meta:
+        unique_together = ('period', 'threshold')
+        indexes = [
+            # Avisos sin leer del usuario
+            models.Index(fields=['user', 'read', 'created_at'], name='budget_alert_user_idx'),
+        ]
+
+
+# ===============================
+# MODELO: CategoryRule
+# ===============================
+# Regla de categorización automática: si la descripción contiene una palabra (o coincide
+# con una expresión regular) y el monto está en el rango, se asigna la categoría y/o la
+# cuenta. Solo completa los campos que la transacción trae vacíos. Ver tracker/categorization.py
+class CategoryRule(models.Model):
+    MATCH_CHOICES = (
+        ('keyword', 'Contiene'),
+        ('regex', 'Expresión regular'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)  # Usuario dueño de la regla
+    match_type = models.CharField(max_length=7, choices=MATCH_CHOICES, default='keyword')  # Cómo se compara el texto
+    pattern = models.CharField(max_length=255, blank=True)  # Texto a buscar en la descripción (vacío = cualquiera)
+    amount_min = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Monto mínimo (opcional)
+    amount_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Monto máximo (opcional)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)  # Categoría a asignar
+    cuenta = models.ForeignKey(Account, on_delete=models.CASCADE, null=True, blank=True)  # Cuenta a asignar
+    priority = models.PositiveSmallIntegerField(default=100)  # Menor = se evalúa primero
+    updated_at = models.DateTimeField(auto_now=True)  # Versión de las reglas compiladas (ver categorization)
+
+    def __str__(self):
+        return f"Regla '{self.pattern}' - {self.user.username}"
+
+
+# ===============================
+# MODELO: MonthlySummary
+# ===============================
+# Acumulado mensual de transacciones por usuario, categoría y tipo.
+# Se actualiza de forma incremental con cada alta, edición o baja de una transacción,
+# así el dashboard lee unas pocas filas en lugar de recorrer todo el historial.
+# Se puede reconstruir desde cero con: python manage.py rebuild_summaries
+class MonthlySummary(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)  # Usuario dueño del acumulado
+    month = models.DateField()  # Primer día del mes acumulado
+    # None = Sin Categoría. Al borrar una categoría sus filas se suman a las de None (ver uncategorize)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    type = models.CharField(max_length=7, choices=Transaction.TYPE_CHOICES)  # Ingreso o gasto
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Suma de los montos del mes
+    count = models.IntegerField(default=0)  # Cantidad de transacciones acumuladas
+
+    def __str__(self):
+        return f"{self.type} {self.month:%m/%Y}: {self.total} - {self.user.username}"
+
+    class Meta:
+        unique_together = ('user', 'month', 'category', 'type')
+        constraints = [
+            # Con category NULL unique_together no aplica (NULL no es igual a NULL): sin esta
+            # restricción dos altas simultáneas crearían dos filas de "Sin Categoría"
+            models.UniqueConstraint(
+                fields=['user', 'month', 'type'], condition=Q(category__isnull=True),
+                name='monthly_summary_uncategorized_uniq',
+            ),
+        ]
+
+    @classmethod
+    def record(cls, user_id, date, category_id, type, amount, count=1):
+        """
+        Suma `amount` (y `count`) al acumulado del mes de `date`.
+        Para revertir una transacción se pasan amount y count negativos.
+        """
+        lookup = {
+            'user_id': user_id,
+            'month': date.replace(day=1),
+            'category_id': category_id,
+            'type': type,
+        }
+        changes = {'total': F('total') + amount, 'count': F('count') + count}
+
+        # Caso común: la fila del mes ya existe y se actualiza en un solo UPDATE
+        if cls.objects.filter(**lookup).update(**changes):
+            return
+        try:
+            with db_transaction.atomic():
+                cls.objects.create(total=amount, count=count, **lookup)
+        except IntegrityError:
+            # Otra petición creó la fila al mismo tiempo: la actualizamos
+            cls.objects.filter(**lookup).update(**changes)
+
+    @classmethod
+    def apply(cls, transaction, sign=1):
+        """Agrega (sign=1) o revierte (sign=-1) una transacción en el acumulado."""
+        cls.record(
+            transaction.user_id,
+            transaction.date,
+            transaction.category_id,
+            transaction.type,
+            transaction.amount * sign,
+            count=sign,
+        )
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """
+        Aplica los pares (transacción, signo) de `changes`: se agrupan en memoria y se hace
+        una sola actualización por (usuario, mes, categoría, tipo) que no quede en cero.
+        """
+        deltas = {}
+        for t, sign in changes:
+            key = (t.user_id, t.date.replace(day=1), t.category_id, t.type)
+            total, count = deltas.get(key, (0, 0))
+            deltas[key] = (total + t.amount * sign, count + sign)
+
+        for (user_id, month, category_id, type), (total, count) in deltas.items():
+            if total or count:
+                cls.record(user_id, month, category_id, type, total, count=count)
+
+    @classmethod
+    def apply_many(cls, transactions, sign=1):
+        """Agrega (sign=1) o revierte (sign=-1) un lote de transacciones."""
+        cls.apply_changes((t, sign) for t in transactions)
+
+    @classmethod
+    def uncategorize(cls, category):
+        """
+        Pasa los acumulados de `category` a "Sin Categoría", como sus transacciones al
+        borrarla: cada fila se suma a la del mismo mes y tipo sin categoría. Corre en el
+        pre_delete de Category (ver apps.py), dentro de la transacción del borrado, así
+        el SET_NULL ya no encuentra filas que duplicarían las de "Sin Categoría".
+        """
+        rows = cls.objects.filter(category=category)
+        for user_id, month, type, total, count in rows.values_list('user_id', 'month', 'type', 'total', 'count'):
+            cls.record(user_id, month, None, type, total, count=count)
+        rows.delete()
+
+    @classmethod
+    def category_deleted(cls, sender, instance, **kwargs):
+        """pre_delete de Category: desde la vista, el admin o cualquier borrado."""
+        cls.uncategorize(instance)
+
+    @classmethod
+    def rebuild(cls, users=None):
+        """
+        Recalcula los acumulados desde la tabla de transacciones con una sola consulta
+        agrupada. Si se pasa `users` solo se reconstruyen esos usuarios.
+        """
+        summaries = cls.objects.all()
+        transactions = Transaction.objects.all()
+        if users is not None:
+            summaries = summaries.filter(user__in=users)
+            transactions = transactions.filter(user__in=users)
+
+        rows = transactions \
+            .annotate(month=TruncMonth('date')) \
+            .values('user_id', 'month', 'category_id', 'type') \
+            .annotate(total=Sum('amount'), count=Count('id')) \
+            .order_by()
+
+        with db_transaction.atomic():
+            summaries.delete()
+            created = cls.objects.bulk_create(
+                (cls(**row) for row in rows),
+                batch_size=1000,
+            )
+        return len(created)
@@ -0,0 +1,174 @@
+"""
+Conciliación de los saldos de las cuentas con sus transacciones.
+
+El saldo correcto de una cuenta es su saldo inicial más el neto de sus transacciones.
+Por cada rango de usuarios una sola consulta agrupada calcula ese saldo para todas
+las cuentas, y se informan las que no coinciden con Account.balance o con la última
+fila del libro de saldos (tracker.ledger). Con `fix` los saldos se corrigen con un
+UPDATE por lote (sumando la diferencia, así una escritura simultánea no se pierde) y
+el libro de esos usuarios se reconstruye.
+
+Las cuentas que ya existían antes del libro de saldos tomaron como saldo inicial el
+saldo de ese momento menos sus movimientos (migración 0010), así que un desvío anterior
+quedó dentro del saldo inicial. Esas cuentas se informan como sin verificar hasta que
+se confirma el saldo inicial real con set_opening_balance(): desde ahí el desvío
+histórico aparece como una diferencia más (y --fix lo corrige).
+
+Como process_recurring, el trabajo se divide por rangos de id de usuario para
+repartirlo entre varios procesos.
+"""
+import math
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Max, Min, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import ledger
+from .cache import bump_data_version
+from .models import Account, BalanceEntry
+
+# Cuentas por UPDATE al corregir saldos
+BATCH_SIZE = 500
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENTS = Decimal('0.01')
+
+
+@dataclass
+class Mismatch:
+    account_id: int
+    user_id: int
+    name: str
+    balance: Decimal  # Account.balance
+    ledger_balance: Decimal  # Última fila del libro (o el saldo inicial)
+    expected: Decimal  # Saldo inicial + neto de las transacciones
+
+    @property
+    def delta(self):
+        return self.expected - self.balance
+
+
+@dataclass
+class UnverifiedOpening:
+    account_id: int
+    user_id: int
+    name: str
+    opening_balance: Decimal  # Deducido por la migración 0010: puede incluir un desvío anterior
+
+
+@dataclass
+class ReconcileResult:
+    user_range: tuple = None
+    accounts: int = 0
+    fixed: int = 0
+    elapsed: float = 0.0
+    mismatches: list = field(default_factory=list)
+    unverified: list = field(default_factory=list)
+
+
+def user_ranges(shards):
+    """Divide los ids de usuario con cuentas en `shards` rangos contiguos."""
+    bounds = Account.objects.aggregate(first=Min('user_id'), last=Max('user_id'))
+    if bounds['first'] is None:
+        return []
+    step = math.ceil((bounds['last'] - bounds['first'] + 1) / shards)
+    return [
+        (start, min(start + step - 1, bounds['last']))
+        for start in range(bounds['first'], bounds['last'] + 1, step)
+    ]
+
+
+def _accounts(user_range):
+    accounts = Account.objects.all()
+    if user_range:
+        first_user_id, last_user_id = user_range
+        accounts = accounts.filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+    return accounts
+
+
+def mismatches(user_range=None):
+    """
+    Cuentas del rango cuyo saldo o libro no coincide con sus transacciones. Una sola
+    consulta: las cuentas unidas a sus transacciones, agrupadas por cuenta.
+    """
+    movements = Coalesce(
+        Sum(Case(
+            When(transaction__type='ingreso', then=F('transaction__amount')),
+            When(transaction__type='gasto', then=-F('transaction__amount')),
+            output_field=MONEY,
+        )),
+        Value(Decimal('0.00')),
+        output_field=MONEY,
+    )
+    last_entry = BalanceEntry.objects.filter(account=OuterRef('pk')).order_by('-date').values('balance')[:1]
+    rows = _accounts(user_range) \
+        .annotate(
+            expected=F('opening_balance') + movements,
+            ledger_balance=Coalesce(Subquery(last_entry, output_field=MONEY), F('opening_balance'), output_field=MONEY),
+        ) \
+        .order_by('pk') \
+        .values_list('pk', 'user_id', 'name', 'balance', 'ledger_balance', 'expected')
+
+    # Se compara en Python, redondeado a centavos: SQLite suma los decimales como float
+    found = []
+    for account_id, user_id, name, *amounts in rows.iterator():
+        balance, ledger_balance, expected = (Decimal(amount).quantize(CENTS) for amount in amounts)
+        if balance != expected or ledger_balance != expected:
+            found.append(Mismatch(account_id, user_id, name, balance, ledger_balance, expected))
+    return found
+
+
+def unverified_openings(user_range=None):
+    """Cuentas del rango con el saldo inicial deducido al crear el libro, sin confirmar."""
+    rows = _accounts(user_range).filter(inferred_opening__isnull=False).order_by('pk') \
+        .values_list('pk', 'user_id', 'name', 'inferred_opening')
+    return [UnverifiedOpening(*row) for row in rows]
+
+
+def set_opening_balance(account_id, amount):
+    """
+    Confirma el saldo inicial real de la cuenta (por ejemplo, el del extracto del banco) y
+    reconstruye su libro. El saldo guardado no se toca: si no coincide, la conciliación lo
+    informa con la diferencia exacta.
+    """
+    with db_transaction.atomic():
+        account = Account.objects.select_for_update().get(pk=account_id)
+        account.opening_balance = amount
+        account.inferred_opening = None
+        account.save(update_fields=['opening_balance', 'inferred_opening'])
+        ledger.rebuild(users=[account.user_id])
+    bump_data_version(account.user_id)
+
+
+def fix(found):
+    """Corrige los saldos y reconstruye el libro de los usuarios de `found`."""
+    wrong = [mismatch for mismatch in found if mismatch.delta]
+    with db_transaction.atomic():
+        for start in range(0, len(wrong), BATCH_SIZE):
+            batch = wrong[start:start + BATCH_SIZE]
+            Account.objects.filter(pk__in=[mismatch.account_id for mismatch in batch]).update(
+                balance=F('balance') + Case(
+                    *(When(pk=mismatch.account_id, then=Value(mismatch.delta)) for mismatch in batch),
+                    output_field=MONEY,
+                ),
+            )
+        user_ids = sorted({mismatch.user_id for mismatch in found})
+        ledger.rebuild(users=user_ids)
+    bump_data_version(*user_ids)
+
+
+def reconcile_shard(user_range=None, apply_fix=False):
+    """Busca (y con `apply_fix` corrige) los saldos mal guardados del rango de usuarios."""
+    start = time.perf_counter()
+    result = ReconcileResult(user_range=user_range)
+    result.accounts = _accounts(user_range).count()
+    result.mismatches = mismatches(user_range)
+    result.unverified = unverified_openings(user_range)
+    if apply_fix and result.mismatches:
+        fix(result.mismatches)
+        result.fixed = len(result.mismatches)
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,132 @@
+"""
+Generación de transacciones a partir de los ingresos/gastos fijos (RecurringTransaction).
+
+Cada fijo guarda su próximo vencimiento (next_due_date, indexado), así que el comando
+solo lee los fijos que vencen y genera en una pasada todas las ocurrencias pendientes,
+incluidas las de días en que no corrió. Todo se resuelve por conjuntos: una consulta
+trae los fijos vencidos, otra las transacciones que ya existían y las nuevas se insertan
+con bulk_create. El trabajo se puede dividir por rangos de id de usuario para repartirlo
+entre varios procesos.
+"""
+import math
+import time
+from dataclasses import dataclass, field
+
+import django
+from django.db import connections, transaction as db_transaction
+from django.db.models import F, Max, Min, Q
+
+from . import services
+from .cache import bump_data_version
+from .models import RecurringTransaction, Transaction
+
+# Cantidad de filas por INSERT en bulk_create
+BATCH_SIZE = 1000
+
+
+@dataclass
+class ShardResult:
+    user_range: tuple = None
+    due: int = 0
+    created: int = 0
+    existing: int = 0
+    elapsed: float = 0.0
+    messages: list = field(default_factory=list)
+
+
+def due_rules(today, user_range=None):
+    """Fijos con vencimientos pendientes hasta `today` (usa el índice de next_due_date)."""
+    rules = RecurringTransaction.objects.filter(
+        next_due_date__lte=today
+    ).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=F('next_due_date'))
+    )
+    if user_range:
+        first_user_id, last_user_id = user_range
+        rules = rules.filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+    return rules
+
+
+def user_ranges(today, shards):
+    """Divide los ids de usuario con fijos vencidos en `shards` rangos contiguos."""
+    bounds = due_rules(today).aggregate(first=Min('user_id'), last=Max('user_id'))
+    if bounds['first'] is None:
+        return []
+    step = math.ceil((bounds['last'] - bounds['first'] + 1) / shards)
+    return [
+        (start, min(start + step - 1, bounds['last']))
+        for start in range(bounds['first'], bounds['last'] + 1, step)
+    ]
+
+
+def process_shard(today, user_range=None, dry_run=False, verbose=False):
+    """
+    Crea las transacciones pendientes hasta `today` para los fijos del rango de usuarios
+    indicado (o de todos si `user_range` es None) y avanza su next_due_date.
+    Con `dry_run` no se guarda nada.
+    """
+    start = time.perf_counter()
+    result = ShardResult(user_range=user_range)
+
+    due = due_rules(today, user_range)
+    rules = list(due.select_related('user') if verbose else due)
+    if not rules:
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    # Una sola consulta para saber qué ocurrencias pendientes ya tienen su transacción
+    already_created = set(
+        Transaction.objects.filter(
+            recurring_source__in=due.values('pk'),
+            date__gte=min(item.next_due_date for item in rules),
+            date__lte=today,
+        ).values_list('recurring_source_id', 'date')
+    )
+
+    new_transactions = []
+    for item in rules:
+        last_day = min(today, item.end_date) if item.end_date else today
+        occurrence = item.next_due_date
+
+        # Se generan todas las ocurrencias atrasadas (días en que el comando no corrió)
+        while occurrence <= last_day:
+            if (item.pk, occurrence) in already_created:
+                result.existing += 1
+                if verbose:
+                    result.messages.append(f"Ya existía transacción del {occurrence} para '{item.description}' del usuario {item.user.username}")
+            else:
+                new_transactions.append(Transaction(
+                    user_id=item.user_id,
+                    type=item.type,
+                    amount=item.amount,
+                    category_id=item.category_id,
+                    description=item.description,  # Usamos la misma descripción
+                    date=occurrence,
+                    recurring_source_id=item.pk,  # ¡La vinculamos!
+                ))
+                if verbose:
+                    prefix = 'Se crearía' if dry_run else 'Creada'
+                    result.messages.append(f"{prefix} transacción del {occurrence} para '{item.description}' del usuario {item.user.username}")
+            occurrence = item.next_occurrence(occurrence)
+
+        item.next_due_date = occurrence
+
+    if not dry_run:
+        with db_transaction.atomic():
+            # Las reglas de cada usuario completan categoría y cuenta; los fijos no tienen
+            # cuenta, así que solo mueven saldo si una regla les asignó una
+            services.create_transactions(new_transactions)
+            RecurringTransaction.objects.bulk_update(rules, ['next_due_date'], batch_size=BATCH_SIZE)
+        bump_data_version(*(t.user_id for t in new_transactions))
+
+    result.due = len(rules)
+    result.created = len(new_transactions)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def init_worker():
+    """Inicializa Django en cada proceso del pool sin reutilizar conexiones heredadas."""
+    django.setup()
+    for connection in connections.all():
+        connection.close()
@@ -0,0 +1,105 @@
+"""
+Datos de referencia del usuario (categorías, tarjetas y cuentas) cargados una sola
+vez por petición.
+
+Los formularios y las vistas de una misma petición comparten la misma instancia
+(ver for_request), así cada lista se consulta una vez aunque la usen varios
+campos de formulario y la plantilla.
+"""
+import asyncio
+
+from django.forms.models import ModelChoiceIterator
+
+from .models import Account, Category, CreditCard
+
+
+class UserReferenceData:
+    """Listas de categorías, tarjetas y cuentas del usuario, consultadas al primer uso."""
+
+    MODELS = {
+        'categories': Category,
+        'cards': CreditCard,
+        'accounts': Account,
+    }
+
+    def __init__(self, user):
+        self.user = user
+        self._loaded = {}
+
+    def queryset(self, name):
+        return self.MODELS[name].objects.filter(user=self.user)
+
+    def _load(self, name):
+        if name not in self._loaded:
+            self._loaded[name] = list(self.queryset(name))
+        return self._loaded[name]
+
+    @property
+    def categories(self):
+        return self._load('categories')
+
+    @property
+    def cards(self):
+        return self._load('cards')
+
+    @property
+    def accounts(self):
+        return self._load('accounts')
+
+    async def aload(self, *names):
+        """
+        Para vistas async: carga con el ORM async (en paralelo) las listas pedidas que
+        todavía no estén cargadas. Después se pueden usar sin consultar.
+        """
+        missing = [name for name in names if name not in self._loaded]
+        results = await asyncio.gather(*(
+            self._afetch(name) for name in missing
+        ))
+        self._loaded.update(zip(missing, results))
+
+    async def _afetch(self, name):
+        return [obj async for obj in self.queryset(name)]
+
+    def prime(self, **objects):
+        """Usa listas ya obtenidas por otra consulta (por ejemplo, desde la caché del dashboard)."""
+        self._loaded.update({name: list(items) for name, items in objects.items()})
+
+    def limit_choices(self, field, name):
+        """Limita un ModelChoiceField a los objetos `name` del usuario, sin volver a consultarlos."""
+        set_choices(field, self.queryset(name), self._load(name))
+
+
+def for_request(request):
+    """Devuelve (y guarda en la petición) los datos de referencia del usuario logueado."""
+    reference = getattr(request, '_spendly_reference', None)
+    if reference is None or reference.user != request.user:
+        reference = UserReferenceData(request.user)
+        request._spendly_reference = reference
+    return reference
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """Opciones de un ModelChoiceField tomadas de una lista ya cargada, sin consultar."""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.cached_objects:
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.cached_objects) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.cached_objects)
+
+
+def set_choices(field, queryset, objects):
+    """
+    Limita un ModelChoiceField a `queryset` (se sigue usando para validar lo enviado)
+    y arma sus opciones con `objects`, la misma lista ya cargada.
+    """
+    field.cached_objects = objects
+    field.iterator = CachedModelChoiceIterator
+    # Asignar el queryset vuelve a armar las opciones del widget con el iterador de arriba
+    field.queryset = queryset
@@ -0,0 +1,242 @@
+"""
+Informes de ingresos y gastos por período.
+
+Un informe cubre cualquier rango de fechas con granularidad diaria, semanal, mensual o
+anual, extendido a períodos completos (del 15/06 al 20/06 por mes es todo junio). Una
+sola consulta agrupada trae los totales crudos por período (incluido el año anterior,
+para la comparación interanual) y después las series derivadas (neto, neto acumulado,
+promedio móvil, tasa de ahorro y variación interanual) se calculan columna por columna
+sobre listas alineadas, sin recorrer mes a mes con diccionarios.
+
+Por mes y por año se lee MonthlySummary (unas pocas filas por mes), así que un informe
+mensual de 10 años cuesta casi lo mismo que el de un año. Por día y por semana se
+agrupa directamente Transaction (usa el índice de usuario y fecha).
+
+La evolución de los saldos (por cuenta y patrimonio total) sale del libro de saldos
+(tracker.ledger): el saldo al cierre de cada período, sin sumar el historial.
+"""
+import datetime
+from itertools import accumulate
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncWeek, TruncYear
+
+from . import ledger
+from .models import MonthlySummary, Transaction
+
+GRANULARITY_CHOICES = (
+    ('day', 'Día'),
+    ('week', 'Semana'),
+    ('month', 'Mes'),
+    ('year', 'Año'),
+)
+
+# Cantidad máxima de períodos de un informe (por ejemplo, ~13 años por día)
+MAX_BUCKETS = 5000
+
+# Períodos que se promedian para el promedio móvil del neto
+DEFAULT_ROLLING_WINDOW = 3
+
+MONTH_LABELS = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+
+def bucket_start(date, granularity):
+    """Primer día del período que contiene a `date`."""
+    if granularity == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if granularity == 'month':
+        return date.replace(day=1)
+    if granularity == 'year':
+        return date.replace(month=1, day=1)
+    return date
+
+
+def bucket_end(date, granularity):
+    """Último día del período que contiene a `date`."""
+    return bucket_start(date, granularity) + _step(granularity) - datetime.timedelta(days=1)
+
+
+def _step(granularity):
+    return {
+        'day': relativedelta(days=1),
+        'week': relativedelta(weeks=1),
+        'month': relativedelta(months=1),
+        'year': relativedelta(years=1),
+    }[granularity]
+
+
+def _year_before(granularity):
+    # Desplazamiento del período equivalente del año anterior (las semanas, de a 52)
+    return relativedelta(weeks=52) if granularity == 'week' else relativedelta(years=1)
+
+
+def bucket_starts(date_from, date_to, granularity):
+    """Inicio de cada período entre `date_from` y `date_to`, sin huecos."""
+    step = _step(granularity)
+    current = bucket_start(date_from, granularity)
+    starts = []
+    while current <= date_to:
+        starts.append(current)
+        current += step
+    return starts
+
+
+def bucket_ends(date_from, date_to, granularity):
+    """Último día de cada período entre `date_from` y `date_to` (el último, `date_to`)."""
+    return [min(bucket_end(start, granularity), date_to) for start in bucket_starts(date_from, date_to, granularity)]
+
+
+def snap_range(date_from, date_to, granularity):
+    """
+    Extiende el rango al inicio del período de `date_from` y al fin del de `date_to`.
+    Los informes siempre cubren períodos completos: por mes y por año los acumulados
+    (MonthlySummary) no se pueden cortar a mitad de mes, así que por día y por semana
+    se sigue la misma regla.
+    """
+    return bucket_start(date_from, granularity), bucket_end(date_to, granularity)
+
+
+def bucket_count(date_from, date_to, granularity):
+    """Cantidad de períodos del rango, sin armar la lista (para validar el rango)."""
+    first = bucket_start(date_from, granularity)
+    last = bucket_start(date_to, granularity)
+    if granularity == 'day':
+        return (last - first).days + 1
+    if granularity == 'week':
+        return (last - first).days // 7 + 1
+    if granularity == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return last.year - first.year + 1
+
+
+def bucket_queryset(user, date_from, date_to, granularity, compare=True):
+    """
+    Consulta agrupada con los totales de ingresos y gastos por período entre `date_from`
+    y `date_to` (y, con `compare`, también los del año anterior). Cada fila tiene
+    `bucket`, `ingreso` y `gasto`. Los períodos de los extremos se cuentan completos,
+    con cualquier granularidad (ver snap_range).
+    """
+    first = bucket_start(date_from, granularity)
+    last = bucket_end(date_to, granularity)
+    if compare:
+        first -= _year_before(granularity)
+
+    if granularity in ('month', 'year'):
+        # Los acumulados ya están por mes: alcanza con agrupar esas filas
+        rows = MonthlySummary.objects.filter(user=user, month__gte=first, month__lte=last)
+        bucket = TruncYear('month') if granularity == 'year' else F('month')
+        amount = 'total'
+    else:
+        rows = Transaction.objects.filter(user=user, date__gte=first, date__lte=last)
+        bucket = TruncWeek('date') if granularity == 'week' else F('date')
+        amount = 'amount'
+
+    return (
+        rows.values(bucket=bucket)
+        .annotate(
+            ingreso=Sum(amount, filter=Q(type='ingreso')),
+            gasto=Sum(amount, filter=Q(type='gasto')),
+        )
+        .order_by('bucket')
+    )
+
+
+def _label(start, granularity):
+    if granularity == 'year':
+        return str(start.year)
+    if granularity == 'month':
+        return f'{MONTH_LABELS[start.month - 1]} {start.year}'
+    if granularity == 'week':
+        return f'Sem {start:%d/%m/%Y}'
+    return f'{start:%d/%m/%Y}'
+
+
+def _rolling_mean(values, window):
+    # Promedio de los últimos `window` valores, con sumas acumuladas (una sola pasada)
+    sums = [0.0, *accumulate(values)]
+    return [
+        round((sums[i + 1] - sums[max(0, i + 1 - window)]) / min(i + 1, window), 2)
+        for i in range(len(values))
+    ]
+
+
+def _percent(part, whole):
+    return round(part / whole * 100, 1) if whole else None
+
+
+def build_series(rows, date_from, date_to, granularity, compare=True, rolling_window=DEFAULT_ROLLING_WINDOW):
+    """
+    Arma las series del informe a partir de las filas de bucket_queryset. Todas las
+    series quedan alineadas con `labels` (un valor por período, 0 si no hubo movimientos).
+    """
+    starts = bucket_starts(date_from, date_to, granularity)
+    by_bucket = {}
+    for row in rows:
+        bucket = row['bucket']
+        if isinstance(bucket, datetime.datetime):
+            bucket = bucket.date()
+        by_bucket[bucket] = (float(row['ingreso'] or 0), float(row['gasto'] or 0))
+
+    empty = (0.0, 0.0)
+    ingresos, gastos = zip(*(by_bucket.get(start, empty) for start in starts)) if starts else ((), ())
+    ingresos, gastos = list(ingresos), list(gastos)
+    net = [round(i - g, 2) for i, g in zip(ingresos, gastos)]
+
+    series = {
+        'granularity': granularity,
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'labels': [_label(start, granularity) for start in starts],
+        'ingresos': ingresos,
+        'gastos': gastos,
+        'net': net,
+        'cumulative_net': [round(value, 2) for value in accumulate(net)],
+        'rolling_net': _rolling_mean(net, rolling_window),
+        'rolling_window': rolling_window,
+        'savings_rate': [_percent(n, i) for n, i in zip(net, ingresos)],
+        'totals': {
+            'ingresos': round(sum(ingresos), 2),
+            'gastos': round(sum(gastos), 2),
+            'net': round(sum(net), 2),
+            'savings_rate': _percent(sum(net), sum(ingresos)),
+        },
+    }
+
+    if compare:
+        shift = _year_before(granularity)
+        previous_ingresos, previous_gastos = (
+            list(values) for values in zip(*(by_bucket.get(start - shift, empty) for start in starts))
+        ) if starts else ([], [])
+        series.update({
+            'previous_ingresos': previous_ingresos,
+            'previous_gastos': previous_gastos,
+            'yoy_ingresos': [_percent(c - p, p) for c, p in zip(ingresos, previous_ingresos)],
+            'yoy_gastos': [_percent(c - p, p) for c, p in zip(gastos, previous_gastos)],
+        })
+        series['totals'].update({
+            'previous_ingresos': round(sum(previous_ingresos), 2),
+            'previous_gastos': round(sum(previous_gastos), 2),
+        })
+    return series
+
+
+def build_balance_series(accounts, entries, date_from, date_to, granularity):
+    """
+    Saldo de cada cuenta y patrimonio total al cierre de cada período. `accounts` viene
+    de ledger.with_balance_before() con el inicio del primer período y `entries` son las
+    filas del libro desde ese día hasta `date_to`.
+    """
+    ends = bucket_ends(date_from, date_to, granularity)
+    accounts = list(accounts)
+    balances = ledger.balance_series(accounts, entries, ends)
+    rows = [
+        {'id': account.pk, 'name': account.name, 'balances': [float(balance) for balance in balances[account.pk]]}
+        for account in accounts
+    ]
+    return {
+        'granularity': granularity,
+        'labels': [_label(start, granularity) for start in bucket_starts(date_from, date_to, granularity)],
+        'accounts': rows,
+        'net_worth': [round(sum(values), 2) for values in zip(*(row['balances'] for row in rows))] if rows else [0.0] * len(ends),
+    }
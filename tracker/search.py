@@ -0,0 +1,147 @@
+"""
+Búsqueda de texto sobre las descripciones de las transacciones.
+
+La búsqueda usa un índice de texto completo, nunca `description__icontains` (que
+recorre todas las transacciones del usuario):
+
+- SQLite: tabla virtual FTS5 (tracker_transaction_fts) con el contenido de
+  Transaction.description, mantenida por triggers. Ranking con bm25.
+- PostgreSQL: índice GIN sobre to_tsvector('spanish', description) y un índice de
+  trigramas (pg_trgm) para coincidencias dentro de una palabra. Ranking con ts_rank
+  más la similitud de trigramas.
+
+search_transactions() es la misma API para los dos motores: filtra el queryset y le
+agrega `search_rank` (mayor es mejor). Cada palabra buscada se toma como prefijo
+("super" encuentra "Supermercado") y tienen que aparecer todas. La subconsulta del
+índice se limita a las transacciones del usuario, no a las de toda la base.
+
+`search_rank` sirve para ordenar dentro de una página, no para paginar: bm25 depende
+de todo el índice (cambia cuando cualquier usuario carga transacciones), así que un
+cursor sobre el ranking podría saltear o repetir filas. La lista pagina por (date, id).
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'tracker_transaction_fts'
+
+# Palabras de la búsqueda (se descarta la sintaxis propia de FTS5 / tsquery)
+WORD_RE = re.compile(r'\w+')
+
+SQLITE_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        description,
+        content='tracker_transaction', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tracker_transaction BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tracker_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF description ON tracker_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+]
+
+POSTGRESQL_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS tx_description_fts_idx
+    ON tracker_transaction USING gin (to_tsvector('spanish', description))
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS tx_description_trgm_idx
+    ON tracker_transaction USING gin (description gin_trgm_ops)
+    """,
+]
+
+
+def install(connection, rebuild=False):
+    """
+    Crea (si faltan) el índice de búsqueda y, en SQLite, los triggers que lo mantienen.
+    Con `rebuild` vuelve a indexar todas las descripciones existentes.
+    """
+    schema = {'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRESQL_SCHEMA}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in schema:
+            cursor.execute(statement)
+        if rebuild and connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def ensure_installed(sender, using='default', **kwargs):
+    """
+    post_migrate: vuelve a crear los triggers de SQLite si una migración rehízo la
+    tabla de transacciones (SQLite la copia a una tabla nueva y pierde los triggers).
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        install(connection)
+
+
+def search_words(text):
+    return WORD_RE.findall(text or '')
+
+
+def search_transactions(transactions, text, user):
+    """
+    Filtra `transactions` (del usuario `user`) a las que coinciden con `text` y les
+    agrega `search_rank`.
+    """
+    words = search_words(text)
+    if not words:
+        return transactions.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    vendor = connections[transactions.db].vendor
+    if vendor == 'sqlite':
+        # Todas las palabras, como prefijos: "super"* "chino"*
+        match = ' '.join('"{}"*'.format(word) for word in words)
+        return transactions.filter(
+            id__in=RawSQL(
+                f"SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} "
+                f"JOIN tracker_transaction t ON t.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s AND t.user_id = %s",
+                [match, user.pk],
+            )
+        ).annotate(search_rank=RawSQL(
+            # bm25 es menor cuanto mejor coincide: se invierte el signo
+            f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = tracker_transaction.id",
+            [match], output_field=FloatField(),
+        ))
+
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{word}:*' for word in words)
+        text = ' '.join(words)
+        # Palabras por prefijo (índice tsvector) o el texto dentro de una palabra (trigramas)
+        return transactions.filter(
+            id__in=RawSQL(
+                "SELECT id FROM tracker_transaction WHERE user_id = %s AND ("
+                "to_tsvector('spanish', description) @@ to_tsquery('spanish', %s) OR description ILIKE %s)",
+                [user.pk, query, f'%{text}%'],
+            )
+        ).annotate(search_rank=RawSQL(
+            "ts_rank(to_tsvector('spanish', tracker_transaction.description), to_tsquery('spanish', %s))"
+            " + similarity(tracker_transaction.description, %s)",
+            [query, text], output_field=FloatField(),
+        ))
+
+    # Otros motores: sin índice de texto, coincidencia simple de todas las palabras
+    condition = Q()
+    for word in words:
+        condition &= Q(description__icontains=word)
+    return transactions.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
@@ -0,0 +1,71 @@
+"""
+Escritura de transacciones con todos sus efectos.
+
+Alta, edición y baja pasan por acá (las vistas, la importación y process_recurring),
+así cada escritura y sus efectos se aplican juntos en una sola transacción de la base:
+
+- Categoría y cuenta vacías se completan con las reglas del usuario (solo en el alta).
+- Saldos: un UPDATE por cuenta afectada con el neto del cambio. Una edición que mueve
+  el movimiento de cuenta toca las dos; una que invierte el tipo o cambia el monto en
+  la misma cuenta, una sola; una compra solo con tarjeta (sin cuenta), ninguna.
+- Acumulados mensuales (MonthlySummary) y contadores de presupuestos.
+- Libro de saldos por cuenta y día (tracker.ledger).
+
+Los saldos se actualizan al final, justo antes del commit: son las filas que más
+escrituras comparten y así quedan bloqueadas el menor tiempo posible. El UPDATE del
+saldo bloquea la cuenta, así que el libro de una misma cuenta se escribe de a una
+escritura por vez.
+"""
+from django.db import transaction as db_transaction
+
+from . import budgets, ledger
+from .categorization import categorize
+from .models import Account, MonthlySummary, Transaction
+
+# Filas por INSERT al crear lotes grandes
+BATCH_SIZE = 1000
+
+
+def apply_effects(changes):
+    """Aplica los pares (transacción, signo) a acumulados, presupuestos, saldos y libro de saldos."""
+    changes = list(changes)
+    MonthlySummary.apply_changes(changes)
+    budgets.apply(changes)
+    Account.apply_changes(changes)
+    ledger.apply(changes)
+
+
+def create_transaction(transaction):
+    """Guarda una transacción nueva (sin guardar todavía) y aplica sus efectos."""
+    categorize([transaction])
+    with db_transaction.atomic():
+        transaction.save()
+        apply_effects([(transaction, 1)])
+    return transaction
+
+
+def create_transactions(transactions):
+    """Guarda un lote de transacciones nuevas con INSERTs por lote y aplica sus efectos juntos."""
+    categorize(transactions)
+    with db_transaction.atomic():
+        Transaction.objects.bulk_create(transactions, batch_size=BATCH_SIZE)
+        apply_effects((transaction, 1) for transaction in transactions)
+    return transactions
+
+
+def update_transaction(transaction, original):
+    """
+    Guarda los cambios de `transaction`; `original` es una copia de cómo estaba antes de
+    editarla. Los efectos son la baja de la versión anterior más el alta de la nueva.
+    """
+    with db_transaction.atomic():
+        transaction.save()
+        apply_effects([(original, -1), (transaction, 1)])
+    return transaction
+
+
+def delete_transaction(transaction):
+    """Borra la transacción y revierte sus efectos."""
+    with db_transaction.atomic():
+        transaction.delete()
+        apply_effects([(transaction, -1)])
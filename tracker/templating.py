@@ -0,0 +1,30 @@
+"""
+Backend de plantillas de Django que informa su tiempo de renderizado a
+QueryTimingMiddleware (aparece como `tpl` en el header Server-Timing).
+"""
+from django.template.backends.django import DjangoTemplates
+
+from .middleware import current_timing
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timing = current_timing()
+        if timing is None:
+            return self.template.render(context, request)
+        with timing.measure_template():
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -1,3 +1,1131 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import re
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction as db_transaction
+from django.db.models import QuerySet, Sum
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase as DjangoTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import budgets as budget_tracking
+from . import categorization, forecast, importers, ledger, reconcile, recurring, services
+from .cache import data_version
+from .categorization import matcher_for, recategorize
+from .models import Account, BalanceEntry, Budget, BudgetAlert, BudgetPeriod, Category, CategoryRule, CreditCard, MonthlySummary, RecurringTransaction, Transaction
+from .models import statement_closings
+from .recurring import due_rules
+from .reports import bucket_queryset, build_series
+from .search import search_transactions
+
+
+# Los tests usan su propia caché en memoria, nunca la de desarrollo (FileBasedCache en
+# el directorio temporal), y arranca vacía en cada test: las versiones por usuario no
+# vencen y los ids de usuario se reutilizan después de cada rollback.
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestCase(DjangoTestCase):
+    def setUp(self):
+        cache.clear()
+
+
+# --- Planes de consulta ---
+# Verifica que las consultas frecuentes sobre Transaction usen un índice y no
+# recorran toda la tabla. Corre con la base configurada (SQLite o PostgreSQL).
+class TransactionQueryPlanTests(TestCase):
+    # Líneas del plan que indican un recorrido completo de la tabla de transacciones
+    FULL_SCAN_PATTERNS = {
+        'sqlite': re.compile(r'\bSCAN tracker_transaction\b'),
+        'postgresql': re.compile(r'\bSeq Scan on tracker_transaction\b'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        cls.user = User.objects.create_user('plan', password='x')
+        cls.account = Account.objects.create(user=cls.user, name='Banco')
+        cls.category = Category.objects.create(user=cls.user, name='Comida')
+        cls.card = CreditCard.objects.create(user=cls.user, name='Visa', closing_date=25, due_date=10)
+        cls.recurring = RecurringTransaction.objects.create(
+            user=cls.user, type='gasto', amount=10, description='Alquiler', start_date=cls.today,
+        )
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=cls.user, type='gasto' if i % 2 else 'ingreso', amount=i + 1,
+                description=f'Movimiento {i}', date=cls.today - datetime.timedelta(days=i),
+                category=cls.category, cuenta=cls.account, tarjeta_usada=cls.card,
+            )
+            for i in range(50)
+        ])
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'postgresql':
+            # Con tablas tan chicas PostgreSQL prefiere un Seq Scan aunque exista un índice
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset):
+        pattern = self.FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'Sin verificación de planes para {connection.vendor}')
+        plan = queryset.explain()
+        self.assertIsNone(pattern.search(plan), f'La consulta recorre toda la tabla:\n{plan}')
+
+    def test_dashboard_period(self):
+        # index: transacciones del usuario en el período, ordenadas por fecha
+        self.assertUsesIndex(
+            Transaction.objects.filter(
+                user=self.user, date__gte=self.today.replace(day=1),
+            ).order_by('-date', '-id')
+        )
+
+    def test_user_type_totals(self):
+        # Totales de un tipo de movimiento en un período
+        self.assertUsesIndex(
+            Transaction.objects.filter(
+                user=self.user, type='gasto', date__gte=self.today.replace(day=1),
+            ).values('type').annotate(total=Sum('amount'))
+        )
+
+    def test_reports_by_week(self):
+        # reports_series: ingresos y gastos agrupados por semana (con el año anterior)
+        self.assertUsesIndex(
+            bucket_queryset(self.user, self.today.replace(month=1, day=1), self.today, 'week')
+        )
+
+    def test_description_search(self):
+        # Búsqueda de la lista: índice de texto completo, no description__icontains
+        self.assertUsesIndex(
+            search_transactions(Transaction.objects.filter(user=self.user), 'movim', self.user)
+            .order_by('-date', '-id')
+        )
+
+    def test_card_statement(self):
+        # Resumen de tarjeta: gastos entre dos cierres
+        _, previous_closing_date, last_closing_date, _ = statement_closings(self.card.closing_date, self.today)
+        self.assertUsesIndex(
+            Transaction.objects.filter(
+                tarjeta_usada=self.card, type='gasto',
+                date__gt=previous_closing_date, date__lte=last_closing_date,
+            )
+        )
+
+    def test_recurring_existing_pairs(self):
+        # process_recurring: pares (fijo, fecha) que ya tienen transacción
+        due = due_rules(self.today)
+        self.assertUsesIndex(
+            Transaction.objects.filter(
+                recurring_source__in=due.values('pk'),
+                date__gte=self.today - datetime.timedelta(days=31),
+                date__lte=self.today,
+            ).values_list('recurring_source_id', 'date')
+        )
+
+
+# --- Dashboard ---
+# La página del dashboard y cada widget (endpoints JSON) hacen una cantidad fija de
+# consultas, sin importar cuántas categorías, presupuestos o tarjetas tenga el usuario.
+class DashboardQueryCountTests(TestCase):
+    # Sesión, usuario, últimas transacciones y las opciones del formulario
+    # (categorías, tarjetas y cuentas, que también se muestran en la página)
+    INDEX_QUERIES = 6
+    # Sesión y usuario, más las consultas propias de cada widget sin caché
+    WIDGET_QUERIES = {
+        'dashboard_totals': 4,  # acumulados por categoría (MonthlySummary) y saldo de las cuentas
+        'dashboard_categories': 3,  # acumulados por categoría
+        'dashboard_budgets': 5,  # presupuestos, sus períodos (BudgetPeriod) y avisos
+        'dashboard_cards': 3,  # resúmenes de todas las tarjetas (with_statements)
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        cls.user = User.objects.create_user('dashboard', password='x')
+        cls.account = Account.objects.create(user=cls.user, name='Banco', balance=1000)
+        CreditCard.objects.create(user=cls.user, name='Visa', closing_date=25, due_date=10)
+        # Dos categorías con el mismo nombre: los presupuestos se cruzan por id
+        cls.food = Category.objects.create(user=cls.user, name='Comida')
+        cls.other_food = Category.objects.create(user=cls.user, name='Comida')
+        Budget.objects.create(user=cls.user, category=cls.food, amount=100)
+        Budget.objects.create(user=cls.user, category=cls.other_food, amount=10)
+        transactions = [
+            Transaction.objects.create(
+                user=cls.user, type='gasto', amount=40, description='Súper',
+                date=cls.today, category=cls.food, cuenta=cls.account,
+            ),
+            Transaction.objects.create(
+                user=cls.user, type='gasto', amount=5, description='Kiosco',
+                date=cls.today, cuenta=cls.account,
+            ),
+            Transaction.objects.create(
+                user=cls.user, type='ingreso', amount=200, description='Sueldo',
+                date=cls.today, cuenta=cls.account,
+            ),
+        ]
+        MonthlySummary.apply_many(transactions)
+        budget_tracking.apply_many(transactions)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def get(self, name):
+        return self.client.get(reverse(name), secure=True)
+
+    def test_totals_and_budgets_by_category_id(self):
+        totals = self.get('dashboard_totals').json()
+        self.assertEqual(totals['total_spent'], 45)
+        self.assertEqual(totals['net_change'], 155)
+
+        budgets = self.get('dashboard_budgets').json()['budgets']
+        self.assertEqual(
+            sorted((budget['category_id'], budget['limit'], budget['spent']) for budget in budgets),
+            [(self.food.pk, 100, 40), (self.other_food.pk, 10, 0)],
+        )
+
+        categories = self.get('dashboard_categories').json()['categories']
+        self.assertEqual(sorted(category['label'] for category in categories), ['Comida', 'Sin Categoría'])
+
+    def assertFixedQueryCounts(self):
+        # Se mide cada vista sin caché (la del test anterior la dejaría llena)
+        cache.clear()
+        with self.assertNumQueries(self.INDEX_QUERIES):
+            self.get('index')
+        for name, queries in self.WIDGET_QUERIES.items():
+            cache.clear()
+            with self.assertNumQueries(queries):
+                self.get(name)
+
+    def test_query_count_is_fixed(self):
+        self.assertFixedQueryCounts()
+
+        for i in range(5):
+            category = Category.objects.create(user=self.user, name=f'Extra {i}')
+            Budget.objects.create(user=self.user, category=category, amount=50)
+            CreditCard.objects.create(user=self.user, name=f'Tarjeta {i}', closing_date=i + 1, due_date=10)
+            Account.objects.create(user=self.user, name=f'Cuenta {i}')
+
+        self.assertFixedQueryCounts()
+        self.assertEqual(len(self.get('dashboard_budgets').json()['budgets']), 7)
+
+
+# Cada vista que escribe invalida los widgets cacheados del usuario
+class CacheInvalidationTests(TestCase):
+    def test_write_views_invalidate_cached_widgets(self):
+        user = User.objects.create_user('invalidar', password='x')
+        bank = Account.objects.create(user=user, name='Banco', balance=1000)
+        spare = Account.objects.create(user=user, name='Sin uso')
+        food = Category.objects.create(user=user, name='Comida')
+        spare_category = Category.objects.create(user=user, name='Otra')
+        card = CreditCard.objects.create(user=user, name='Visa', closing_date=25, due_date=10)
+        fixed = RecurringTransaction.objects.create(
+            user=user, type='gasto', amount=10, description='Alquiler', start_date=datetime.date(2024, 1, 1),
+        )
+        rule = CategoryRule.objects.create(user=user, pattern='super', category=food)
+        kept, deleted = (
+            services.create_transaction(Transaction(
+                user=user, type='gasto', amount=Decimal('5'), description=description, date=datetime.date.today(), cuenta=bank,
+            ))
+            for description in ('Kiosco', 'Café')
+        )
+        transaction = {'type': 'gasto', 'amount': '50', 'description': 'Súper', 'date': datetime.date.today().isoformat(), 'cuenta': bank.pk}
+        cases = [
+            ('add_transaction', (), transaction),
+            ('transaction_update', (kept.pk,), {**transaction, 'amount': '7'}),
+            ('transaction_delete', (deleted.pk,), {}),
+            ('transaction_import', (), {'file': SimpleUploadedFile('extracto.csv', b'fecha,descripcion,monto\n2024-05-01,Sueldo,100\n')}),
+            ('add_category', (), {'name': 'Nueva'}),
+            ('category_delete', (spare_category.pk,), {}),
+            ('manage_recurring', (), {'type': 'ingreso', 'amount': '100', 'description': 'Sueldo', 'frequency': 'mensual', 'start_date': '2024-01-01'}),
+            ('delete_recurring', (fixed.pk,), {}),
+            ('manage_cards', (), {'name': 'Master', 'closing_date': '20', 'due_date': '5'}),
+            ('delete_card', (card.pk,), {}),
+            ('manage_accounts', (), {'name': 'Efectivo', 'balance': '10'}),
+            ('delete_account', (spare.pk,), {}),
+            ('manage_budgets', (), {'category': food.pk, 'amount': '100', 'period': 'mensual'}),
+            ('delete_budget', (None,), {}),
+            ('budget_alerts_read', (), {}),
+            ('manage_rules', (), {'match_type': 'keyword', 'pattern': 'cafe', 'category': food.pk, 'priority': '10'}),
+            ('delete_rule', (rule.pk,), {}),
+        ]
+
+        self.client.force_login(user)
+        for name, args, data in cases:
+            with self.subTest(view=name):
+                if name == 'delete_budget':
+                    args = (Budget.objects.get(user=user).pk,)
+                self.client.get(reverse('dashboard_totals'), secure=True)
+                version = data_version(user.pk)
+                response = self.client.post(reverse(name, args=args), data, secure=True)
+                self.assertEqual(response.status_code, 302)
+                self.assertNotEqual(data_version(user.pk), version)
+                # El widget se vuelve a calcular (sesión y usuario más sus propias consultas)
+                with self.assertNumQueries(DashboardQueryCountTests.WIDGET_QUERIES['dashboard_totals']):
+                    self.client.get(reverse('dashboard_totals'), secure=True)
+
+
+# --- Informes ---
+class ReportSeriesTests(TestCase):
+    def test_derived_series(self):
+        rows = [
+            {'bucket': datetime.date(2023, 1, 1), 'ingreso': Decimal('100'), 'gasto': Decimal('50')},
+            {'bucket': datetime.date(2024, 1, 1), 'ingreso': Decimal('200'), 'gasto': Decimal('50')},
+            {'bucket': datetime.date(2024, 3, 1), 'ingreso': None, 'gasto': Decimal('30')},
+        ]
+        series = build_series(rows, datetime.date(2024, 1, 15), datetime.date(2024, 3, 10), 'month', rolling_window=2)
+
+        self.assertEqual(series['labels'], ['Ene 2024', 'Feb 2024', 'Mar 2024'])
+        self.assertEqual(series['net'], [150, 0, -30])
+        self.assertEqual(series['cumulative_net'], [150, 150, 120])
+        self.assertEqual(series['rolling_net'], [150, 75, -15])
+        self.assertEqual(series['savings_rate'], [75, None, None])
+        self.assertEqual(series['previous_ingresos'], [100, 0, 0])
+        self.assertEqual(series['yoy_ingresos'], [100, None, None])
+        self.assertEqual(series['totals']['savings_rate'], 60)
+
+    def test_series_endpoint(self):
+        user = User.objects.create_user('informes', password='x')
+        transaction = Transaction.objects.create(
+            user=user, type='ingreso', amount=80, description='Sueldo', date=datetime.date(2020, 6, 3),
+        )
+        MonthlySummary.apply_many([transaction])
+        self.client.force_login(user)
+        url = reverse('reports_series')
+
+        yearly = self.client.get(url, {'date_from': '2015-01-01', 'date_to': '2024-12-31', 'granularity': 'year'}, secure=True)
+        self.assertEqual(yearly.json()['ingresos'][5], 80)
+        self.assertEqual(len(yearly.json()['labels']), 10)
+
+        weekly = self.client.get(url, {'date_from': '2020-06-01', 'date_to': '2020-06-30', 'granularity': 'week'}, secure=True)
+        self.assertEqual(weekly.json()['ingresos'][:2], [80, 0])
+
+        invalid = self.client.get(url, {'date_from': '2024-01-01', 'date_to': '2023-01-01'}, secure=True)
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_edge_buckets_are_whole(self):
+        # Con cualquier granularidad, los períodos de los extremos se cuentan completos
+        user = User.objects.create_user('informes', password='x')
+        transactions = [
+            Transaction.objects.create(user=user, type='gasto', amount=amount, description='Compra', date=date)
+            for amount, date in [(10, datetime.date(2024, 1, 10)), (20, datetime.date(2024, 6, 20))]
+        ]
+        MonthlySummary.apply_many(transactions)
+        self.client.force_login(user)
+        url = reverse('reports_series')
+
+        yearly = self.client.get(url, {'date_from': '2024-06-01', 'date_to': '2024-06-15', 'granularity': 'year'}, secure=True).json()
+        self.assertEqual((yearly['date_from'], yearly['date_to']), ('2024-01-01', '2024-12-31'))
+        self.assertEqual(yearly['gastos'], [30])
+
+        monthly = self.client.get(url, {'date_from': '2024-01-15', 'date_to': '2024-06-15', 'granularity': 'month'}, secure=True).json()
+        self.assertEqual((monthly['date_from'], monthly['date_to']), ('2024-01-01', '2024-06-30'))
+        self.assertEqual(monthly['totals']['gastos'], 30)
+
+        # 2024-06-19 es miércoles: la semana llega hasta el domingo 23
+        weekly = self.client.get(url, {'date_from': '2024-06-19', 'date_to': '2024-06-19', 'granularity': 'week'}, secure=True).json()
+        self.assertEqual((weekly['date_from'], weekly['date_to']), ('2024-06-17', '2024-06-23'))
+        self.assertEqual(weekly['gastos'], [20])
+
+        daily = self.client.get(url, {'date_from': '2024-06-20', 'date_to': '2024-06-20', 'granularity': 'day'}, secure=True).json()
+        self.assertEqual(daily['gastos'], [20])
+
+
+# --- Búsqueda ---
+class TransactionSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('busqueda', password='x')
+        other = User.objects.create_user('otro', password='x')
+        today = datetime.date.today()
+        for description in ['Supermercado Día', 'Café con amigos', 'Super chino', 'Sueldo']:
+            Transaction.objects.create(user=cls.user, type='gasto', amount=10, description=description, date=today)
+        Transaction.objects.create(user=other, type='gasto', amount=10, description='Supermercado', date=today)
+
+    def search(self, text):
+        return list(
+            search_transactions(Transaction.objects.filter(user=self.user), text, self.user)
+            .values_list('description', flat=True)
+        )
+
+    def test_prefix_and_accents(self):
+        self.assertCountEqual(self.search('super'), ['Supermercado Día', 'Super chino'])
+        self.assertEqual(self.search('cafe amig'), ['Café con amigos'])
+        # La sintaxis de FTS5 se descarta: solo cuentan las palabras
+        self.assertEqual(self.search('cafe" *'), ['Café con amigos'])
+
+    def test_index_follows_updates(self):
+        transaction = Transaction.objects.get(description='Sueldo')
+        transaction.description = 'Sueldo de octubre'
+        transaction.save()
+        self.assertEqual(self.search('octu'), ['Sueldo de octubre'])
+        transaction.delete()
+        self.assertEqual(self.search('sueldo'), [])
+
+    def test_list_pages_by_date(self):
+        self.client.force_login(self.user)
+        with mock.patch('tracker.views.TRANSACTIONS_PAGE_SIZE', 1):
+            first = self.client.get(reverse('transaction_list'), {'q': 'super'}, secure=True)
+            second = self.client.get(first.context['next_url'], secure=True)
+        found = [t.description for t in first.context['transactions'] + second.context['transactions']]
+        self.assertCountEqual(found, ['Supermercado Día', 'Super chino'])
+        self.assertIsNone(second.context['next_url'])
+
+    def test_pages_stable_when_index_changes(self):
+        # Las cargas de otro usuario cambian bm25 en todo el índice: las páginas no se mueven
+        today = datetime.date.today()
+        for i in range(4):
+            Transaction.objects.create(
+                user=self.user, type='gasto', amount=10, description=f'Super {i}',
+                date=today - datetime.timedelta(days=i + 1),
+            )
+        other = User.objects.get(username='otro')
+        self.client.force_login(self.user)
+        found = []
+        url, params = reverse('transaction_list'), {'q': 'super'}
+        with mock.patch('tracker.views.TRANSACTIONS_PAGE_SIZE', 2):
+            while url:
+                response = self.client.get(url, params, secure=True)
+                found += [t.description for t in response.context['transactions']]
+                url, params = response.context['next_url'], None
+                Transaction.objects.bulk_create(
+                    Transaction(user=other, type='gasto', amount=10, description='Super super super', date=today)
+                    for _ in range(20)
+                )
+        self.assertEqual(len(found), 6)
+        self.assertCountEqual(found, ['Supermercado Día', 'Super chino'] + [f'Super {i}' for i in range(4)])
+
+    def test_scoped_to_user(self):
+        other = User.objects.get(username='otro')
+        self.assertEqual(
+            list(search_transactions(Transaction.objects.all(), 'super', other).values_list('description', flat=True)),
+            ['Supermercado'],
+        )
+
+
+# --- Categorización automática ---
+class CategorizationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reglas', password='x')
+        cls.account = Account.objects.create(user=cls.user, name='Banco')
+        cls.food = Category.objects.create(user=cls.user, name='Comida')
+        cls.coffee = Category.objects.create(user=cls.user, name='Café')
+        cls.big = Category.objects.create(user=cls.user, name='Grandes')
+
+    def rule(self, **fields):
+        return CategoryRule.objects.create(user=self.user, **fields)
+
+    def test_priority_accents_amounts_and_regex(self):
+        self.rule(pattern='super', category=self.food, priority=20)
+        self.rule(pattern='cafe', category=self.coffee, priority=10)
+        self.rule(pattern='', amount_min=1000, category=self.big, priority=5)
+        self.rule(match_type='regex', pattern=r'^uber\s+\*', category=self.food, cuenta=self.account, priority=1)
+        matcher = matcher_for(self.user.pk)
+
+        self.assertEqual(matcher.match('Supermercado y CAFÉ', Decimal('10')).category, self.coffee)
+        self.assertEqual(matcher.match('Supermercado', Decimal('1500')).category, self.big)
+        self.assertEqual(matcher.match('UBER *VIAJE', Decimal('10')).cuenta, self.account)
+        self.assertIsNone(matcher.match('Sueldo', Decimal('10')))
+
+    def test_compiled_rules_follow_changes(self):
+        rule = self.rule(pattern='super', category=self.food)
+        self.assertEqual(matcher_for(self.user.pk).match('super', Decimal('1')).category, self.food)
+        # Sin cambios: solo se consulta la versión de las reglas
+        with self.assertNumQueries(1):
+            matcher_for(self.user.pk)
+        rule.category = self.coffee
+        rule.save()
+        self.assertEqual(matcher_for(self.user.pk).match('super', Decimal('1')).category, self.coffee)
+
+    def test_compiled_rules_follow_database(self):
+        # Cambios de otro proceso: la caché no se entera, la versión de la base sí
+        rule = self.rule(pattern='super', category=self.food)
+        other = self.rule(pattern='cafe', category=self.coffee)
+        matcher_for(self.user.pk)
+        with mock.patch('tracker.categorization.bump_data_version'):
+            rule.category = self.coffee
+            rule.save()
+            self.assertEqual(matcher_for(self.user.pk).match('super', Decimal('1')).category, self.coffee)
+            other.delete()
+            self.assertIsNone(matcher_for(self.user.pk).match('cafe', Decimal('1')))
+        cache.clear()
+        self.rule(pattern='cafe', category=self.food)
+        self.assertEqual(matcher_for(self.user.pk).match('cafe', Decimal('1')).category, self.food)
+
+    def test_add_transaction_and_recategorize(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_transaction'), {
+            'type': 'gasto', 'amount': '10', 'description': 'Café', 'date': '2024-05-01', 'cuenta': self.account.pk,
+        }, secure=True)
+        self.assertEqual(Transaction.objects.get().category, None)
+
+        self.rule(pattern='cafe', category=self.coffee)
+        self.client.post(reverse('add_transaction'), {
+            'type': 'gasto', 'amount': '5', 'description': 'Otro café', 'date': '2024-05-02', 'cuenta': self.account.pk,
+        }, secure=True)
+        self.assertEqual(Transaction.objects.get(description='Otro café').category, self.coffee)
+
+        self.assertEqual(recategorize(self.user.pk, chunk_size=1), (1, 1))
+        self.assertEqual(Transaction.objects.filter(category=self.coffee).count(), 2)
+        self.assertEqual(
+            list(MonthlySummary.objects.filter(user=self.user, total__gt=0).values_list('category_id', 'total', 'count')),
+            [(self.coffee.pk, Decimal('15.00'), 2)],
+        )
+
+
+# --- Presupuestos por período ---
+class BudgetTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('presupuestos', password='x')
+        cls.account = Account.objects.create(user=cls.user, name='Banco', balance=1000)
+        cls.food = Category.objects.create(user=cls.user, name='Comida')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def add(self, amount, date, **fields):
+        self.client.post(reverse('add_transaction'), {
+            'type': 'gasto', 'amount': amount, 'description': 'Súper', 'date': date,
+            'category': self.food.pk, 'cuenta': self.account.pk, **fields,
+        }, secure=True)
+        return Transaction.objects.latest('id')
+
+    def test_counters_and_alerts_follow_writes(self):
+        Transaction.objects.create(
+            user=self.user, type='gasto', amount=30, description='Antes', date=datetime.date(2024, 3, 4), category=self.food,
+        )
+        budget = Budget.objects.create(user=self.user, category=self.food, amount=100, period='semanal')
+        # Al abrir el período se toma lo ya gastado en la semana
+        period, _ = budget_tracking.open_period(budget, datetime.date(2024, 3, 6))
+        self.assertEqual(period.spent, 30)
+
+        transaction = self.add('55', '2024-03-06')
+        self.assertEqual(BudgetPeriod.objects.get(pk=period.pk).spent, 85)
+        self.assertEqual(list(BudgetAlert.objects.values_list('threshold', flat=True)), [80])
+
+        self.client.post(reverse('transaction_update', args=[transaction.pk]), {
+            'type': 'gasto', 'amount': '80', 'description': 'Súper', 'date': '2024-03-06',
+            'category': self.food.pk, 'cuenta': self.account.pk,
+        }, secure=True)
+        self.assertEqual(BudgetPeriod.objects.get(pk=period.pk).spent, 110)
+        self.assertEqual(sorted(BudgetAlert.objects.values_list('threshold', flat=True)), [80, 100])
+
+        self.client.post(reverse('transaction_delete', args=[transaction.pk]), secure=True)
+        self.assertEqual(BudgetPeriod.objects.get(pk=period.pk).spent, 30)
+
+    def test_rollover_and_progress(self):
+        budget = Budget.objects.create(user=self.user, category=self.food, amount=100, rollover=True)
+        self.add('60', '2024-01-10')
+        self.add('10', '2024-02-01')
+        february = BudgetPeriod.objects.get(budget=budget, start=datetime.date(2024, 2, 1))
+        self.assertEqual((february.limit, february.spent), (140, 10))
+
+        # Sin escrituras en marzo: el progreso sale del período anterior, sin consultar transacciones
+        rows = budget_tracking.progress([budget], BudgetPeriod.objects.all(), datetime.date(2024, 3, 15))
+        self.assertEqual((rows[0]['limit'], rows[0]['spent']), (230, 0))
+
+
+class DataMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def test_existing_budget_shows_spent(self):
+        # Un presupuesto de antes de 0009 muestra lo ya gastado apenas se migra
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('tracker')[0]
+        old = self.migrate(('tracker', '0008_categoryrule'))
+        try:
+            user = old.get_model('auth', 'User').objects.create(username='migracion')
+            food = old.get_model('tracker', 'Category').objects.create(user=user, name='Comida')
+            old.get_model('tracker', 'Budget').objects.create(user=user, category=food, amount=100)
+            today = datetime.date.today()
+            old.get_model('tracker', 'Transaction').objects.bulk_create(
+                old.get_model('tracker', 'Transaction')(
+                    user=user, type='gasto', amount=amount, description='Súper', date=date, category=food,
+                )
+                for amount, date in [(60, today), (25, today.replace(day=1)), (500, today - relativedelta(months=1))]
+            )
+        finally:
+            self.migrate(latest)
+
+        budget = Budget.objects.select_related('category').get()
+        rows = budget_tracking.progress([budget], BudgetPeriod.objects.filter(budget=budget), datetime.date.today())
+        self.assertEqual((rows[0]['limit'], rows[0]['spent']), (100, 85))
+        self.assertEqual(list(BudgetAlert.objects.values_list('threshold', flat=True)), [80])
+
+    def test_ledger_marks_inferred_openings(self):
+        # El saldo inicial deducido por 0010 queda marcado como sin verificar
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('tracker')[0]
+        old = self.migrate(('tracker', '0009_budget_periods'))
+        try:
+            user = old.get_model('auth', 'User').objects.create(username='migracion')
+            bank = old.get_model('tracker', 'Account').objects.create(user=user, name='Banco', balance=500)
+            old.get_model('tracker', 'Transaction').objects.create(
+                user=user, type='gasto', amount=60, description='Súper', date=datetime.date(2024, 5, 1), cuenta=bank,
+            )
+        finally:
+            self.migrate(latest)
+
+        self.assertEqual(
+            list(Account.objects.values_list('opening_balance', 'inferred_opening', 'balance')),
+            [(560, 560, 500)],
+        )
+        self.assertEqual([o.opening_balance for o in reconcile.reconcile_shard().unverified], [560])
+
+
+class TransactionWriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('escrituras', password='x')
+        cls.bank = Account.objects.create(user=cls.user, name='Banco', balance=1000)
+        cls.cash = Account.objects.create(user=cls.user, name='Efectivo', balance=100)
+        cls.card = CreditCard.objects.create(user=cls.user, name='Visa', closing_date=20, due_date=5)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def post(self, name, args=(), **fields):
+        data = {'type': 'gasto', 'amount': '50', 'description': 'Compra', 'date': '2024-05-10', **fields}
+        return self.client.post(reverse(name, args=args), data, secure=True)
+
+    def balances(self):
+        return tuple(Account.objects.filter(pk__in=[self.bank.pk, self.cash.pk]).order_by('pk').values_list('balance', flat=True))
+
+    def test_card_only_purchase_and_account_moves(self):
+        # Compra solo con tarjeta: no toca ningún saldo
+        self.post('add_transaction', tarjeta_usada=self.card.pk)
+        card_purchase = Transaction.objects.get()
+        self.assertIsNone(card_purchase.cuenta_id)
+        self.assertEqual(self.balances(), (1000, 100))
+
+        # Se le asigna una cuenta y se invierte el tipo
+        self.post('transaction_update', [card_purchase.pk], type='ingreso', cuenta=self.bank.pk)
+        self.assertEqual(self.balances(), (1050, 100))
+
+        # Cambio de cuenta y de monto: se revierte en una y se aplica en la otra
+        self.post('transaction_update', [card_purchase.pk], amount='20', cuenta=self.cash.pk)
+        self.assertEqual(self.balances(), (1000, 80))
+
+        self.client.post(reverse('transaction_delete', args=[card_purchase.pk]), secure=True)
+        self.assertEqual(self.balances(), (1000, 100))
+        self.assertFalse(MonthlySummary.objects.exclude(total=0).exists())
+
+    def test_one_update_per_account(self):
+        self.post('add_transaction', cuenta=self.bank.pk)
+        transaction = Transaction.objects.get()
+        # Misma cuenta: la baja y el alta se combinan en un solo UPDATE del saldo
+        with CaptureQueriesContext(connection) as queries:
+            self.post('transaction_update', [transaction.pk], type='ingreso', cuenta=self.bank.pk)
+        account_updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "tracker_account"')]
+        self.assertEqual(len(account_updates), 1)
+        self.assertEqual(self.balances(), (1050, 100))
+
+
+class RecurringScheduleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('vencimientos', password='x')
+
+    def rule(self, **fields):
+        return RecurringTransaction.objects.create(user=self.user, type='gasto', amount=10, description='Fijo', **fields)
+
+    def dates(self, rule):
+        return list(Transaction.objects.filter(recurring_source=rule).order_by('date').values_list('date', flat=True))
+
+    def test_month_end_anchor(self):
+        date = datetime.date
+        rule = self.rule(start_date=date(2024, 1, 31), next_due_date=date(2024, 1, 31))
+        # El 31 cae el último día de los meses cortos y vuelve al 31 después
+        self.assertEqual(
+            [rule.occurrence(index) for index in range(4)],
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)],
+        )
+        self.assertEqual(rule.next_occurrence(date(2024, 2, 29)), date(2024, 3, 31))
+        self.assertEqual(rule.next_occurrence(date(2025, 1, 31)), date(2025, 2, 28))
+        self.assertEqual(rule.next_occurrence(date(2025, 2, 28)), date(2025, 3, 31))
+        self.assertEqual(rule.next_occurrence(date(2023, 6, 1)), date(2024, 1, 31))
+
+        rule.start_date = date(2023, 1, 29)
+        self.assertEqual(rule.next_occurrence(date(2023, 1, 29)), date(2023, 2, 28))
+        self.assertEqual(rule.next_occurrence(date(2023, 2, 28)), date(2023, 3, 29))
+
+        weekly = self.rule(frequency='semanal', start_date=date(2024, 3, 1), next_due_date=date(2024, 3, 1))
+        self.assertEqual(weekly.next_occurrence(date(2024, 3, 1)), date(2024, 3, 8))
+        self.assertEqual(weekly.next_occurrence(date(2024, 3, 10)), date(2024, 3, 15))
+
+        # Sin next_due_date: la primera ocurrencia desde hoy, sin generar las pasadas
+        today = datetime.date.today()
+        started = self.rule(start_date=date(2020, 1, 15))
+        self.assertGreaterEqual(started.next_due_date, today)
+        self.assertLess(started.next_due_date, today + relativedelta(months=1, days=1))
+        self.assertEqual(started.next_due_date.day, 15)
+
+    def test_catch_up_end_date_and_reruns(self):
+        date = datetime.date
+        monthly = self.rule(start_date=date(2024, 1, 31), next_due_date=date(2024, 1, 31))
+        weekly = self.rule(
+            frequency='semanal', start_date=date(2024, 3, 1), next_due_date=date(2024, 3, 1), end_date=date(2024, 3, 20),
+        )
+
+        # Varios meses sin correr: se generan todas las ocurrencias atrasadas
+        result = recurring.process_shard(date(2024, 4, 30))
+        self.assertEqual((result.due, result.created), (2, 7))
+        self.assertEqual(self.dates(monthly), [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)])
+        self.assertEqual(self.dates(weekly), [date(2024, 3, 1), date(2024, 3, 8), date(2024, 3, 15)])
+        monthly.refresh_from_db()
+        weekly.refresh_from_db()
+        self.assertEqual((monthly.next_due_date, weekly.next_due_date), (date(2024, 5, 31), date(2024, 3, 22)))
+
+        # Volver a correr el mismo día no crea nada; el fijo terminado ya no vence
+        again = recurring.process_shard(date(2024, 4, 30))
+        self.assertEqual((again.due, again.created), (0, 0))
+        self.assertFalse(recurring.due_rules(date(2025, 1, 1)).filter(pk=weekly.pk).exists())
+
+        # Un vencimiento que no se llegó a avanzar no duplica las transacciones ya creadas
+        RecurringTransaction.objects.filter(pk=monthly.pk).update(next_due_date=date(2024, 3, 31))
+        rerun = recurring.process_shard(date(2024, 5, 31))
+        self.assertEqual((rerun.created, rerun.existing), (1, 2))
+        self.assertEqual(self.dates(monthly)[-3:], [date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31)])
+        self.assertEqual(Transaction.objects.filter(recurring_source=monthly).count(), 5)
+
+
+class InlineExecutor:
+    """Reemplazo de ProcessPoolExecutor que corre cada rango en este proceso (la base de los tests no se comparte)."""
+
+    def __init__(self, max_workers=None, initializer=None):
+        self.max_workers = max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, function, *iterables):
+        return map(function, *iterables)
+
+
+class ProcessRecurringTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = datetime.date.today()
+        for i in range(4):
+            user = User.objects.create_user(f'fijos{i}', password='x')
+            RecurringTransaction.objects.create(
+                user=user, type='gasto', amount=10 + i, description='Alquiler', frequency='semanal',
+                start_date=today - datetime.timedelta(days=30), next_due_date=today - datetime.timedelta(days=16),
+            )
+            RecurringTransaction.objects.create(
+                user=user, type='ingreso', amount=100, description='Sueldo',
+                start_date=today - relativedelta(months=2), next_due_date=today - relativedelta(months=1),
+            )
+
+    def run_command(self, *args):
+        """Corre process_recurring y devuelve (transacciones creadas, vencimientos, salida) sin dejar cambios."""
+        out = io.StringIO()
+        with db_transaction.atomic():
+            with mock.patch('tracker.management.commands.process_recurring.ProcessPoolExecutor', InlineExecutor):
+                call_command('process_recurring', *args, stdout=out)
+            created = sorted(Transaction.objects.values_list('user_id', 'recurring_source_id', 'date', 'amount'))
+            due = sorted(RecurringTransaction.objects.values_list('pk', 'next_due_date'))
+            db_transaction.set_rollback(True)
+        return created, due, out.getvalue()
+
+    def test_sharded_run_matches_single_process(self):
+        single, single_due, _ = self.run_command()
+        sharded, sharded_due, output = self.run_command('--workers', '4')
+
+        # 3 semanas atrasadas y 2 meses por usuario
+        self.assertEqual(len(single), 4 * 5)
+        self.assertEqual(sharded, single)
+        self.assertEqual(sharded_due, single_due)
+        self.assertEqual(output.count('Usuarios '), len(recurring.user_ranges(datetime.date.today(), 4)))
+        self.assertGreater(output.count('Usuarios '), 1)
+
+    def test_dry_run_writes_nothing(self):
+        due = sorted(RecurringTransaction.objects.values_list('pk', 'next_due_date'))
+        for args in ((), ('--workers', '2')):
+            created, after, output = self.run_command('--dry-run', *args)
+            self.assertEqual(created, [])
+            self.assertEqual(after, due)
+            self.assertIn('se crearían 20 nuevas transacciones', output)
+
+
+class CardStatementTests(TestCase):
+    CLOSING_DAYS = (15, 29, 30, 31)
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('tarjetas', password='x')
+        cls.cards = [
+            CreditCard.objects.create(user=user, name=f'Cierre {day}', closing_date=day, due_date=10)
+            for day in cls.CLOSING_DAYS
+        ]
+        cls.empty = CreditCard.objects.create(user=user, name='Sin compras', closing_date=31, due_date=10)
+        today = datetime.date.today()
+        days = [datetime.date(2022, 11, 1) + datetime.timedelta(days=i) for i in range(610)]
+        days += [today - datetime.timedelta(days=i) for i in range(-5, 100)]
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=user, type='gasto' if day.toordinal() % 5 else 'ingreso', amount=day.toordinal() % 97 + 1,
+                description='Compra', date=day, tarjeta_usada=card,
+            )
+            for card in cls.cards for day in days
+        ])
+
+    def per_card(self, card, today):
+        # Cálculo por tarjeta de antes de with_statements: gastos entre cada par de cierres
+        closings = statement_closings(card.closing_date, today)
+        return [
+            card.transactions.filter(type='gasto', date__gt=start, date__lte=end).aggregate(total=Sum('amount'))['total'] or 0
+            for start, end in zip(closings, closings[1:])
+        ]
+
+    def test_grouped_statements_match_per_card(self):
+        date = datetime.date
+        # Meses cortos (bisiesto y no), cierres 29-31 y un cierre que cae el día de hoy
+        todays = [
+            date(2023, 2, 27), date(2023, 2, 28), date(2023, 3, 1), date(2024, 2, 28), date(2024, 2, 29),
+            date(2024, 3, 15), date(2024, 3, 29), date(2024, 3, 30), date(2024, 3, 31), date(2024, 4, 30),
+        ]
+        for today in todays:
+            with self.subTest(today=today):
+                with self.assertNumQueries(1):
+                    annotated = list(CreditCard.objects.with_statements(today).order_by('pk'))
+                for card in annotated:
+                    self.assertEqual(
+                        [card.previous_statement, card.balance_due, card.next_statement],
+                        self.per_card(card, today),
+                    )
+                self.assertEqual(annotated[-1].balance_due, 0)
+
+        # Con la fecha real, el mismo resultado que get_balance_due sin anotar
+        for card in CreditCard.objects.with_statements():
+            self.assertEqual(card.get_balance_due, CreditCard.objects.get(pk=card.pk).get_balance_due)
+
+
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importar', password='x')
+        cls.bank = Account.objects.create(user=cls.user, name='Banco', balance=1000)
+        cls.cash = Account.objects.create(user=cls.user, name='Efectivo', balance=100)
+
+    def test_semicolon_csv_amounts_and_errors(self):
+        lines = io.StringIO(
+            'Fecha;Descripción;Importe;Cuenta\n'
+            '2024-05-01;Sueldo;1.234,50;Banco\n'
+            '2024-05-02;Súper;-20,5;efectivo\n'
+            '2024-05-03;Dudoso;1.234;Banco\n'
+            '\n'
+            '2024-05-03;Kiosco;-1,234.75;Banco\n'
+            '2024-05-04;Sin cuenta;-10;Caja\n'
+            '2024-05-05;Venta del auto;1,234,567;Banco\n'
+            '2024-05-06;Bonos;1.234.567;Banco\n'
+        )
+        result = importers.import_transactions(self.user, lines)
+
+        self.assertEqual((result.created, result.skipped), (5, 2))
+        self.assertEqual(len(result.errors), 2)
+        self.assertTrue(result.errors[0].startswith("Línea 4: El monto '1.234' es ambiguo"))
+        self.assertEqual(result.errors[1], "Línea 7: La cuenta 'Caja' no existe.")
+        self.assertEqual(
+            list(Transaction.objects.order_by('date', 'id').values_list('description', 'type', 'amount', 'cuenta_id')),
+            [
+                ('Sueldo', 'ingreso', Decimal('1234.50'), self.bank.pk),
+                ('Súper', 'gasto', Decimal('20.50'), self.cash.pk),
+                ('Kiosco', 'gasto', Decimal('1234.75'), self.bank.pk),
+                ('Venta del auto', 'ingreso', Decimal('1234567.00'), self.bank.pk),
+                ('Bonos', 'ingreso', Decimal('1234567.00'), self.bank.pk),
+            ],
+        )
+        self.assertEqual(list(Account.objects.order_by('pk').values_list('balance', flat=True)), [Decimal('2470133.75'), Decimal('79.50')])
+
+    def test_batches_update_each_account_once(self):
+        rows = ''.join(
+            f'2024-05-0{day},Compra {day},-10,{"Banco" if day % 2 else "Efectivo"}\n' for day in range(1, 6)
+        )
+        lines = io.StringIO('date,description,amount,cuenta\n' + rows)
+        with CaptureQueriesContext(connection) as queries:
+            result = importers.import_transactions(self.user, lines, batch_size=3)
+
+        sql = [query['sql'] for query in queries]
+        # Dos lotes (3 + 2 filas), cada uno con un INSERT y un UPDATE por cuenta
+        self.assertEqual(result.created, 5)
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "tracker_transaction"')]), 2)
+        self.assertEqual(len([q for q in sql if q.startswith('UPDATE "tracker_account"')]), 4)
+        self.assertEqual(list(Account.objects.order_by('pk').values_list('balance', flat=True)), [970, 80])
+
+    def test_ofx_command(self):
+        ofx = (
+            'OFXHEADER:100\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+            '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240510120000<TRNAMT>-45.90<NAME>Farmacia\n</STMTTRN>\n'
+            '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240511<TRNAMT>500.00<MEMO>Transferencia</STMTTRN>\n'
+            '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>2024<TRNAMT>-1.00<NAME>Sin fecha</STMTTRN>\n'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+        )
+        self.assertEqual(
+            [row for _, row in importers.parse_ofx(io.StringIO(ofx))][:2],
+            [
+                {'type': 'gasto', 'amount': '45.90', 'description': 'Farmacia', 'date': '2024-05-10'},
+                {'type': 'ingreso', 'amount': '500.00', 'description': 'Transferencia', 'date': '2024-05-11'},
+            ],
+        )
+
+        with tempfile.NamedTemporaryFile('w', suffix='.ofx', delete=False) as statement:
+            statement.write(ofx)
+        self.addCleanup(os.remove, statement.name)
+        out = io.StringIO()
+        call_command('import_transactions', 'importar', statement.name, '--account', 'banco', stdout=out)
+
+        self.assertIn('(ofx)', out.getvalue())
+        self.assertIn('-> Línea 6:', out.getvalue())
+        self.assertIn('Se crearon 2 transacciones y se omitieron 1 filas', out.getvalue())
+        self.bank.refresh_from_db()
+        self.assertEqual(self.bank.balance, Decimal('1454.10'))
+
+
+class MonthlySummaryTests(TestCase):
+    def test_incremental_matches_rebuild(self):
+        user = User.objects.create_user('acumulados', password='x')
+        bank = Account.objects.create(user=user, name='Banco', balance=1000)
+        food = Category.objects.create(user=user, name='Comida')
+        other = Category.objects.create(user=user, name='Varios')
+        self.client.force_login(user)
+
+        def post(name, args=(), **fields):
+            data = {'type': 'gasto', 'amount': '50', 'description': 'Compra', 'date': '2024-05-10', 'cuenta': bank.pk, **fields}
+            self.client.post(reverse(name, args=args), data, secure=True)
+            return Transaction.objects.latest('id')
+
+        def summaries():
+            return list(
+                MonthlySummary.objects.filter(user=user).exclude(count=0)
+                .order_by('month', 'type', 'category_id')
+                .values_list('month', 'category_id', 'type', 'total', 'count')
+            )
+
+        post('add_transaction', category=food.pk)
+        post('add_transaction', category=other.pk, amount='20')
+        post('add_transaction', type='ingreso', amount='300', date='2024-04-01')
+        edited = post('add_transaction', category=food.pk, amount='15')
+        # Cambio de mes, de tipo y de categoría
+        post('transaction_update', [edited.pk], type='ingreso', date='2024-06-02', category=other.pk)
+        deleted = post('add_transaction', category=other.pk, amount='7')
+        self.client.post(reverse('transaction_delete', args=[deleted.pk]), secure=True)
+
+        # Al borrar la categoría sus acumulados pasan a "Sin Categoría" sin recalcular el historial
+        with mock.patch.object(MonthlySummary, 'rebuild') as rebuild:
+            self.client.post(reverse('category_delete', args=[other.pk]), secure=True)
+        rebuild.assert_not_called()
+
+        incremental = summaries()
+        self.assertIn((datetime.date(2024, 5, 1), None, 'gasto', Decimal('20.00'), 1), incremental)
+        MonthlySummary.rebuild(users=[user])
+        self.assertEqual(summaries(), incremental)
+
+    def test_single_uncategorized_row(self):
+        user = User.objects.create_user('sin-categoria', password='x')
+        month = datetime.date(2024, 5, 1)
+        MonthlySummary.record(user.pk, month, None, 'gasto', Decimal('10'))
+        # Sin categoría (NULL) también hay una sola fila por mes y tipo
+        with self.assertRaises(IntegrityError), db_transaction.atomic():
+            MonthlySummary.objects.create(user=user, month=month, category=None, type='gasto', total=5, count=1)
+
+        # Otra petición creó la fila entre el UPDATE y el INSERT: se suma a esa
+        update = QuerySet.update
+        calls = []
+
+        def first_update_misses(queryset, **changes):
+            calls.append(changes)
+            return 0 if len(calls) == 1 else update(queryset, **changes)
+
+        with mock.patch.object(QuerySet, 'update', first_update_misses):
+            MonthlySummary.record(user.pk, month, None, 'gasto', Decimal('5'))
+        self.assertEqual(len(calls), 2)
+
+        # Borrar la categoría por fuera de la vista (admin) también junta las filas
+        food = Category.objects.create(user=user, name='Comida')
+        MonthlySummary.record(user.pk, month, food.pk, 'gasto', Decimal('20'))
+        food.delete()
+
+        self.assertEqual(
+            list(MonthlySummary.objects.filter(user=user).values_list('category_id', 'total', 'count')),
+            [(None, Decimal('35.00'), 3)],
+        )
+
+
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('libro', password='x')
+        cls.bank = Account.objects.create(user=cls.user, name='Banco', balance=1000)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def add(self, transaction_type, amount, date):
+        self.client.post(reverse('add_transaction'), {
+            'type': transaction_type, 'amount': amount, 'description': 'Movimiento', 'date': date, 'cuenta': self.bank.pk,
+        }, secure=True)
+        return Transaction.objects.latest('id')
+
+    def entries(self):
+        return list(BalanceEntry.objects.filter(account=self.bank).order_by('date').values_list('date', 'balance'))
+
+    def test_running_balances_follow_writes(self):
+        self.add('ingreso', '500', '2024-03-10')
+        self.add('gasto', '200', '2024-03-20')
+        # Un movimiento anterior corrige el saldo de los días siguientes
+        backdated = self.add('gasto', '100', '2024-03-01')
+        self.assertEqual(self.entries(), [
+            (datetime.date(2024, 3, 1), 900), (datetime.date(2024, 3, 10), 1400), (datetime.date(2024, 3, 20), 1200),
+        ])
+        self.bank.refresh_from_db()
+        self.assertEqual(self.bank.balance, 1200)
+        self.assertEqual(ledger.balance_at(self.bank, datetime.date(2024, 2, 1)), 1000)
+        self.assertEqual(ledger.balance_at(self.bank, datetime.date(2024, 3, 15)), 1400)
+
+        self.client.post(reverse('transaction_delete', args=[backdated.pk]), secure=True)
+        self.assertEqual(ledger.balance_at(self.bank, datetime.date(2024, 3, 31)), 1300)
+
+        # Reconstruir desde las transacciones da los mismos saldos
+        incremental = [(date, balance) for date, balance in self.entries() if date != datetime.date(2024, 3, 1)]
+        ledger.rebuild(users=[self.user])
+        self.assertEqual(self.entries(), incremental)
+
+    def test_balances_endpoint(self):
+        self.add('ingreso', '500', '2024-01-10')
+        self.add('gasto', '300', '2024-03-05')
+        Account.objects.create(user=self.user, name='Efectivo', balance=50)
+        response = self.client.get(reverse('reports_balances'), {
+            'date_from': '2024-01-01', 'date_to': '2024-03-31', 'granularity': 'month',
+        }, secure=True)
+        data = response.json()
+        self.assertEqual([account['balances'] for account in data['accounts']], [[1500, 1500, 1200], [50, 50, 50]])
+        self.assertEqual(data['net_worth'], [1550, 1550, 1250])
+
+
+class ReconcileTests(TestCase):
+    def test_reports_and_fixes_drift(self):
+        user = User.objects.create_user('conciliar', password='x')
+        bank = Account.objects.create(user=user, name='Banco', balance=1000)
+        cash = Account.objects.create(user=user, name='Efectivo', balance=100)
+        for cuenta, transaction_type, amount in ((bank, 'gasto', 300), (bank, 'ingreso', 50), (cash, 'gasto', 20)):
+            services.create_transaction(Transaction(
+                user=user, type=transaction_type, amount=Decimal(amount), description='Movimiento',
+                date=datetime.date(2024, 5, 1), cuenta=cuenta,
+            ))
+        self.assertEqual(reconcile.reconcile_shard().mismatches, [])
+
+        # Una escritura que no pasó por el servicio: saldo y libro desfasados
+        Account.objects.filter(pk=bank.pk).update(balance=900)
+        BalanceEntry.objects.filter(account=cash).delete()
+        result = reconcile.reconcile_shard(apply_fix=True)
+        self.assertEqual(
+            [(m.account_id, m.balance, m.ledger_balance, m.expected, m.delta) for m in result.mismatches],
+            [(bank.pk, 900, 750, 750, -150), (cash.pk, 80, 100, 80, 0)],
+        )
+        self.assertEqual(list(Account.objects.order_by('pk').values_list('balance', flat=True)), [750, 80])
+        self.assertEqual(ledger.balance_at(cash, datetime.date(2024, 5, 1)), 80)
+        self.assertEqual(reconcile.reconcile_shard().mismatches, [])
+
+    def test_confirmed_opening_reveals_historical_drift(self):
+        # Como después de la migración 0010: el desvío anterior quedó en el saldo inicial deducido
+        user = User.objects.create_user('conciliar', password='x')
+        bank = Account.objects.create(user=user, name='Banco', balance=1000)
+        services.create_transaction(Transaction(
+            user=user, type='gasto', amount=Decimal(300), description='Movimiento',
+            date=datetime.date(2024, 5, 1), cuenta=bank,
+        ))
+        Account.objects.filter(pk=bank.pk).update(balance=650, opening_balance=950, inferred_opening=950)
+        ledger.rebuild(users=[user])
+        result = reconcile.reconcile_shard()
+        self.assertEqual(result.mismatches, [])
+        self.assertEqual([(o.account_id, o.opening_balance) for o in result.unverified], [(bank.pk, 950)])
+
+        out = io.StringIO()
+        call_command('reconcile_balances', '--opening', str(bank.pk), '1000', '--fix', stdout=out)
+        self.assertIn('diferencia +50', out.getvalue())
+        bank.refresh_from_db()
+        self.assertEqual((bank.opening_balance, bank.inferred_opening, bank.balance), (1000, None, 700))
+        result = reconcile.reconcile_shard()
+        self.assertEqual((result.mismatches, result.unverified), ([], []))
+
+
+class ForecastTests(TestCase):
+    def test_projection_flags_negative_balances(self):
+        user = User.objects.create_user('proyeccion', password='x')
+        bank = Account.objects.create(user=user, name='Banco', balance=500)
+        CategoryRule.objects.create(user=user, pattern='alquiler', cuenta=bank)
+        RecurringTransaction.objects.create(
+            user=user, type='gasto', amount=1200, description='Alquiler', start_date=datetime.date(2024, 1, 3),
+            next_due_date=datetime.date(2024, 3, 3),
+        )
+        RecurringTransaction.objects.create(
+            user=user, type='ingreso', amount=1000, description='Sueldo', start_date=datetime.date(2024, 1, 31),
+            next_due_date=datetime.date(2024, 3, 31),
+        )
+        card = CreditCard.objects.create(user=user, name='Visa', closing_date=25, due_date=10)
+        for cuenta, amount in ((None, 300), (bank, 100)):
+            Transaction.objects.create(
+                user=user, type='gasto', amount=amount, description='Compra', date=datetime.date(2024, 2, 20),
+                tarjeta_usada=card, cuenta=cuenta,
+            )
+
+        today = datetime.date(2024, 3, 1)
+        # Solo la compra sin cuenta queda por pagar: la otra ya descontó su saldo
+        data = forecast.project(
+            [bank], RecurringTransaction.objects.filter(user=user),
+            CreditCard.objects.with_statements(today, without_account=True), matcher_for(user.pk), today, months=1,
+        )
+        self.assertEqual(
+            [(event['date'], event['amount'], event['account']) for event in data['events']],
+            [('2024-03-03', -1200, 'Banco'), ('2024-03-10', -300, forecast.UNASSIGNED_LABEL), ('2024-03-31', 1000, forecast.UNASSIGNED_LABEL)],
+        )
+        bank_row = data['accounts'][0]
+        self.assertEqual((bank_row['negative_dates'], bank_row['min_balance']), (['2024-03-03'], -700))
+        self.assertEqual(data['unassigned']['final_balance'], 700)
+        self.assertEqual((data['total']['min_balance'], data['total']['min_date'], data['total']['final_balance']), (-1000, '2024-03-10', 0))
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('forecast_data'), {'months': 24}, secure=True)
+        self.assertEqual(len(response.json()['labels']), (datetime.date.today() + relativedelta(months=24) - datetime.date.today()).days + 1)
+        self.assertEqual(self.client.get(reverse('forecast_data'), {'months': 99}, secure=True).status_code, 400)
+
+    def test_forecast_data_queries(self):
+        # Sin caché ni reglas compiladas: sesión, usuario, cuentas, fijos, tarjetas y reglas
+        user = User.objects.create_user('proyeccion', password='x')
+        bank = Account.objects.create(user=user, name='Banco', balance=500)
+        CategoryRule.objects.create(user=user, pattern='alquiler', cuenta=bank)
+        RecurringTransaction.objects.create(
+            user=user, type='gasto', amount=1200, description='Alquiler', start_date=datetime.date.today(),
+        )
+        CreditCard.objects.create(user=user, name='Visa', closing_date=25, due_date=10)
+        # Las reglas compiladas viven en la memoria del proceso, no en la caché
+        categorization._compiled.clear()
+        self.client.force_login(user)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('forecast_data'), secure=True)
+        self.assertEqual(response.json()['accounts'][0]['name'], 'Banco')
+        # Con las reglas ya compiladas (y la proyección sin caché) se consulta solo su versión
+        cache.clear()
+        with self.assertNumQueries(6):
+            self.client.get(reverse('forecast_data'), secure=True)
@@ -4,10 +4,22 @@ from . import views
 urlpatterns = [
     # Dashboard
     path('', views.index, name='index'), 
+    # --- Datos de los widgets del dashboard (JSON) ---
+    path('api/dashboard/totals/', views.dashboard_totals, name='dashboard_totals'),
+    path('api/dashboard/categories/', views.dashboard_categories, name='dashboard_categories'),
+    path('api/dashboard/budgets/', views.dashboard_budgets, name='dashboard_budgets'),
+    path('api/dashboard/cards/', views.dashboard_cards, name='dashboard_cards'),
     # --- URL de lista de transacciones ---
     path('transactions/', views.transaction_list, name='transaction_list'),
+    path('transactions/more/', views.transaction_list_more, name='transaction_list_more'),
+    path('transactions/import/', views.transaction_import, name='transaction_import'),
+    path('transactions/export/', views.transaction_export, name='transaction_export'),
     #  --- URL de reportes ---
     path('reports/', views.reports, name='reports'),
+    path('api/reports/series/', views.reports_series, name='reports_series'),
+    path('api/reports/balances/', views.reports_balances, name='reports_balances'),
+    path('forecast/', views.forecast, name='forecast'),
+    path('api/forecast/', views.forecast_data, name='forecast_data'),
     # --- URLs de Transacciones ---
     path('transaction/add/', views.add_transaction, name='add_transaction'),
     path('category/add/', views.add_category, name='add_category'),
@@ -34,4 +46,9 @@ urlpatterns = [
     # --- URLS PARA PRESUPUESTOS ---
     path('budgets/', views.manage_budgets, name='manage_budgets'),
     path('budgets/delete/<int:pk>/', views.delete_budget, name='delete_budget'),
+    path('budgets/alerts/read/', views.budget_alerts_read, name='budget_alerts_read'),
+
+    # --- URLS PARA REGLAS DE CATEGORIZACIÓN ---
+    path('rules/', views.manage_rules, name='manage_rules'),
+    path('rules/delete/<int:pk>/', views.delete_rule, name='delete_rule'),
 ]
\ No newline at end of file
@@ -1,51 +1,43 @@
-from django.shortcuts import render, redirect
-from django.urls import reverse_lazy
-from django.views import generic
-from django.contrib.auth.forms import UserCreationForm
-from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
-from django.shortcuts import get_object_or_404 # Para eliminar
-from .models import Transaction, Category, RecurringTransaction, CreditCard, Account, Budget
-from .forms import TransactionForm, CategoryForm, RecurringTransactionForm, CreditCardForm, AccountForm, BudgetForm
-
-# Importamos los modelos y los nuevos formularios
-from .models import Transaction, Category
-from .forms import TransactionForm, CategoryForm
-from django.db.models import Sum # Para sumar en la base de datos
-import datetime # Para saber el mes actual
-from decimal import Decimal
-# Para manejar errores (ej. si crea un presupuesto duplicado)
-from django.db import IntegrityError
-from django.contrib import messages
-from django.db.models import Sum # Para sumar en la base de datos
-from django.db.models import F
-import datetime # Para saber el mes actual
-from django.db.models import Sum, F, Q
-from django.db.models.functions import TruncMonth
+import asyncio
+import copy
+import csv
 import datetime
+import io
+import json
+from decimal import Decimal
 
-
-# Vista Basada en Clase para el Registro
-from django.shortcuts import render, redirect, get_object_or_404
-from django.urls import reverse_lazy
-from django.views import generic
-from django.contrib.auth.forms import UserCreationForm
+from asgiref.sync import sync_to_async
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from dateutil.relativedelta import relativedelta
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.contrib.auth.forms import UserCreationForm
 from django.db import IntegrityError
-from django.contrib import messages
-from django.db.models import Sum, F, Q
-from django.db.models.functions import TruncMonth
-from decimal import Decimal
-import datetime
-
-from .models import (
-    Transaction, Category, RecurringTransaction,
-    CreditCard, Account, Budget
-)
+from django.db.models import Q, Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse, reverse_lazy
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views import generic
+from django.views.decorators.http import require_GET, require_POST
+
+from . import budgets as budget_tracking
+from . import cache as user_cache
+from . import categorization
+from . import forecast as forecast_engine
+from . import importers
+from . import ledger
+from . import reference as user_reference
+from . import reports as reports_data
+from . import services
 from .forms import (
     TransactionForm, CategoryForm, RecurringTransactionForm,
-    CreditCardForm, AccountForm, BudgetForm
+    CreditCardForm, AccountForm, BudgetForm, TransactionFilterForm,
+    TransactionImportForm, ReportFilterForm, CategoryRuleForm, ForecastForm
+)
+from .models import (
+    Transaction, Category, RecurringTransaction,
+    CreditCard, Account, BalanceEntry, Budget, BudgetAlert, BudgetPeriod, MonthlySummary, CategoryRule
 )
 
 
@@ -57,131 +49,458 @@ class SignUpView(generic.CreateView):
 
 
 # --- Dashboard principal ---
-@login_required
-def index(request):
-    # --- Filtro de fechas según el período seleccionado ---
+# La página (index) devuelve solo la estructura, las cuentas y los últimos movimientos;
+# cada widget (totales, gastos por categoría, presupuestos y tarjetas) se pide después
+# por separado a su endpoint JSON y se cachea por su cuenta.
+def _dashboard_period(request, today):
+    """Devuelve (periodo, filtro de transacciones, filtro de MonthlySummary) según ?periodo=."""
     periodo = request.GET.get('periodo', 'este_mes')
-    today = datetime.date.today()
-    
+
     if periodo == 'mes_pasado':
         first_day_current_month = today.replace(day=1)
         last_day_last_month = first_day_current_month - datetime.timedelta(days=1)
         start_date = last_day_last_month.replace(day=1)
         end_date = last_day_last_month
-        date_filter_query = {'date__gte': start_date, 'date__lte': end_date}
+        return periodo, {'date__gte': start_date, 'date__lte': end_date}, {'month': start_date}
 
-    elif periodo == 'este_ano':
+    if periodo == 'este_ano':
         start_date = today.replace(month=1, day=1)
-        date_filter_query = {'date__gte': start_date}
+        return periodo, {'date__gte': start_date}, {'month__gte': start_date}
+
+    # este_mes
+    start_date = today.replace(day=1)
+    return 'este_mes', {'date__gte': start_date}, {'month__gte': start_date}
+
+
+async def _dashboard_category_rows(user, summary_filter_query):
+    """
+    Gastos e ingresos del período por id de categoría (None = Sin Categoría).
+    Una sola consulta: los acumulados mensuales (MonthlySummary) agrupados por categoría,
+    con gastos e ingresos como sumas condicionales. La cantidad de consultas no depende
+    de cuántas categorías tenga el usuario.
+    """
+    totals_by_category = (
+        MonthlySummary.objects.filter(user=user, **summary_filter_query)
+        .values('category_id', 'category__name')
+        .annotate(
+            spent=Sum('total', filter=Q(type='gasto')),
+            earned=Sum('total', filter=Q(type='ingreso')),
+        )
+        .order_by()
+    )
+
+    # Filas por categoría, en el orden en que llegan
+    rows = {}
+    async for item in totals_by_category:
+        rows[item['category_id']] = {
+            'name': item['category__name'],
+            'spent': item['spent'] or Decimal('0.00'),
+            'earned': item['earned'] or Decimal('0.00'),
+        }
+    return rows
+
+
+async def _auser(request):
+    """
+    Usuario logueado en una vista async. Queda también en request.user, así las
+    partes síncronas (formularios, plantillas) no lo vuelven a consultar.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _dashboard_widget(request, name, compute):
+    """
+    Devuelve los datos de un widget del dashboard para el período pedido, cacheados
+    hasta que el usuario modifique sus datos. `compute(user, summary_filter_query, today)`
+    es una función async que los calcula.
+    """
+    user = await _auser(request)
+    today = datetime.date.today()
+    periodo, _, summary_filter_query = _dashboard_period(request, today)
+    return await user_cache.aget_or_compute(
+        user.pk,
+        f'dashboard:{name}:{periodo}:{today.isoformat()}',
+        lambda: compute(user, summary_filter_query, today),
+    )
+
 
-    else:  # este_mes
-        periodo = 'este_mes'
-        start_date = today.replace(day=1)
-        date_filter_query = {'date__gte': start_date}
+async def _cached_category_rows(request):
+    return await _dashboard_widget(
+        request, 'rows',
+        lambda user, summary_filter_query, today: _dashboard_category_rows(user, summary_filter_query),
+    )
 
-    # Formularios que se usan en los modales del dashboard
-    t_form = TransactionForm(user=request.user)
-    c_form = CategoryForm()
 
-    # Consultas principales
-    categories = Category.objects.filter(user=request.user)
-    cards = CreditCard.objects.filter(user=request.user)
-    accounts = Account.objects.filter(user=request.user)
-    transactions = Transaction.objects.filter(
-        user=request.user,
+# Los widgets son vistas async: con un servidor ASGI (uvicorn, daphne) esperan a la base
+# sin ocupar un hilo por petición, y las consultas independientes se lanzan juntas.
+@login_required
+@require_GET
+async def dashboard_totals(request):
+    """Saldo total de las cuentas y gastos, ingresos y cambio neto del período."""
+    async def compute(user, summary_filter_query, today):
+        rows, balance = await asyncio.gather(
+            _cached_category_rows(request),
+            Account.objects.filter(user=user).aaggregate(total=Sum('balance')),
+        )
+        total_spent = sum((row['spent'] for row in rows.values()), Decimal('0.00'))
+        total_earned = sum((row['earned'] for row in rows.values()), Decimal('0.00'))
+        total_balance = balance['total'] or Decimal('0.00')
+        return {
+            'total_balance': float(total_balance),
+            'total_spent': float(total_spent),
+            'total_earned': float(total_earned),
+            'net_change': float(total_earned - total_spent),
+        }
+
+    return JsonResponse(await _dashboard_widget(request, 'totals', compute))
+
+
+@login_required
+@require_GET
+async def dashboard_categories(request):
+    """Gastos del período por categoría (datos del gráfico)."""
+    async def compute(user, summary_filter_query, today):
+        categories = [
+            {
+                'id': category_id,
+                'label': row['name'] or 'Sin Categoría',
+                'total': float(row['spent']),
+            }
+            for category_id, row in (await _cached_category_rows(request)).items() if row['spent']
+        ]
+        return {
+            'categories': categories,
+            'total_spent': sum(category['total'] for category in categories),
+        }
+
+    return JsonResponse(await _dashboard_widget(request, 'categories', compute))
+
+
+# Avisos de presupuesto sin leer que se muestran en el dashboard
+MAX_DASHBOARD_ALERTS = 5
+
+
+@login_required
+@require_GET
+async def dashboard_budgets(request):
+    """
+    Progreso de cada presupuesto en su período actual (semana, mes o año) y avisos sin
+    leer. Lee los contadores de BudgetPeriod: no depende del período elegido en el dashboard.
+    """
+    async def compute(user, summary_filter_query, today):
+        # Presupuestos, sus períodos del último año (el anterior sirve para el arrastre) y avisos
+        budget_list, periods, alerts = await asyncio.gather(
+            _alist(Budget.objects.filter(user=user).select_related('category')),
+            _alist(BudgetPeriod.objects.filter(
+                budget__user=user, start__lte=today, end__gte=today - relativedelta(years=1),
+            )),
+            _alist(
+                BudgetAlert.objects.filter(user=user, read=False)
+                .select_related('period__budget__category')
+                .order_by('-created_at')[:MAX_DASHBOARD_ALERTS]
+            ),
+        )
+        return {
+            'budgets': budget_tracking.progress(budget_list, periods, today),
+            'alerts': [
+                {
+                    'category_name': alert.period.budget.category.name,
+                    'threshold': alert.threshold,
+                    'spent': float(alert.spent),
+                    'limit': float(alert.period.limit),
+                }
+                for alert in alerts
+            ],
+        }
+
+    return JsonResponse(await _dashboard_widget(request, 'budgets', compute))
+
+
+@login_required
+@require_GET
+async def dashboard_cards(request):
+    """Resúmenes de las tarjetas de crédito (a pagar, próximo y anterior)."""
+    user = await _auser(request)
+    today = datetime.date.today()
+
+    async def compute():
+        return {
+            'cards': [
+                {
+                    'id': card.pk,
+                    'name': card.name,
+                    'balance_due': float(card.balance_due),
+                    'next_statement': float(card.next_statement),
+                    'previous_statement': float(card.previous_statement),
+                }
+                async for card in CreditCard.objects.filter(user=user).with_statements(today)
+            ],
+        }
+
+    # Los resúmenes no dependen del período elegido en el dashboard
+    return JsonResponse(await user_cache.aget_or_compute(
+        user.pk, f'dashboard:cards:{today.isoformat()}', compute,
+    ))
+
+
+async def _dashboard_modal_forms(user, reference):
+    """
+    HTML de los formularios vacíos de los modales del dashboard. Solo dependen de las
+    opciones (categorías, tarjetas y cuentas) del usuario, así que se cachean con una
+    versión calculada a partir de esas listas: cambian solo cuando cambian las opciones.
+    Las listas tienen que estar cargadas (reference.aload).
+    """
+    version = user_cache.content_version(*(
+        [(obj.pk, str(obj)) for obj in objects]
+        for objects in (reference.categories, reference.cards, reference.accounts)
+    ))
+
+    @sync_to_async
+    def render_forms():
+        return {
+            'transaction': as_crispy_form(TransactionForm(reference=reference)),
+            'category': as_crispy_form(CategoryForm()),
+        }
+
+    return await user_cache.aget_or_compute(user.pk, 'dashboard_forms', render_forms, version=version)
+
+
+@login_required
+async def index(request):
+    user = await _auser(request)
+
+    # --- Filtro de fechas según el período seleccionado ---
+    today = datetime.date.today()
+    periodo, date_filter_query, _ = _dashboard_period(request, today)
+
+    # Últimos movimientos y opciones del usuario (categorías, tarjetas, cuentas), a la vez
+    reference = user_reference.for_request(request)
+    recent_transactions = Transaction.objects.filter(
+        user=user,
         **date_filter_query
-    ).order_by('-date')
-
-    # --- Cálculos principales del dashboard ---
-    total_spent = transactions.filter(type='gasto').aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    total_earned = transactions.filter(type='ingreso').aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    net_change = total_earned - total_spent
-    total_balance = accounts.aggregate(Sum('balance'))['balance__sum'] or 0.00
-
-    # Datos para el gráfico de gastos por categoría
-    expense_data = transactions.filter(type='gasto').values('category__name').annotate(total=Sum('amount'))
-    chart_labels = []
-    chart_data = []
-    for item in expense_data:
-        label = item['category__name'] if item['category__name'] else 'Sin Categoría'
-        chart_labels.append(label)
-        chart_data.append(float(item['total']))
-
-    # Progreso de presupuestos (comparación gasto vs límite)
-    budgets = Budget.objects.filter(user=request.user).select_related('category')
-    budgets_progress = []
-    gastos_por_categoria = {
-        item['category__name']: item['total']
-        for item in expense_data if item['category__name']
-    }
+    ).select_related('cuenta').order_by('-date')[:5]
+    transactions, _ = await asyncio.gather(
+        _alist(recent_transactions),
+        reference.aload('categories', 'cards', 'accounts'),
+    )
 
-    for budget in budgets:
-        spent = gastos_por_categoria.get(budget.category.name, Decimal('0.00'))
-        percentage = (spent / budget.amount * 100) if budget.amount > 0 else 0
-        budgets_progress.append({
-            'category_name': budget.category.name,
-            'limit': budget.amount,
-            'spent': spent,
-            'percentage': min(percentage, 100),
-            'over_limit': spent > budget.amount,
-        })
+    # Formularios que se usan en los modales del dashboard (HTML cacheado)
+    modal_forms = await _dashboard_modal_forms(user, reference)
 
     context = {
-        't_form': t_form,
-        'c_form': c_form,
+        't_form_html': modal_forms['transaction'],
+        'c_form_html': modal_forms['category'],
         'transactions': transactions,
-        'categories': categories,
-        'cards': cards,
-        'accounts': accounts,
-        'total_spent': total_spent,
-        'chart_labels': chart_labels,
-        'chart_data': chart_data,
+        'categories': reference.categories,
+        'accounts': reference.accounts,
         'selected_periodo': periodo,
-        'budgets_progress': budgets_progress,
-        'total_balance': total_balance,
-        'net_change': net_change,
+        # Query string que reciben los endpoints de los widgets
+        'widget_query': f'?periodo={periodo}',
     }
 
-    return render(request, 'tracker/index.html', context)
+    # Los datos ya están cargados: la plantilla se renderiza fuera del event loop
+    return await sync_to_async(render)(request, 'tracker/index.html', context)
 
 
 # --- Lista de transacciones ---
+# Cantidad de transacciones por página de la lista
+TRANSACTIONS_PAGE_SIZE = 50
+
+
+def _filtered_transactions(request):
+    """Devuelve el formulario de filtros y las transacciones del usuario ya filtradas."""
+    filter_form = TransactionFilterForm(request.GET or None, reference=user_reference.for_request(request))
+    transactions = filter_form.filter_queryset(
+        Transaction.objects.filter(user=request.user), request.user,
+    )
+    return filter_form, transactions
+
+
+def _parse_cursor(cursor):
+    """Convierte un cursor 'AAAA-MM-DD_id' en (fecha, id). Devuelve None si no es válido."""
+    try:
+        date_str, pk = cursor.split('_')
+        return datetime.date.fromisoformat(date_str), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _transactions_query(request):
+    """
+    Devuelve (formulario de filtros, queryset de la página pedida, posición del cursor).
+    Pagina por cursor (keyset) sobre (date, id): en lugar de OFFSET se continúa desde
+    la última fila vista, así cualquier página cuesta lo mismo que la primera.
+    """
+    filter_form, transactions = _filtered_transactions(request)
+    # También con búsqueda: el ranking solo ordena dentro de la página (ver tracker.search)
+    transactions = transactions.select_related('category', 'cuenta').order_by('-date', '-id')
+    position = _parse_cursor(request.GET.get('cursor'))
+    if position:
+        last_date, last_pk = position
+        transactions = transactions.filter(
+            Q(date__lt=last_date) | Q(date=last_date, id__lt=last_pk)
+        )
+
+    # Pedimos una fila de más para saber si hay otra página
+    return filter_form, transactions[:TRANSACTIONS_PAGE_SIZE + 1], position
+
+
+async def _transactions_page(request):
+    """Contexto de una página de la lista de transacciones (primera o "Cargar más")."""
+    await _auser(request)
+    # Opciones de los filtros cargadas con el ORM async; la validación del formulario
+    # (que consulta la base) corre en un hilo
+    await user_reference.for_request(request).aload('categories', 'accounts')
+    filter_form, transactions, position = await sync_to_async(_transactions_query)(request)
+
+    page = await _alist(transactions)
+    next_url = None
+    if len(page) > TRANSACTIONS_PAGE_SIZE:
+        page = page[:TRANSACTIONS_PAGE_SIZE]
+        last = page[-1]
+        query = request.GET.copy()
+        query['cursor'] = f"{last.date.isoformat()}_{last.pk}"
+        next_url = f"{reverse('transaction_list_more')}?{query.urlencode()}"
+    if filter_form.search_text():
+        # Las más relevantes de la página primero (sort estable: a igual ranking, por fecha)
+        page.sort(key=lambda transaction: transaction.search_rank, reverse=True)
+
+    return {
+        'filter_form': filter_form,
+        'transactions': page,
+        'next_url': next_url,
+        'is_first_page': position is None,
+    }
+
+
 @login_required
-def transaction_list(request):
-    # Trae todas las transacciones del usuario (optimizado con select_related)
-    transactions = Transaction.objects.filter(
-        user=request.user
-    ).select_related('category', 'cuenta').order_by('-date')
+async def transaction_list(request):
+    context = await _transactions_page(request)
+    return await sync_to_async(render)(request, 'tracker/transaction_list.html', context)
+
 
-    return render(request, 'tracker/transaction_list.html', {'transactions': transactions})
+# --- Siguiente página de la lista ("Cargar más") ---
+# Devuelve solo el fragmento HTML con las filas siguientes
+@login_required
+@require_GET
+async def transaction_list_more(request):
+    context = await _transactions_page(request)
+    return await sync_to_async(render)(request, 'tracker/transaction_rows.html', context)
 
 
 # --- Agregar transacción ---
 @login_required
+@user_cache.invalidates_user_data
 @require_POST
 def add_transaction(request):
-    t_form = TransactionForm(request.POST, user=request.user)
+    t_form = TransactionForm(request.POST, reference=user_reference.for_request(request))
     if t_form.is_valid():
         new_transaction = t_form.save(commit=False)
         new_transaction.user = request.user
+        # Saldo, acumulados, presupuestos y reglas de categorización, en una sola transacción
+        services.create_transaction(new_transaction)
+
+    return redirect('index')
+
 
-        cuenta = new_transaction.cuenta
-        amount = new_transaction.amount
+# --- Exportar transacciones (CSV / JSON) ---
+# Columnas exportadas: los encabezados coinciden con los que acepta la importación
+EXPORT_COLUMNS = (
+    ('date', 'date'),
+    ('type', 'type'),
+    ('amount', 'amount'),
+    ('description', 'description'),
+    ('category', 'category__name'),
+    ('cuenta', 'cuenta__name'),
+    ('tarjeta_usada', 'tarjeta_usada__name'),
+)
+EXPORT_CHUNK_SIZE = 2000
 
-        # Actualizamos el saldo de la cuenta según el tipo
-        if new_transaction.type == 'ingreso':
-            cuenta.balance = F('balance') + amount
-        elif new_transaction.type == 'gasto':
-            cuenta.balance = F('balance') - amount
 
-        cuenta.save()
-        new_transaction.save()
-    
-    return redirect('index')
+class _Echo:
+    """Pseudo-buffer para csv.writer: devuelve cada línea en lugar de guardarla."""
+    def write(self, value):
+        return value
+
+
+def _export_csv_rows(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _export_json_rows(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(dict(zip(names, row)), default=str, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+@login_required
+@require_GET
+def transaction_export(request):
+    """
+    Exporta el historial (con los mismos filtros que la lista) sin cargarlo en memoria:
+    las filas se leen con un cursor del servidor y se envían a medida que se generan.
+    """
+    export_format = 'json' if request.GET.get('format') == 'json' else 'csv'
+    _, transactions = _filtered_transactions(request)
+    rows = transactions \
+        .order_by('date', 'id') \
+        .values_list(*(lookup for _, lookup in EXPORT_COLUMNS)) \
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    if export_format == 'json':
+        response = StreamingHttpResponse(_export_json_rows(rows), content_type='application/json')
+    else:
+        response = StreamingHttpResponse(_export_csv_rows(rows), content_type='text/csv; charset=utf-8')
+
+    filename = f"spendly-transacciones-{datetime.date.today():%Y%m%d}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# --- Importar extracto bancario (CSV / OFX) ---
+@login_required
+@user_cache.invalidates_user_data
+def transaction_import(request):
+    if request.method == 'POST':
+        form = TransactionImportForm(request.POST, request.FILES, reference=user_reference.for_request(request))
+        if form.is_valid():
+            uploaded = form.cleaned_data['file']
+            file_format = form.cleaned_data['file_format'] or importers.detect_format(uploaded.name)
+            # Se lee el archivo subido línea por línea, sin cargarlo completo en memoria
+            lines = io.TextIOWrapper(uploaded.file, encoding='utf-8-sig', errors='replace', newline='')
+            result = importers.import_transactions(
+                request.user, lines,
+                file_format=file_format,
+                default_cuenta=form.cleaned_data['cuenta'],
+            )
+
+            messages.success(request, f'Se importaron {result.created} transacciones.')
+            if result.skipped:
+                messages.warning(request, f'Se omitieron {result.skipped} filas con errores.')
+            for error in result.errors:
+                messages.error(request, error)
+            return redirect('transaction_import')
+    else:
+        form = TransactionImportForm(reference=user_reference.for_request(request))
+
+    return render(request, 'tracker/transaction_import.html', {'form': form})
 
 
 # --- Agregar categoría ---
 @login_required
+@user_cache.invalidates_user_data
 @require_POST
 def add_category(request):
     c_form = CategoryForm(request.POST)
@@ -194,90 +513,64 @@ def add_category(request):
 
 # --- Eliminar categoría ---
 @login_required
+@user_cache.invalidates_user_data
 @require_POST
 def category_delete(request, pk):
     category = get_object_or_404(Category, pk=pk, user=request.user)
+    # Las transacciones de la categoría quedan "Sin Categoría": sus acumulados también (pre_delete)
     category.delete()
     return redirect('index')
 
 
 # --- Editar transacción ---
 @login_required
+@user_cache.invalidates_user_data
 def transaction_update(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk, user=request.user)
+    old_transaction = copy.copy(transaction)  # Copia para revertir los efectos anteriores
 
-    old_amount = transaction.amount
-    old_type = transaction.type
-    old_cuenta = transaction.cuenta
-    
     if request.method == 'POST':
-        form = TransactionForm(request.POST, instance=transaction, user=request.user)
+        form = TransactionForm(request.POST, instance=transaction, reference=user_reference.for_request(request))
         if form.is_valid():
-            # Revertimos el saldo anterior antes de aplicar el nuevo
-            if old_cuenta:
-                if old_type == 'ingreso':
-                    old_cuenta.balance = F('balance') - old_amount
-                elif old_type == 'gasto':
-                    old_cuenta.balance = F('balance') + old_amount
-                old_cuenta.save()
-
-            # Aplicamos los nuevos valores
-            new_transaction = form.save(commit=False)
-            new_cuenta = new_transaction.cuenta
-            new_amount = new_transaction.amount
-            
-            if new_transaction.type == 'ingreso':
-                new_cuenta.balance = F('balance') + new_amount
-            elif new_transaction.type == 'gasto':
-                new_cuenta.balance = F('balance') - new_amount
-
-            new_cuenta.save()
-            new_transaction.save()
+            # Revierte la versión anterior y aplica la nueva (cambio de cuenta, de tipo o de monto)
+            services.update_transaction(form.save(commit=False), old_transaction)
             return redirect('index')
     else:
-        form = TransactionForm(instance=transaction, user=request.user)
+        form = TransactionForm(instance=transaction, reference=user_reference.for_request(request))
         
     return render(request, 'tracker/transaction_form.html', {'form': form, 'transaction': transaction})
 
 
 # --- Eliminar transacción ---
 @login_required
+@user_cache.invalidates_user_data
 @require_POST
 def transaction_delete(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk, user=request.user)
-
-    cuenta = transaction.cuenta
-    amount = transaction.amount
-
-    # Revertimos el impacto en el saldo antes de eliminar
-    if cuenta:
-        if transaction.type == 'ingreso':
-            cuenta.balance = F('balance') - amount
-        elif transaction.type == 'gasto':
-            cuenta.balance = F('balance') + amount
-        cuenta.save()
-    
-    transaction.delete()
+    # Borra y revierte saldo, acumulados y presupuestos juntos
+    services.delete_transaction(transaction)
     return redirect('index')
 
 
 # --- Transacciones recurrentes ---
 @login_required
+@user_cache.invalidates_user_data
 def manage_recurring(request):
     if request.method == 'POST':
-        form = RecurringTransactionForm(request.POST, user=request.user)
+        form = RecurringTransactionForm(request.POST, reference=user_reference.for_request(request))
         if form.is_valid():
             recurring = form.save(commit=False)
             recurring.user = request.user
             recurring.save()
             return redirect('manage_recurring')
 
-    form = RecurringTransactionForm(user=request.user)
+    form = RecurringTransactionForm(reference=user_reference.for_request(request))
     items = RecurringTransaction.objects.filter(user=request.user)
     return render(request, 'tracker/manage_recurring.html', {'form': form, 'items': items})
 
 
 @login_required
+@user_cache.invalidates_user_data
 def delete_recurring(request, pk):
     item = get_object_or_404(RecurringTransaction, pk=pk, user=request.user)
     if request.method == 'POST':
@@ -287,6 +580,7 @@ def delete_recurring(request, pk):
 
 # --- Tarjetas de crédito ---
 @login_required
+@user_cache.invalidates_user_data
 def manage_cards(request):
     if request.method == 'POST':
         form = CreditCardForm(request.POST)
@@ -297,11 +591,12 @@ def manage_cards(request):
             return redirect('manage_cards')
 
     form = CreditCardForm()
-    items = CreditCard.objects.filter(user=request.user)
+    items = CreditCard.objects.filter(user=request.user).with_statements()
     return render(request, 'tracker/manage_cards.html', {'form': form, 'items': items})
 
 
 @login_required
+@user_cache.invalidates_user_data
 def delete_card(request, pk):
     item = get_object_or_404(CreditCard, pk=pk, user=request.user)
     if request.method == 'POST':
@@ -311,6 +606,7 @@ def delete_card(request, pk):
 
 # --- Cuentas bancarias ---
 @login_required
+@user_cache.invalidates_user_data
 def manage_accounts(request):
     if request.method == 'POST':
         form = AccountForm(request.POST)
@@ -326,6 +622,7 @@ def manage_accounts(request):
 
 
 @login_required
+@user_cache.invalidates_user_data
 def delete_account(request, pk):
     account = get_object_or_404(Account, pk=pk, user=request.user)
 
@@ -338,27 +635,34 @@ def delete_account(request, pk):
 
 # --- Presupuestos ---
 @login_required
+@user_cache.invalidates_user_data
 def manage_budgets(request):
     if request.method == 'POST':
-        form = BudgetForm(request.POST, user=request.user)
+        form = BudgetForm(request.POST, reference=user_reference.for_request(request))
         if form.is_valid():
             try:
                 budget = form.save(commit=False)
                 budget.user = request.user
                 budget.save()
+                # El período actual arranca con lo ya gastado en la categoría
+                budget_tracking.open_period(budget, datetime.date.today())
                 return redirect('manage_budgets')
             except IntegrityError:
                 messages.error(request, 'Error: Ya existe un presupuesto para esa categoría.')
         else:
             messages.error(request, 'Por favor, corrija los errores en el formulario.')
 
-    form = BudgetForm(user=request.user)
+    form = BudgetForm(reference=user_reference.for_request(request))
     budgets = Budget.objects.filter(user=request.user).select_related('category')
+    alerts = BudgetAlert.objects.filter(user=request.user, read=False) \
+        .select_related('period__budget__category') \
+        .order_by('-created_at')
 
-    return render(request, 'tracker/manage_budgets.html', {'form': form, 'budgets': budgets})
+    return render(request, 'tracker/manage_budgets.html', {'form': form, 'budgets': budgets, 'alerts': alerts})
 
 
 @login_required
+@user_cache.invalidates_user_data
 @require_POST
 def delete_budget(request, pk):
     budget = get_object_or_404(Budget, pk=pk, user=request.user)
@@ -366,47 +670,149 @@ def delete_budget(request, pk):
     return redirect('manage_budgets')
 
 
-# --- Reportes anuales ---
+# --- Marcar los avisos de presupuesto como leídos ---
 @login_required
-def reports(request):
-    today = datetime.date.today()
+@user_cache.invalidates_user_data
+@require_POST
+def budget_alerts_read(request):
+    BudgetAlert.objects.filter(user=request.user, read=False).update(read=True)
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('manage_budgets')
 
-    transactions_this_year = Transaction.objects.filter(
-        user=request.user,
-        date__year=today.year
+
+# --- Reglas de categorización ---
+@login_required
+@user_cache.invalidates_user_data
+def manage_rules(request):
+    if request.method == 'POST':
+        form = CategoryRuleForm(request.POST, reference=user_reference.for_request(request))
+        if form.is_valid():
+            rule = form.save(commit=False)
+            rule.user = request.user
+            rule.save()
+            return redirect('manage_rules')
+        messages.error(request, 'Por favor, corrija los errores en el formulario.')
+    else:
+        form = CategoryRuleForm(reference=user_reference.for_request(request))
+
+    rules = CategoryRule.objects.filter(user=request.user) \
+        .select_related('category', 'cuenta') \
+        .order_by('priority', 'id')
+    return render(request, 'tracker/manage_rules.html', {'form': form, 'rules': rules})
+
+
+@login_required
+@user_cache.invalidates_user_data
+@require_POST
+def delete_rule(request, pk):
+    rule = get_object_or_404(CategoryRule, pk=pk, user=request.user)
+    rule.delete()
+    return redirect('manage_rules')
+
+
+# --- Informes ---
+async def _report_series(user, params):
+    """Series del informe: una consulta agrupada y el cálculo de las series derivadas."""
+    rows = [row async for row in reports_data.bucket_queryset(
+        user, params['date_from'], params['date_to'], params['granularity'], params['compare'],
+    )]
+    return reports_data.build_series(
+        rows, params['date_from'], params['date_to'], params['granularity'], params['compare'],
     )
 
-    # Agrupamos ingresos y gastos por mes
-    report_data = transactions_this_year \
-        .annotate(month=TruncMonth('date')) \
-        .values('month') \
-        .annotate(
-            total_ingreso=Sum('amount', filter=Q(type='ingreso')),
-            total_gasto=Sum('amount', filter=Q(type='gasto'))
-        ) \
-        .order_by('month')
-
-    # Mapa de meses con valores por defecto en 0
-    month_map = {i: {'ingreso': 0, 'gasto': 0} for i in range(1, 13)}
-
-    for item in report_data:
-        if item['month']:
-            month_num = item['month'].month
-            month_map[month_num]['ingreso'] = item['total_ingreso'] or 0
-            month_map[month_num]['gasto'] = item['total_gasto'] or 0
-
-    # Datos finales para el gráfico
-    labels = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
-    chart_labels, chart_ingresos, chart_gastos = [], [], []
-
-    for i in range(1, 13):
-        if i <= today.month:
-            chart_labels.append(labels[i - 1])
-            chart_ingresos.append(float(month_map[i]['ingreso']))
-            chart_gastos.append(float(month_map[i]['gasto']))
-
-    return render(request, 'tracker/reports.html', {
-        'chart_labels': chart_labels,
-        'chart_ingresos': chart_ingresos,
-        'chart_gastos': chart_gastos,
-    })
+
+@login_required
+async def reports(request):
+    # La página solo trae la estructura y los filtros: las series se piden a reports_series
+    await _auser(request)
+    form = ReportFilterForm(request.GET)
+    return await sync_to_async(render)(request, 'tracker/reports.html', {'form': form})
+
+
+@login_required
+@require_GET
+async def reports_series(request):
+    """Series de ingresos y gastos del rango y la granularidad pedidos (datos del gráfico de informes)."""
+    user = await _auser(request)
+    form = ReportFilterForm(request.GET)
+    params = form.report_params()
+    if params is None:
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+
+    key = 'reports:{granularity}:{date_from:%Y-%m-%d}:{date_to:%Y-%m-%d}:{compare:d}'.format(**params)
+    report = await user_cache.aget_or_compute(user.pk, key, lambda: _report_series(user, params))
+    return JsonResponse(report)
+
+
+async def _balance_series(user, params):
+    # Saldo al empezar el primer período (una subconsulta indexada por cuenta) y las filas del libro del rango
+    first = reports_data.bucket_start(params['date_from'], params['granularity'])
+    accounts, entries = await asyncio.gather(
+        _alist(ledger.with_balance_before(Account.objects.filter(user=user).order_by('name', 'pk'), first)),
+        _alist(BalanceEntry.objects.filter(
+            account__user=user, date__gte=first, date__lte=params['date_to'],
+        ).only('account_id', 'date', 'balance')),
+    )
+    return reports_data.build_balance_series(
+        accounts, entries, params['date_from'], params['date_to'], params['granularity'],
+    )
+
+
+@login_required
+@require_GET
+async def reports_balances(request):
+    """Saldo de cada cuenta y patrimonio total al cierre de cada período (desde el libro de saldos)."""
+    user = await _auser(request)
+    form = ReportFilterForm(request.GET)
+    params = form.report_params()
+    if params is None:
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+
+    key = 'reports:balances:{granularity}:{date_from:%Y-%m-%d}:{date_to:%Y-%m-%d}'.format(**params)
+    balances = await user_cache.aget_or_compute(user.pk, key, lambda: _balance_series(user, params))
+    return JsonResponse(balances)
+
+
+# --- Proyección del flujo de caja ---
+@login_required
+async def forecast(request):
+    # La página solo trae la estructura: la proyección se pide a forecast_data
+    await _auser(request)
+    form = ForecastForm(request.GET)
+    return await sync_to_async(render)(request, 'tracker/forecast.html', {'form': form})
+
+
+async def _forecast(user, today, months):
+    accounts, rules, cards, matcher = await asyncio.gather(
+        _alist(Account.objects.filter(user=user).order_by('name', 'pk')),
+        _alist(RecurringTransaction.objects.filter(user=user).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=today)
+        )),
+        _alist(CreditCard.objects.filter(user=user).with_statements(today, without_account=True)),
+        sync_to_async(categorization.matcher_for)(user.pk),
+    )
+    return forecast_engine.project(accounts, rules, cards, matcher, today, months)
+
+
+@login_required
+@require_GET
+async def forecast_data(request):
+    """Saldo diario proyectado por cuenta con los fijos y los pagos de tarjetas, y los días en negativo."""
+    user = await _auser(request)
+    form = ForecastForm(request.GET)
+    months = form.forecast_months()
+    if months is None:
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+
+    today = datetime.date.today()
+    # Depende de los datos y también de las reglas (asignan la cuenta de cada fijo)
+    version = '{}-{}'.format(
+        await user_cache.adata_version(user.pk),
+        await user_cache.adata_version(user.pk, scope=categorization.RULES_SCOPE),
+    )
+    data = await user_cache.aget_or_compute(
+        user.pk, f'forecast:{months}:{today.isoformat()}', lambda: _forecast(user, today, months), version=version,
+    )
+    return JsonResponse(data)